@@ -3,17 +3,26 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-import os
+import time
 
 st.set_page_config(layout="wide")
 st.title("Tech Mapping Dashboard")
 
 
 # --- Folder upload for all required CSVs ---
-import zipfile
-import tempfile
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from tessella import heatmap, instrument, progressive, queries, sankey, trends
+from tessella.backends import backend_for
+from tessella.charts import COLOR_SCALES, choropleth_figure, color_sequence, heatmap_figure, sankey_figure, stacked_bar_figure
+from tessella.dataset import load_dataset, dataset_cache
+from tessella.figcache import cached_figure, figure_cache, figure_key
+from tessella.incremental import append_delta
+from tessella.prefetch import Prefetcher
+from tessella.search import CodeSet
+
+# Timing/memory of each stage of this rerun (see tessella.instrument)
+script_ctx = get_script_run_ctx()
+trace = instrument.start(session=script_ctx.session_id if script_ctx else None)
 
 st.sidebar.info(
     """
@@ -23,129 +32,204 @@ Explore interactive scientific keyword mapping, clustering, and visualization.\n
 """
 )
 
-def check_file(file, name):
-    if file is None:
-        missing_files.append(name)
-        return None
-    try:
-        df = pd.read_csv(file)
-        if df.empty:
-            empty_files.append(name)
-        return df
-    except Exception:
-        missing_files.append(name)
-        return None
-def demo_path(filename):
-    return os.path.join(DEMO_DATA_DIR, filename)
-
-def get_csv_from_zip(zip_file, filename):
-    if zip_file is None:
-        # Fallback to demo data
-        try:
-            return open(demo_path(filename), "rb")
-        except Exception:
-            return None
-    with zipfile.ZipFile(zip_file) as z:
-        if filename in z.namelist():
-            return z.open(filename)
-        else:
-            return None
-
 st.sidebar.markdown("### Upload Data Folder (ZIP)")
 # --- Welcome message in sidebar (robust for Streamlit Cloud) ---
 
 uploaded_zip = st.sidebar.file_uploader("Upload a ZIP folder containing all 4 required CSVs", type=["zip"], key="main_zip_uploader")
 
-# --- Demo data fallback logic ---
-DEMO_DATA_DIR = os.path.join(os.path.dirname(__file__), "demo_data")
-def demo_path(filename):
-    return os.path.join(DEMO_DATA_DIR, filename)
-
-def get_csv_from_zip(zip_file, filename):
-    if zip_file is None:
-        # Fallback to demo data
-        try:
-            return open(demo_path(filename), "rb")
-        except Exception:
-            return None
-    with zipfile.ZipFile(zip_file) as z:
-        if filename in z.namelist():
-            return z.open(filename)
-        else:
-            return None
+# --- Load Data ---
+# Parsed and normalized once per distinct ZIP (or the demo_data folder) and
+# shared read-only by every rerun and session; falls back to demo data.
+load_progress = st.sidebar.empty()
+def show_load_progress(filename, fraction):
+    load_progress.progress(fraction, text=f"Reading {filename}…")
+with instrument.stage("load dataset"):
+    dataset = load_dataset(uploaded_zip, progress=show_load_progress)
+load_progress.empty()
+# This session's background precomputation of the other tabs (see tessella.prefetch);
+# jobs still queued wait until this rerun has drawn its chart.
+prefetcher = st.session_state.setdefault("prefetcher", Prefetcher())
+prefetcher.cancel()
+occ = dataset.occ
+coocc = dataset.coocc
+country = dataset.country
+fact_alias_cluster = dataset.fact_alias_cluster
+# Occurrence, CoOccurrence and Geo Map queries: in-memory by default, or SQL over Parquet (TESSELLA_BACKEND)
+backend = backend_for(dataset)
+# Alias/country/cluster x month sums, built once per dataset; every tab
+# queries these instead of filtering and grouping the monthly rows. The SQL
+# backend is for datasets that do not fit in memory, so it never builds
+# them, and the views that need them (cluster grouping, trends, previews,
+# top partners, Heatmap, Sankey) are off.
+cubes = None
+if backend.in_memory:
+    with instrument.stage("build cubes"):
+        cubes = dataset.cubes()
+    # Coarse yearly summaries behind the Occurrence/CoOccurrence previews, built in the background
+    progressive.warm(cubes)
 
 # --- Robust error/warning messages for missing or empty files ---
-missing_files = []
-empty_files = []
-def check_file(file, name):
-    if file is None:
-        missing_files.append(name)
-        return None
-    try:
-        df = pd.read_csv(file)
-        if df.empty:
-            empty_files.append(name)
-        return df
-    except Exception:
-        missing_files.append(name)
-        return None
-
-
-# --- Move get_csv_from_zip definition above all uses ---
-def get_csv_from_zip(zip_file, filename):
-    if zip_file is None:
-        # Fallback to demo data
-        try:
-            return open(demo_path(filename), "rb")
-        except Exception:
-            return None
-    with zipfile.ZipFile(zip_file) as z:
-        if filename in z.namelist():
-            return z.open(filename)
-        else:
-            return None
-
-occ = check_file(get_csv_from_zip(uploaded_zip, "lookup_occurrence.csv"), "lookup_occurrence.csv")
-coocc = check_file(get_csv_from_zip(uploaded_zip, "lookup_cooccurrence.csv"), "lookup_cooccurrence.csv")
-country = check_file(get_csv_from_zip(uploaded_zip, "lookup_country_occurrence.csv"), "lookup_country_occurrence.csv")
-fact_alias_cluster = check_file(get_csv_from_zip(uploaded_zip, "fact_alias_cluster.csv"), "fact_alias_cluster.csv")
-
+missing_files = dataset.missing_files
+empty_files = dataset.empty_files
 if uploaded_zip is not None:
     if missing_files:
         st.sidebar.error(f"Missing or unreadable file(s) in ZIP: {', '.join(missing_files)}. Please check the file names and format.")
     if empty_files:
         st.sidebar.warning(f"Empty file(s) in ZIP: {', '.join(empty_files)}. Charts may not display.")
+    invalid = {filename: report for filename, report in dataset.validation.items() if report["errors"]}
+    if invalid:
+        n_invalid = sum(report["invalid_rows"] for report in invalid.values())
+        st.sidebar.warning(f"{n_invalid} invalid row(s) were skipped while reading the ZIP. See the details below.")
+        with st.sidebar.expander("Invalid rows"):
+            for filename, report in invalid.items():
+                st.markdown(f"**{filename}**: {report['invalid_rows']} of {report['rows']} rows skipped")
+                st.dataframe(pd.DataFrame(report["errors"], columns=["line", "column", "value", "problem"]), hide_index=True)
+
+# --- Monthly updates: append new rows to the loaded dataset without a full rebuild ---
+with st.sidebar.expander("Append monthly update (ZIP)"):
+    delta_zip = st.file_uploader("ZIP with the new rows of any of the 4 CSVs", type=["zip"], key="delta_zip_uploader")
+    if delta_zip is not None and st.button("Apply update", key="apply_delta_button"):
+        try:
+            with instrument.stage("append update"):
+                updated = append_delta(dataset, delta_zip, progress=show_load_progress)
+        except ValueError as e:
+            # The update overlaps months the dataset already has.
+            load_progress.empty()
+            st.error(str(e))
+        else:
+            load_progress.empty()
+            if updated is dataset:
+                st.info("This update has already been applied.")
+            else:
+                st.rerun()
+    if dataset.version > 1:
+        st.caption(f"Dataset version {dataset.version} ({len(dataset.deltas)} update(s) applied).")
 
 
 
 # --- Main Dashboard Tabs (Sidebar tab selector for context-dependent controls) ---
-tab_names = ["Occurrence", "CoOccurrence", "Geo Map", "Sankey"]
+tab_names = ["Occurrence", "CoOccurrence", "Heatmap", "Geo Map", "Sankey"]
 selected_tab = st.sidebar.radio("Select Chart", tab_names, key="main_tab_selector")
+trace.context["tab"] = selected_tab
 
-# --- Load Data ---
+def page_caption(ranked, noun):
+    caption = f"Showing {noun} {ranked.start + 1}–{ranked.start + ranked.n_shown} of {ranked.n_total} (page {ranked.page + 1} of {ranked.n_pages})."
+    if ranked.other_label is not None:
+        caption += " Lower-ranked ones are summed in the \"Other\" bar."
+    return caption
+
+# Search results offered per filter; the rest are reachable by typing more.
+SEARCH_OPTIONS = 50
+FILTER_MODES = ["All", "Only", "All except"]
+
+def search_filter(label, vocab, key, within=None):
+    """Search-as-you-type filter over one vocabulary (alias, country or cluster); returns a CodeSet.
+
+    Only the current search results and the picked names go to the browser,
+    and the queries get codes instead of a list of every selected name.
+    Until a name is picked (or all matches are used), nothing is filtered.
+    """
+    index = backend.name_index(vocab)
+    mode = st.sidebar.radio(label, FILTER_MODES, horizontal=True, key=f"{key}_mode")
+    if mode == "All":
+        return CodeSet.everything()
+    query = st.sidebar.text_input(f"{label}: search", key=f"{key}_search", placeholder="Type part of a name")
+    matches = index.search(query, within)
+    if query.strip() and st.sidebar.checkbox(f"Use all {len(matches)} matches of the search", key=f"{key}_all_matches"):
+        return CodeSet(matches, exclude=mode == "All except")
+    picked = st.session_state.get(f"{key}_picked", [])
+    options = list(dict.fromkeys(picked + index.names[matches[:SEARCH_OPTIONS]].tolist()))
+    picked = st.sidebar.multiselect(f"{label}: {mode.lower()} these", options, key=f"{key}_picked")
+    if len(matches) > SEARCH_OPTIONS:
+        st.sidebar.caption(f"{len(matches)} matches; showing the first {SEARCH_OPTIONS}. Type more to narrow them down.")
+    return CodeSet.picked(backend.codes(vocab, picked), exclude=mode == "All except")
+
+def cluster_grouping(tab_key, rollup, cluster_codes):
+    """Sidebar "Group by" switch; returns ``(by_cluster, drill_cluster)``.
+
+    ``by_cluster`` shows one bar per cluster (or cluster pair) from the
+    precomputed rollup; picking one of ``cluster_codes`` to drill into
+    returns its code and the tab shows that cluster's aliases instead.
+    """
+    if fact_alias_cluster is None or rollup is None:
+        return False, None
+    group_by = st.sidebar.radio("Group by", ["Alias", "Cluster"], horizontal=True, key=f"{tab_key}_group_by")
+    if group_by == "Alias":
+        return False, None
+    drill = st.sidebar.selectbox(
+        "Drill down into cluster", cubes.cluster_names[cluster_codes].tolist(), index=None,
+        placeholder="All clusters (overview)", key=f"{tab_key}_drill_cluster",
+    )
+    if drill is None:
+        return True, None
+    return False, int(cubes.cluster_codes([drill])[0])
+
+# Extra sort options: rank by a trend metric of tessella.trends (computed from the cubes).
+TREND_SORTS = {f"{label} (Descending)": metric for metric, label in trends.METRICS.items()} if backend.supports_trends else {}
+
+def trend_filters(tab_key, noun):
+    """Sidebar "Trend filters" expander; returns ``{metric: minimum}`` (None = no minimum)."""
+    if not backend.supports_trends:
+        return {"growth": None, "ratio": None, "burst": None}
+    with st.sidebar.expander("Trend filters"):
+        st.caption(
+            f"Computed per {trends.BUCKET_MONTHS}-month bucket up to the end of the date range. "
+            f"Growth rate: fitted growth per bucket. Recent vs baseline: mean of the last {trends.RECENT_BUCKETS} "
+            "buckets over the mean before them. Burst score: how far a recent bucket exceeds the baseline, "
+            f"in standard deviations. Leave empty to show all {noun}."
+        )
+        growth = st.number_input("Minimum growth rate (%)", value=None, step=5.0, key=f"{tab_key}_min_growth", placeholder="Off")
+        ratio = st.number_input("Minimum recent vs baseline", min_value=0.0, value=None, step=0.5, key=f"{tab_key}_min_ratio", placeholder="Off")
+        burst = st.number_input("Minimum burst score", value=None, step=1.0, key=f"{tab_key}_min_burst", placeholder="Off")
+    return {"growth": None if growth is None else growth / 100, "ratio": ratio, "burst": burst}
+
+def progressive_chart(preview, preview_key):
+    """Placeholder of a chart computed step by step with tessella.progressive; returns ``(slot, compute)``.
+
+    ``compute(fn)`` runs one step of the exact chart in the background. When
+    a step is slow, the slot shows ``preview()``'s figure (None: no preview
+    for this view), marked as approximate, until the exact chart is drawn in
+    the slot. Changing a control meanwhile stops this rerun and cancels the step.
+    """
+    slot = st.empty()
+    start = time.perf_counter()
+    shown = {}
+    def on_wait(elapsed):
+        if "note" not in shown:
+            shown["note"] = None
+            fig = preview()
+            if fig is not None:
+                with slot.container():
+                    shown["note"] = st.empty()
+                    st.plotly_chart(fig, use_container_width=True, key=preview_key)
+        seconds = time.perf_counter() - start
+        if shown["note"] is None:
+            slot.caption(f"Computing the chart… {seconds:.1f} s")
+        else:
+            shown["note"].caption(
+                f"Approximate preview: yearly totals over whole years, from the {progressive.PREVIEW_TOP} largest "
+                f"entries of the whole dataset. Computing the exact chart… {seconds:.1f} s"
+            )
+    return slot, lambda fn: progressive.compute(fn, on_wait)
 
-# Remove legacy load_csv and old variable assignments
+def bar_preview(kind, date_range, per_page, color_scale, title, value_title, hover_name):
+    """Approximate stacked bars of the largest aliases (or pairs) from tessella.progressive, or None."""
+    if cubes is None:
+        return None
+    page = progressive.preview_page(cubes, kind, date_range, per_page)
+    if page is None:
+        return None
+    label_col, value_col = page.grouped.columns[0], page.grouped.columns[2]
+    min_value, max_value, _ = queries.bar_bounds(page, value_col)
+    return stacked_bar_figure(
+        page.grouped, label_col, value_col, page.labels, color_sequence(color_scale), min_value, max_value,
+        title=f"{title} (approximate preview)", value_title=value_title, hover_name=hover_name,
+    )
 
 def show_global_sidebar(tab_key=None):
     # --- Global Date Range Slider (works for all tabs) ---
-    min_dates = []
-    max_dates = []
-    if occ is not None:
-        occ['month'] = pd.to_datetime(occ['month'], errors='coerce')
-        min_dates.append(occ['month'].min())
-        max_dates.append(occ['month'].max())
-    if coocc is not None and 'month' in coocc.columns:
-        coocc['month'] = pd.to_datetime(coocc['month'], errors='coerce')
-        min_dates.append(coocc['month'].min())
-        max_dates.append(coocc['month'].max())
-    if country is not None and 'month' in country.columns:
-        country['month'] = pd.to_datetime(country['month'], errors='coerce')
-        min_dates.append(country['month'].min())
-        max_dates.append(country['month'].max())
-
-    if min_dates and max_dates:
-        global_min_date = min([d for d in min_dates if pd.notnull(d)]).date()
-        global_max_date = max([d for d in max_dates if pd.notnull(d)]).date()
+    global_min_date, global_max_date = dataset.date_bounds
+    if global_min_date is not None and global_max_date is not None:
         # Allow passing a unique key for each tab
         slider_key = f"date_range_slider_{tab_key}" if tab_key else "global_date_range_slider"
         date_range = st.sidebar.slider(
@@ -159,24 +243,6 @@ def show_global_sidebar(tab_key=None):
     else:
         date_range = (None, None)
     return date_range
-min_dates = []
-max_dates = []
-if occ is not None:
-    occ['month'] = pd.to_datetime(occ['month'], errors='coerce')
-    min_dates.append(occ['month'].min())
-    max_dates.append(occ['month'].max())
-if coocc is not None and 'month' in coocc.columns:
-    coocc['month'] = pd.to_datetime(coocc['month'], errors='coerce')
-    min_dates.append(coocc['month'].min())
-    max_dates.append(coocc['month'].max())
-if country is not None and 'month' in country.columns:
-    country['month'] = pd.to_datetime(country['month'], errors='coerce')
-    min_dates.append(country['month'].min())
-    max_dates.append(country['month'].max())
-
-
-# Remove duplicate global date range slider logic (already handled in show_global_sidebar)
-
 
 
 ## --- Main Dashboard ---
@@ -185,56 +251,70 @@ if country is not None and 'month' in country.columns:
 if selected_tab == "Occurrence":
     date_range = show_global_sidebar(tab_key="occ")
     st.sidebar.header("Customization")
-    color_scale = st.sidebar.selectbox("Color Scale", ["Viridis", "Inferno", "YlGnBu", "Cividis"], key="occ_color_scale")
+    color_scale = st.sidebar.selectbox("Color Scale", COLOR_SCALES, key="occ_color_scale")
     axis_scale = st.sidebar.radio("Axis Scale", ["Linear", "Log"], key="occ_axis_scale")
-    if occ is not None:
+    if backend.has("occ"):
         # --- Occurrence-specific filters ---
-        aliases = sorted(occ['alias'].unique())
-        occ_alias_filter = st.sidebar.multiselect("Filter by Alias", aliases, default=aliases, key="occ_alias_filter")
-        cluster_names = []
-        occ_cluster_filter = []
-        if fact_alias_cluster is not None:
-            cluster_names = sorted(fact_alias_cluster['cluster_name'].unique())
-            occ_cluster_filter = st.sidebar.multiselect("Filter by Cluster", cluster_names, default=cluster_names, key="occ_cluster_filter")
-        # --- Filter occurrence data using the selected filters ---
-        occ_filtered = occ.copy()
-        if occ_alias_filter:
-            occ_filtered = occ_filtered[occ_filtered['alias'].isin(occ_alias_filter)]
-        if fact_alias_cluster is not None and occ_cluster_filter:
-            alias_to_cluster = fact_alias_cluster.set_index('alias')['cluster_name'].to_dict()
-            occ_filtered['cluster_name'] = occ_filtered['alias'].map(alias_to_cluster)
-            occ_filtered = occ_filtered[occ_filtered['cluster_name'].isin(occ_cluster_filter)]
-        # --- Date range filter for occurrence plot ---
-        if 'month' in occ_filtered.columns and date_range[0] is not None and date_range[1] is not None:
-            occ_filtered = occ_filtered[(occ_filtered['month'] >= pd.to_datetime(date_range[0])) & (occ_filtered['month'] <= pd.to_datetime(date_range[1]))]
-        # --- Only plot if data is available ---
-        if not occ_filtered.empty:
-            occ_filtered['year'] = occ_filtered['month'].dt.year
-            grouped = occ_filtered.groupby(['alias', 'year'], as_index=False)['occurrence'].sum()
-            sort_option = st.sidebar.selectbox("Sort Aliases By", ["Total Occurrence (Descending)", "Alias (A-Z)"], key="occ_sort_option")
-            alias_totals = grouped.groupby('alias', as_index=False)['occurrence'].sum()
-            if sort_option == "Total Occurrence (Descending)":
-                sorted_aliases = alias_totals.sort_values('occurrence', ascending=False)['alias'].tolist()[::-1]
-            else:
-                sorted_aliases = sorted(alias_totals['alias'].tolist())[::-1]
-            def truncate_label(label, width=40):
-                return label if len(label) <= width else label[:width] + '...'
-            alias_label_map = {alias: truncate_label(alias) for alias in sorted_aliases}
-            grouped_visible = grouped[grouped['alias'].isin(sorted_aliases)].copy()
-            grouped_visible['alias'] = pd.Categorical(grouped_visible['alias'], categories=sorted_aliases, ordered=True)
-            if not grouped['occurrence'].empty:
-                min_occ = int(grouped['occurrence'].min())
-                max_occ = int(grouped['occurrence'].max())
-            else:
-                min_occ = 0
-                max_occ = 1
-            bar_stacks = grouped_visible.groupby('alias')['occurrence'].sum()
-            if not bar_stacks.empty:
-                min_stack = int(bar_stacks.min())
-                max_stack = int(bar_stacks.max())
+        occ_by_cluster, occ_drill_cluster = cluster_grouping(
+            "occ", cubes.cluster_occ, np.flatnonzero(cubes.cluster_occ.present) if cubes.cluster_occ is not None else [],
+        ) if cubes is not None else (False, None)
+        occ_entity, occ_noun = ("cluster", "clusters") if occ_by_cluster else ("alias", "aliases")
+        occ_alias_filter = CodeSet.everything()
+        occ_cluster_filter = CodeSet.everything()
+        if occ_drill_cluster is not None:
+            # Drill-down: the aliases of one cluster
+            occ_alias_filter = CodeSet(cubes.cluster_aliases(occ_drill_cluster))
+        elif not occ_by_cluster:
+            occ_alias_filter = search_filter("Filter by Alias", "alias", "occ_alias_filter", within=backend.present("occ"))
+        if fact_alias_cluster is not None and occ_drill_cluster is None:
+            occ_cluster_filter = search_filter("Filter by Cluster", "cluster", "occ_cluster_filter")
+        sort_option = st.sidebar.selectbox(
+            "Sort Aliases By", ["Total Occurrence (Descending)", "Alias (A-Z)", *TREND_SORTS], key="occ_sort_option"
+        )
+        occ_min_trend = trend_filters("occ", occ_noun)
+        page_col1, page_col2 = st.sidebar.columns(2)
+        occ_per_page = page_col1.number_input("Aliases per page", min_value=5, max_value=500, value=50, step=5, key="occ_per_page")
+        occ_page = page_col2.number_input("Page", min_value=1, value=1, key="occ_page")
+        # --- Progressive rendering: a quick approximate preview of the default view while the exact page is computed ---
+        occ_previewable = (
+            not occ_by_cluster and occ_drill_cluster is None and occ_alias_filter.is_everything
+            and occ_cluster_filter.is_everything and sort_option == "Total Occurrence (Descending)"
+            and not any(v is not None for v in occ_min_trend.values()) and int(occ_page) == 1
+        )
+        occ_captions = st.container()
+        occ_slot, occ_compute = progressive_chart(
+            lambda: bar_preview(
+                "alias", date_range, int(occ_per_page), color_scale, "Alias Occurrence Over Time (Color by Occurrence)",
+                "Occurrence", "Alias",
+            ) if occ_previewable else None,
+            "occurrence_preview_plot",
+        )
+        # --- Alias (or cluster) x year sums for one page of ranked bars; lower ranks are summed into "Other" ---
+        with instrument.stage("query"):
+            if occ_by_cluster:
+                ranked = occ_compute(lambda: queries.cluster_occurrence_page(
+                    cubes, date_range, occ_cluster_filter,
+                    by_total=sort_option == "Total Occurrence (Descending)",
+                    per_page=int(occ_per_page), page=int(occ_page) - 1,
+                    rank_by=TREND_SORTS.get(sort_option), min_trend=occ_min_trend,
+                ))
             else:
-                min_stack = 0
-                max_stack = 1
+                ranked = occ_compute(lambda: backend.occurrence_page(
+                    date_range, occ_alias_filter, occ_cluster_filter,
+                    by_total=sort_option == "Total Occurrence (Descending)",
+                    per_page=int(occ_per_page), page=int(occ_page) - 1,
+                    rank_by=TREND_SORTS.get(sort_option), min_trend=occ_min_trend,
+                ))
+        grouped = ranked.grouped
+        # --- Only plot if data is available ---
+        if not grouped.empty:
+            sorted_aliases = ranked.labels
+            grouped_visible = grouped
+            if occ_drill_cluster is not None:
+                occ_captions.caption(f"Aliases of cluster {cubes.cluster_names[occ_drill_cluster]}.")
+            occ_captions.caption(page_caption(ranked, occ_noun))
+            # Color bounds come from the real aliases, not the "Other" sum
+            min_occ, max_occ, max_stack = queries.bar_bounds(ranked, 'occurrence')
             col1, col2 = st.sidebar.columns(2)
             occ_color_min = col1.number_input("Occurrence Color Min", min_value=0, max_value=max_occ, value=min_occ, key="occ_color_min")
             occ_color_max = col2.number_input("Occurrence Color Max", min_value=0, max_value=max_occ, value=max_occ, key="occ_color_max")
@@ -244,145 +324,114 @@ if selected_tab == "Occurrence":
             )
             # Always set xaxis_min to 0, only xaxis_max is user-editable
             xaxis_min, xaxis_max = occ_xaxis_min, occ_xaxis_max
-            color_seq = getattr(px.colors.sequential, color_scale) if hasattr(px.colors.sequential, color_scale) else px.colors.sequential.Viridis
-            import plotly.graph_objects as go
-            years = sorted(grouped_visible['year'].unique())
-            fig = go.Figure()
-            for year in years:
-                year_data = grouped_visible[grouped_visible['year'] == year]
-                norm_occ = (year_data['occurrence'] - occ_color_min) / max(1, (occ_color_max - occ_color_min))
-                norm_occ = norm_occ.clip(0, 1)
-                colors = [px.colors.sample_colorscale(color_seq, [v])[0] for v in norm_occ]
-                y_labels = [alias_label_map.get(a, a) for a in year_data['alias']]
-                hover_labels = year_data['alias']
-                fig.add_trace(go.Bar(
-                    x=year_data['occurrence'],
-                    y=y_labels,
-                    orientation='h',
-                    name=str(year),
-                    marker=dict(color=colors, showscale=False),
-                    showlegend=False,
-                    hovertemplate='Alias: %{customdata}<br>Year: '+str(year)+'<br>Occurrence: %{x}<extra></extra>',
-                    customdata=hover_labels
-                ))
-            import numpy as np
-            colorbar_vals = np.linspace(occ_color_min, occ_color_max, num=100)
-            fig.add_trace(go.Scatter(
-                x=[None]*len(colorbar_vals),
-                y=[None]*len(colorbar_vals),
-                mode='markers',
-                marker=dict(
-                    colorscale=color_seq,
-                    cmin=occ_color_min,
-                    cmax=occ_color_max,
-                    color=colorbar_vals,
-                    colorbar=dict(
-                        title="Occurrence",
-                        tickvals=[occ_color_min, occ_color_max],
-                        ticktext=[str(occ_color_min), str(occ_color_max)],
-                        lenmode='pixels',
-                        len=200
-                    ),
-                    showscale=True,
-                    size=0.1
-                ),
-                hoverinfo='none',
-                showlegend=False
-            ))
-            # Remove redefinition of bar_stacks, min_stack, max_stack, and xaxis_min/xaxis_max here
-            fig.update_layout(
-                barmode='stack',
-                title="Alias Occurrence Over Time (Color by Occurrence)",
-                xaxis_title="Occurrence",
-                yaxis_title=None,
-                legend=dict(title="", itemsizing='constant', traceorder='normal', tracegroupgap=0, borderwidth=0, bgcolor='rgba(0,0,0,0)'),
-                height=max(400, len(sorted_aliases) * 30 + 200),
-                width=3600,
-                margin=dict(l=40, r=40, t=100, b=40)
+            def build_occurrence_figure():
+                fig = stacked_bar_figure(
+                    grouped_visible, occ_entity, 'occurrence', sorted_aliases,
+                    color_sequence(color_scale), occ_color_min, occ_color_max,
+                    title=f"{occ_entity.title()} Occurrence Over Time (Color by Occurrence)",
+                    value_title="Occurrence",
+                    hover_name=occ_entity.title(),
+                )
+                fig.update_xaxes(range=[xaxis_min, xaxis_max])
+                if axis_scale == "Log":
+                    fig.update_xaxes(type="log")
+                return fig
+            # Built once per distinct view on this server, then read back from the figure cache
+            fig_key = figure_key(
+                dataset, "Occurrence", date_range=date_range, group_by=occ_entity,
+                aliases=occ_alias_filter.key(), clusters=occ_cluster_filter.key(),
+                sort=sort_option, min_trend=occ_min_trend, per_page=occ_per_page, page=occ_page, color_scale=color_scale,
+                color_bounds=(occ_color_min, occ_color_max), x_range=(xaxis_min, xaxis_max), axis_scale=axis_scale,
             )
-            fig.update_xaxes(range=[xaxis_min, xaxis_max])
-            fig.update_yaxes(categoryorder='array', categoryarray=[alias_label_map[a] for a in sorted_aliases])
-            if axis_scale == "Log":
-                fig.update_xaxes(type="log")
-            st.plotly_chart(fig, use_container_width=True, key="occurrence_plot")
+            with instrument.stage("figure"):
+                fig = occ_compute(lambda: cached_figure(fig_key, build_occurrence_figure))
+            with instrument.stage("render (st.plotly_chart)"):
+                occ_slot.plotly_chart(fig, use_container_width=True, key="occurrence_plot")
         else:
-            st.warning("No occurrence data available for the selected date range or filters. Try adjusting the date range, alias, or cluster filters, or check your input file.")
+            occ_slot.warning("No occurrence data available for the selected date range or filters. Try adjusting the date range, alias, or cluster filters, or check your input file.")
 
 elif selected_tab == "CoOccurrence":
     date_range = show_global_sidebar(tab_key="coocc")
     st.sidebar.header("Customization")
-    color_scale = st.sidebar.selectbox("Color Scale", ["Viridis", "Inferno", "YlGnBu", "Cividis"], key="coocc_color_scale")
+    color_scale = st.sidebar.selectbox("Color Scale", COLOR_SCALES, key="coocc_color_scale")
     axis_scale = st.sidebar.radio("Axis Scale", ["Linear", "Log"], key="coocc_axis_scale")
-    if coocc is not None:
+    if backend.has("coocc"):
         # --- Cooccurrence-specific filters in sidebar (separate for alias 1 and alias 2) ---
-        coocc_aliases_1 = sorted(coocc['alias_row'].unique())
-        coocc_aliases_2 = sorted(coocc['alias_col'].unique())
-        coocc_alias1_filter = st.sidebar.multiselect("Cooccurrence: Filter by Alias 1 (alias_row)", coocc_aliases_1, default=coocc_aliases_1, key="coocc_alias1_filter")
-        coocc_alias2_filter = st.sidebar.multiselect("Cooccurrence: Filter by Alias 2 (alias_col)", coocc_aliases_2, default=coocc_aliases_2, key="coocc_alias2_filter")
-        coocc_cluster_names_1 = []
-        coocc_cluster_names_2 = []
-        coocc_cluster1_filter = []
-        coocc_cluster2_filter = []
-        if fact_alias_cluster is not None:
-            coocc_cluster_names_1 = sorted(fact_alias_cluster.set_index('alias').loc[coocc_aliases_1]['cluster_name'].unique())
-            coocc_cluster_names_2 = sorted(fact_alias_cluster.set_index('alias').loc[coocc_aliases_2]['cluster_name'].unique())
-            coocc_cluster1_filter = st.sidebar.multiselect("Cooccurrence: Filter by Cluster 1 (alias_row)", coocc_cluster_names_1, default=coocc_cluster_names_1, key="coocc_cluster1_filter")
-            coocc_cluster2_filter = st.sidebar.multiselect("Cooccurrence: Filter by Cluster 2 (alias_col)", coocc_cluster_names_2, default=coocc_cluster_names_2, key="coocc_cluster2_filter")
-        # --- Filtering for cooccurrence: by date, alias, and cluster (for both aliases separately) ---
-        df = coocc[
-            (coocc['month'] >= pd.to_datetime(date_range[0])) &
-            (coocc['month'] <= pd.to_datetime(date_range[1]))
-        ].copy()
-        # Filter for alias_row and alias_col separately
-        if coocc_alias1_filter:
-            df = df[df['alias_row'].isin(coocc_alias1_filter)]
-        if coocc_alias2_filter:
-            df = df[df['alias_col'].isin(coocc_alias2_filter)]
-        # Filter for clusters separately
-        if fact_alias_cluster is not None and (coocc_cluster1_filter or coocc_cluster2_filter):
-            alias_to_cluster = fact_alias_cluster.set_index('alias')['cluster_name'].to_dict()
-            df['cluster_row'] = df['alias_row'].map(alias_to_cluster)
-            df['cluster_col'] = df['alias_col'].map(alias_to_cluster)
-            if coocc_cluster1_filter:
-                df = df[df['cluster_row'].isin(coocc_cluster1_filter)]
-            if coocc_cluster2_filter:
-                df = df[df['cluster_col'].isin(coocc_cluster2_filter)]
-        # --- Date range filter for cooccurrence plot ---
-        if 'month' in df.columns and date_range[0] is not None and date_range[1] is not None:
-            df = df[(df['month'] >= pd.to_datetime(date_range[0])) & (df['month'] <= pd.to_datetime(date_range[1]))]
-        # --- Only plot if data is available ---
-        if not df.empty:
-            df['combo'] = df['alias_row'] + " & " + df['alias_col']
-            df['year'] = df['month'].dt.year
-            grouped = df.groupby(['combo', 'year'], as_index=False)['cooccurrence'].sum()
-            sort_option = st.sidebar.selectbox(
-                "Sort Combos By",
-                ["Total Cooccurrence (Descending)", "Combo (A-Z)"],
-                key="coocc_sort_option"
-            )
-            combo_totals = grouped.groupby('combo', as_index=False)['cooccurrence'].sum()
-            if sort_option == "Total Cooccurrence (Descending)":
-                sorted_combos = combo_totals.sort_values('cooccurrence', ascending=False)['combo'].tolist()[::-1]
-            else:
-                sorted_combos = sorted(combo_totals['combo'].tolist())[::-1]
-            def truncate_combo(label, width=40):
-                return label if len(label) <= width else label[:width] + '...'
-            combo_label_map = {combo: truncate_combo(combo) for combo in sorted_combos}
-            grouped_visible = grouped[grouped['combo'].isin(sorted_combos)].copy()
-            grouped_visible['combo'] = pd.Categorical(grouped_visible['combo'], categories=sorted_combos, ordered=True)
-            if not grouped['cooccurrence'].empty:
-                min_coocc = int(grouped['cooccurrence'].min())
-                max_coocc = int(grouped['cooccurrence'].max())
-            else:
-                min_coocc = 0
-                max_coocc = 1
-            bar_stacks = grouped_visible.groupby('combo')['cooccurrence'].sum()
-            if not bar_stacks.empty:
-                min_stack = int(bar_stacks.min())
-                max_stack = int(bar_stacks.max())
+        # Pairs are unordered, so both sides offer the same aliases and clusters
+        coocc_by_cluster, coocc_drill_cluster = cluster_grouping(
+            "coocc", cubes.cluster_coocc, cubes.cluster_coocc.aliases() if cubes.cluster_coocc is not None else [],
+        ) if cubes is not None else (False, None)
+        coocc_alias_mask = backend.present("coocc")
+        coocc_alias1_filter = CodeSet.everything()
+        coocc_alias2_filter = CodeSet.everything()
+        if coocc_drill_cluster is not None:
+            # Drill-down: pairs with alias 1 in one cluster
+            coocc_alias1_filter = CodeSet(cubes.cluster_aliases(coocc_drill_cluster))
+        elif not coocc_by_cluster:
+            coocc_alias1_filter = search_filter("Cooccurrence: Filter by Alias 1", "alias", "coocc_alias1_filter", within=coocc_alias_mask)
+        if not coocc_by_cluster:
+            coocc_alias2_filter = search_filter("Cooccurrence: Filter by Alias 2", "alias", "coocc_alias2_filter", within=coocc_alias_mask)
+        coocc_cluster1_filter = CodeSet.everything()
+        coocc_cluster2_filter = CodeSet.everything()
+        if fact_alias_cluster is not None and coocc_drill_cluster is None:
+            coocc_cluster_mask = None
+            if cubes is not None:
+                coocc_cluster_mask = np.zeros(len(cubes.cluster_names), dtype=bool)
+                coocc_cluster_mask[cubes.cluster_codes(queries.cooccurrence_clusters(cubes))] = True
+            coocc_cluster1_filter = search_filter("Cooccurrence: Filter by Cluster 1", "cluster", "coocc_cluster1_filter", within=coocc_cluster_mask)
+            coocc_cluster2_filter = search_filter("Cooccurrence: Filter by Cluster 2", "cluster", "coocc_cluster2_filter", within=coocc_cluster_mask)
+        sort_option = st.sidebar.selectbox(
+            "Sort Combos By",
+            ["Total Cooccurrence (Descending)", "Combo (A-Z)", *TREND_SORTS],
+            key="coocc_sort_option"
+        )
+        coocc_min_trend = trend_filters("coocc", "cluster pairs" if coocc_by_cluster else "combos")
+        page_col1, page_col2 = st.sidebar.columns(2)
+        coocc_per_page = page_col1.number_input("Combos per page", min_value=5, max_value=500, value=50, step=5, key="coocc_per_page")
+        coocc_page = page_col2.number_input("Page", min_value=1, value=1, key="coocc_page")
+        # --- Progressive rendering: a quick approximate preview of the default view while the exact page is computed ---
+        coocc_previewable = (
+            not coocc_by_cluster and coocc_drill_cluster is None
+            and all(f.is_everything for f in (coocc_alias1_filter, coocc_alias2_filter, coocc_cluster1_filter, coocc_cluster2_filter))
+            and sort_option == "Total Cooccurrence (Descending)"
+            and not any(v is not None for v in coocc_min_trend.values()) and int(coocc_page) == 1
+        )
+        coocc_captions = st.container()
+        coocc_slot, coocc_compute = progressive_chart(
+            lambda: bar_preview(
+                "pair", date_range, int(coocc_per_page), color_scale, "Alias Co-Occurrence Over Time (Color by Cooccurrence)",
+                "Cooccurrence", "Combo",
+            ) if coocc_previewable else None,
+            "cooccurrence_preview_plot",
+        )
+        # --- Combo x year sums by date, alias, and cluster for one page of ranked combos ---
+        with instrument.stage("query"):
+            if coocc_by_cluster:
+                ranked = coocc_compute(lambda: queries.cluster_cooccurrence_page(
+                    cubes, date_range, coocc_cluster1_filter, coocc_cluster2_filter,
+                    by_total=sort_option == "Total Cooccurrence (Descending)",
+                    per_page=int(coocc_per_page), page=int(coocc_page) - 1,
+                    rank_by=TREND_SORTS.get(sort_option), min_trend=coocc_min_trend,
+                ))
             else:
-                min_stack = 0
-                max_stack = 1
+                ranked = coocc_compute(lambda: backend.cooccurrence_page(
+                    date_range,
+                    coocc_alias1_filter, coocc_alias2_filter,
+                    coocc_cluster1_filter, coocc_cluster2_filter,
+                    by_total=sort_option == "Total Cooccurrence (Descending)",
+                    per_page=int(coocc_per_page), page=int(coocc_page) - 1,
+                    rank_by=TREND_SORTS.get(sort_option), min_trend=coocc_min_trend,
+                ))
+        grouped = ranked.grouped
+        # --- Only plot if data is available ---
+        if not grouped.empty:
+            sorted_combos = ranked.labels
+            grouped_visible = grouped
+            if coocc_drill_cluster is not None:
+                coocc_captions.caption(f"Pairs with an alias of cluster {cubes.cluster_names[coocc_drill_cluster]} first.")
+            coocc_captions.caption(page_caption(ranked, "cluster pairs" if coocc_by_cluster else "combos"))
+            # Color bounds come from the real combos, not the "Other" sum
+            min_coocc, max_coocc, max_stack = queries.bar_bounds(ranked, 'cooccurrence')
             col1, col2 = st.sidebar.columns(2)
             coocc_color_min = col1.number_input("Cooccurrence Color Min", min_value=0, max_value=max_coocc, value=min_coocc, key="coocc_color_min")
             coocc_color_max = col2.number_input("Cooccurrence Color Max", min_value=0, max_value=max_coocc, value=max_coocc, key="coocc_color_max")
@@ -391,193 +440,204 @@ elif selected_tab == "CoOccurrence":
                 "Cooccurrence X-Axis Max", min_value=1, max_value=int(max_stack*1.1), value=int(max_stack*1.05), key="coocc_xaxis_max"
             )
             xaxis_min, xaxis_max = coocc_xaxis_min, coocc_xaxis_max
-            color_seq = getattr(px.colors.sequential, color_scale) if hasattr(px.colors.sequential, color_scale) else px.colors.sequential.Viridis
-            import plotly.graph_objects as go
-            years = sorted(grouped_visible['year'].unique())
-            fig = go.Figure()
-            for year in years:
-                year_data = grouped_visible[grouped_visible['year'] == year]
-                norm_coocc = (year_data['cooccurrence'] - coocc_color_min) / max(1, (coocc_color_max - coocc_color_min))
-                norm_coocc = norm_coocc.clip(0, 1)
-                colors = [px.colors.sample_colorscale(color_seq, [v])[0] for v in norm_coocc]
-                y_labels = [combo_label_map.get(c, c) for c in year_data['combo']]
-                hover_labels = year_data['combo']
-                fig.add_trace(go.Bar(
-                    x=year_data['cooccurrence'],
-                    y=y_labels,
-                    orientation='h',
-                    name=str(year),
-                    marker=dict(color=colors, showscale=False),
-                    showlegend=False,
-                    hovertemplate='Combo: %{customdata}<br>Year: '+str(year)+'<br>Cooccurrence: %{x}<extra></extra>',
-                    customdata=hover_labels
-                ))
-            import numpy as np
-            colorbar_vals = np.linspace(coocc_color_min, coocc_color_max, num=100)
-            fig.add_trace(go.Scatter(
-                x=[None]*len(colorbar_vals),
-                y=[None]*len(colorbar_vals),
-                mode='markers',
-                marker=dict(
-                    colorscale=color_seq,
-                    cmin=coocc_color_min,
-                    cmax=coocc_color_max,
-                    color=colorbar_vals,
-                    colorbar=dict(
-                        title="Cooccurrence",
-                        tickvals=[coocc_color_min, coocc_color_max],
-                        ticktext=[str(coocc_color_min), str(coocc_color_max)],
-                        lenmode='pixels',
-                        len=200
-                    ),
-                    showscale=True,
-                    size=0.1
-                ),
-                hoverinfo='none',
-                showlegend=False
-            ))
-            bar_stacks = grouped_visible.groupby('combo')['cooccurrence'].sum()
-            max_stack = bar_stacks.max()
-            min_stack = bar_stacks.min()
-            xaxis_min, xaxis_max = coocc_xaxis_min, coocc_xaxis_max
-            fig.update_layout(
-                barmode='stack',
-                title="Alias Co-Occurrence Over Time (Color by Cooccurrence)",
-                xaxis_title="Cooccurrence",
-                yaxis_title=None,
-                legend=dict(title="", itemsizing='constant', traceorder='normal', tracegroupgap=0, borderwidth=0, bgcolor='rgba(0,0,0,0)'),
-                height=max(400, len(sorted_combos) * 30 + 200),
-                width=3600,
-                margin=dict(l=40, r=40, t=100, b=40)
+            def build_cooccurrence_figure():
+                fig = stacked_bar_figure(
+                    grouped_visible, 'combo', 'cooccurrence', sorted_combos,
+                    color_sequence(color_scale), coocc_color_min, coocc_color_max,
+                    title=f"{'Cluster' if coocc_by_cluster else 'Alias'} Co-Occurrence Over Time (Color by Cooccurrence)",
+                    value_title="Cooccurrence",
+                    hover_name="Cluster pair" if coocc_by_cluster else "Combo",
+                )
+                fig.update_xaxes(range=[xaxis_min, xaxis_max])
+                if axis_scale == "Log":
+                    fig.update_xaxes(type="log")
+                return fig
+            fig_key = figure_key(
+                dataset, "CoOccurrence", date_range=date_range, by_cluster=coocc_by_cluster,
+                aliases=(coocc_alias1_filter.key(), coocc_alias2_filter.key()),
+                clusters=(coocc_cluster1_filter.key(), coocc_cluster2_filter.key()),
+                sort=sort_option, min_trend=coocc_min_trend, per_page=coocc_per_page, page=coocc_page, color_scale=color_scale,
+                color_bounds=(coocc_color_min, coocc_color_max), x_range=(xaxis_min, xaxis_max), axis_scale=axis_scale,
+            )
+            with instrument.stage("figure"):
+                fig = coocc_compute(lambda: cached_figure(fig_key, build_cooccurrence_figure))
+            with instrument.stage("render (st.plotly_chart)"):
+                coocc_slot.plotly_chart(fig, use_container_width=True, key="cooccurrence_plot")
+        else:
+            coocc_slot.warning("No co-occurrence data available for the selected date range or filters. Try adjusting the date range, alias, or cluster filters, or check your input file.")
+        # --- Strongest partners of one alias in the selected date range ---
+        with st.expander("Strongest co-occurring partners"):
+            if cubes is None:
+                st.caption("Not available with the SQL backend (TESSELLA_BACKEND=duckdb).")
+            else:
+                partner_col1, partner_col2 = st.columns([3, 1])
+                partner_query = partner_col1.text_input("Search alias", key="coocc_partner_search", placeholder="Type part of a name")
+                partner_options = cubes.alias_names[cubes.name_index("alias").search(partner_query, coocc_alias_mask)[:SEARCH_OPTIONS]].tolist()
+                partner_alias = partner_col1.selectbox("Alias", partner_options, index=None, placeholder="Choose an alias", key="coocc_partner_alias")
+                partner_k = partner_col2.number_input("Top", min_value=1, max_value=100, value=10, key="coocc_partner_k")
+                if partner_alias is not None:
+                    st.dataframe(queries.top_partners(cubes, partner_alias, date_range, int(partner_k)), hide_index=True, use_container_width=True)
+
+elif selected_tab == "Heatmap":
+    date_range = show_global_sidebar(tab_key="heatmap")
+    st.sidebar.header("Customization")
+    color_scale = st.sidebar.selectbox("Color Scale", COLOR_SCALES, key="heatmap_color_scale")
+    axis_scale = st.sidebar.radio("Color Scale Type", ["Linear", "Log"], key="heatmap_axis_scale")
+    if cubes is None:
+        st.info("The Heatmap is not available with the SQL backend (TESSELLA_BACKEND=duckdb), which does not build the in-memory cubes.")
+    elif cubes.coocc is not None:
+        heatmap_bins = st.sidebar.number_input(
+            "Cells per side", min_value=20, max_value=500, value=min(heatmap.HEATMAP_BINS, 500), step=20, key="heatmap_bins"
+        )
+        # --- Cluster x cluster overview, or the alias x alias block of a row and a column cluster ---
+        heatmap_rows = heatmap_cols = None
+        heatmap_level = "alias"
+        if cubes.cluster_coocc is not None:
+            heatmap_level = st.sidebar.radio("Heatmap of", ["Clusters", "Aliases"], horizontal=True, key="heatmap_level")
+            heatmap_level = "cluster" if heatmap_level == "Clusters" else "alias"
+            block_clusters = cubes.cluster_names[cubes.cluster_coocc.aliases()].tolist()
+            heatmap_row_cluster = st.sidebar.selectbox(
+                "Drill down: row cluster", block_clusters, index=None, placeholder="All", key="heatmap_row_cluster"
+            )
+            heatmap_col_cluster = st.sidebar.selectbox(
+                "Drill down: column cluster", block_clusters, index=None, placeholder="All", key="heatmap_col_cluster"
+            )
+            if heatmap_row_cluster is not None or heatmap_col_cluster is not None:
+                # A block is always shown alias by alias
+                heatmap_level = "alias"
+                if heatmap_row_cluster is not None:
+                    heatmap_rows = cubes.cluster_aliases(cubes.cluster_codes([heatmap_row_cluster])[0])
+                if heatmap_col_cluster is not None:
+                    heatmap_cols = cubes.cluster_aliases(cubes.cluster_codes([heatmap_col_cluster])[0])
+        else:
+            heatmap_row_cluster = heatmap_col_cluster = None
+        heatmap_noun = "clusters" if heatmap_level == "cluster" else "aliases"
+        n_entities = len(cubes.cluster_names) if heatmap_level == "cluster" else len(cubes.alias_names)
+        heatmap_zoom = []
+        # --- Zoom into a range of rows/columns; it is binned again at the same resolution ---
+        for axis_name, entities, cluster in (("Rows", heatmap_rows, heatmap_row_cluster), ("Columns", heatmap_cols, heatmap_col_cluster)):
+            n = n_entities if entities is None else len(entities)
+            if n > heatmap_bins:
+                zoom = st.sidebar.slider(
+                    f"Zoom: {axis_name.lower()} (positions in cluster order)", min_value=1, max_value=n, value=(1, n),
+                    key=f"heatmap_zoom_{axis_name.lower()}_{heatmap_level}_{cluster}",
+                )
+                heatmap_zoom.append((zoom[0] - 1, zoom[1]))
+            else:
+                heatmap_zoom.append(None)
+        with instrument.stage("query"):
+            grid = heatmap.build_heatmap(
+                cubes, date_range, heatmap_level, heatmap_rows, heatmap_cols, *heatmap_zoom, bins=int(heatmap_bins),
+            )
+        if not grid.empty:
+            row_size, col_size = grid.cell_size
+            st.caption(
+                f"{len(grid.row_labels)} x {len(grid.col_labels)} cells over {heatmap_noun} in cluster order. "
+                + (f"Each cell sums up to {row_size} x {col_size} {heatmap_noun}; zoom in or drill down for detail."
+                   if max(row_size, col_size) > 1 else "One cell per pair.")
             )
-            fig.update_xaxes(range=[xaxis_min, xaxis_max])
-            fig.update_yaxes(categoryorder='array', categoryarray=[combo_label_map[c] for c in sorted_combos])
-            if axis_scale == "Log":
-                fig.update_xaxes(type="log")
-            st.plotly_chart(fig, use_container_width=True, key="cooccurrence_plot")
+            title = f"{'Cluster' if heatmap_level == 'cluster' else 'Alias'} Co-Occurrence Heatmap"
+            fig_key = figure_key(
+                dataset, "Heatmap", date_range=date_range, level=heatmap_level,
+                block=(heatmap_row_cluster, heatmap_col_cluster), zoom=heatmap_zoom, bins=heatmap_bins,
+                color_scale=color_scale, axis_scale=axis_scale,
+            )
+            with instrument.stage("figure"):
+                fig = cached_figure(fig_key, lambda: heatmap_figure(grid, color_sequence(color_scale), title, log=axis_scale == "Log"))
+            with instrument.stage("render (st.plotly_chart)"):
+                st.plotly_chart(fig, use_container_width=True, key="heatmap_plot")
         else:
-            st.warning("No co-occurrence data available for the selected date range or filters. Try adjusting the date range, alias, or cluster filters, or check your input file.")
+            st.warning("No co-occurrence data available for the selected date range or block. Try adjusting the date range or the drill-down clusters.")
 
 elif selected_tab == "Geo Map":
     date_range = show_global_sidebar(tab_key="geo")
     st.sidebar.header("Customization")
-    color_scale = st.sidebar.selectbox("Color Scale", ["Viridis", "Inferno", "YlGnBu", "Cividis"], key="geo_color_scale")
+    color_scale = st.sidebar.selectbox("Color Scale", COLOR_SCALES, key="geo_color_scale")
     axis_scale = st.sidebar.radio("Axis Scale", ["Linear", "Log"], key="geo_axis_scale")
-    if country is not None:
+    if backend.has("country"):
         # Sidebar filter for countries
-        all_countries = sorted(country['country'].dropna().unique())
-        country_filter = st.sidebar.multiselect("Filter by Country", all_countries, default=all_countries, key="geo_country_filter")
-        # Aggregate by country and year for correct coloring
-        df = country[
-            (country['month'] >= pd.to_datetime(date_range[0])) &
-            (country['month'] <= pd.to_datetime(date_range[1]))
-        ].copy()
-        if country_filter:
-            df = df[df['country'].isin(country_filter)]
-        if not df.empty:
-            df['year'] = df['month'].dt.year
-            # Drop NaN years and convert to int
-            df = df.dropna(subset=['year'])
-            df['year'] = df['year'].astype(int)
-            agg = df.groupby(['country', 'year'], as_index=False)['occurrence'].sum()
-            # Remove duplicate country/year rows (shouldn't exist, but just in case)
-            agg = agg.drop_duplicates(subset=['country', 'year'])
-            # Sort by year for clean animation
-            agg = agg.sort_values('year')
-            if not agg.empty:
-                min_geo = int(agg['occurrence'].min())
-                max_geo = int(agg['occurrence'].max())
-                col1, col2 = st.sidebar.columns(2)
-                geo_color_min = col1.number_input("Geo Color Min", min_value=0, max_value=max_geo, value=min_geo, key="geo_color_min")
-                geo_color_max = col2.number_input("Geo Color Max", min_value=0, max_value=max_geo, value=max_geo, key="geo_color_max")
-                geo_color_seq = getattr(px.colors.sequential, color_scale) if hasattr(px.colors.sequential, color_scale) else px.colors.sequential.Viridis
-                # Use ISO-3 codes for locations to ensure all countries are mapped
-                import pycountry
-                def get_iso3(country_name):
-                    try:
-                        return pycountry.countries.lookup(country_name).alpha_3
-                    except Exception:
-                        return None
-                agg['iso_alpha'] = agg['country'].apply(get_iso3)
-                agg = agg.dropna(subset=['iso_alpha'])
-                fig = px.choropleth(
-                    agg,
-                    locations="iso_alpha",
-                    color="occurrence",
-                    hover_name="country",
-                    animation_frame="year",
-                    color_continuous_scale=geo_color_seq,
-                    range_color=(geo_color_min, geo_color_max),
-                    title="Geographic Occurrence Heatmap"
-                )
+        country_filter = search_filter("Filter by Country", "country", "geo_country_filter", within=backend.present("country"))
+        # Aggregate by country and year for correct coloring, sorted by year for clean animation
+        with instrument.stage("query"):
+            agg = backend.country_by_year(date_range, country_filter)
+        if not agg.empty:
+            min_geo = int(agg['occurrence'].min())
+            max_geo = int(agg['occurrence'].max())
+            col1, col2 = st.sidebar.columns(2)
+            geo_color_min = col1.number_input("Geo Color Min", min_value=0, max_value=max_geo, value=min_geo, key="geo_color_min")
+            geo_color_max = col2.number_input("Geo Color Max", min_value=0, max_value=max_geo, value=max_geo, key="geo_color_max")
+            geo_color_seq = color_sequence(color_scale)
+            # ISO-3 codes were resolved once per dataset; report the names that could not be mapped
+            unresolved = sorted(set(agg.loc[agg['iso_alpha'].isna(), 'country']))
+            if unresolved:
+                st.caption(f"Not shown on the map (no ISO-3 code for the country name): {', '.join(unresolved)}")
+            fig_key = figure_key(
+                dataset, "Geo Map", date_range=date_range, countries=country_filter.key(), color_scale=color_scale,
+                color_bounds=(geo_color_min, geo_color_max),
+            )
+            with instrument.stage("figure"):
+                fig = cached_figure(fig_key, lambda: choropleth_figure(agg, geo_color_seq, geo_color_min, geo_color_max))
+            with instrument.stage("render (st.plotly_chart)"):
                 st.plotly_chart(fig, use_container_width=True, key="geo_map_plot")
-            else:
-                st.warning("No aggregated data available for the selected date range. Try adjusting filters or check your input file.")
         else:
             st.warning("No country data available for the selected date range. Try adjusting filters or check your input file.")
 
 elif selected_tab == "Sankey":
     date_range = show_global_sidebar(tab_key="sankey")
     st.sidebar.header("Customization")
-    color_scale = st.sidebar.selectbox("Color Scale", ["Viridis", "Inferno", "YlGnBu", "Cividis"], key="sankey_color_scale")
+    color_scale = st.sidebar.selectbox("Color Scale", COLOR_SCALES, key="sankey_color_scale")
     axis_scale = st.sidebar.radio("Axis Scale", ["Linear", "Log"], key="sankey_axis_scale")
-    if coocc is not None and fact_alias_cluster is not None:
-        if country is not None:
+    if cubes is None:
+        st.info("The Sankey is not available with the SQL backend (TESSELLA_BACKEND=duckdb), which does not build the in-memory cubes.")
+    elif coocc is not None and fact_alias_cluster is not None:
+        if cubes.country_cluster is not None:
             # Sidebar filters for Sankey
-            all_countries = sorted(country['country'].dropna().unique())
-            # Compute top 5 countries by total occurrence for default
-            top5_countries = []
-            if not country.empty:
-                country_totals = country.groupby('country')['occurrence'].sum().sort_values(ascending=False)
-                top5_countries = country_totals.head(5).index.tolist()
-            else:
-                top5_countries = all_countries[:5]
+            all_countries = queries.countries(cubes)
+            # Top 5 countries and clusters by total occurrence for default
+            top5_countries = queries.top_countries(cubes, 5)
             country_filter = st.sidebar.multiselect("Sankey: Filter by Country", all_countries, default=top5_countries, key="sankey_country_filter")
-            all_clusters = []
-            top5_clusters = []
-            if fact_alias_cluster is not None:
-                all_clusters = sorted(fact_alias_cluster['cluster_name'].dropna().unique())
-                # Compute top 5 clusters by total occurrence for default
-                if not country.empty:
-                    geo_df_tmp = country.merge(fact_alias_cluster[['alias', 'cluster_name']], left_on='alias', right_on='alias', how='left')
-                    cluster_totals = geo_df_tmp.groupby('cluster_name')['occurrence'].sum().sort_values(ascending=False)
-                    top5_clusters = cluster_totals.head(5).index.tolist()
-                else:
-                    top5_clusters = all_clusters[:5]
+            all_clusters = cubes.cluster_names.tolist()
+            top5_clusters = queries.top_clusters(cubes, 5)
             cluster_filter = st.sidebar.multiselect("Sankey: Filter by Cluster Name", all_clusters, default=top5_clusters, key="sankey_cluster_filter")
-            geo_df = country.merge(fact_alias_cluster[['alias', 'cluster_name']], left_on='alias', right_on='alias', how='left')
-            geo_df = geo_df[(geo_df['month'] >= pd.to_datetime(date_range[0])) & (geo_df['month'] <= pd.to_datetime(date_range[1]))].copy()
-            # Apply country and cluster filters
-            if country_filter:
-                geo_df = geo_df[geo_df['country'].isin(country_filter)]
-            if cluster_filter:
-                geo_df = geo_df[geo_df['cluster_name'].isin(cluster_filter)]
-            if not geo_df.empty:
-                geo_df['year'] = geo_df['month'].dt.year
-                sankey_df = geo_df.groupby(['country', 'cluster_name'], as_index=False)['occurrence'].sum()
-                sankey_df = sankey_df.dropna(subset=['country', 'cluster_name'])
-                if not sankey_df.empty:
-                    countries = sankey_df['country'].unique().tolist()
-                    clusters_list = sankey_df['cluster_name'].unique().tolist()
-                    node_labels = countries + clusters_list
-                    node_indices = {label: i for i, label in enumerate(node_labels)}
-                    sankey_data = dict(
-                        type='sankey',
-                        node=dict(label=node_labels),
-                        link=dict(
-                            source=[node_indices[row['country']] for _, row in sankey_df.iterrows()],
-                            target=[node_indices[row['cluster_name']] for _, row in sankey_df.iterrows()],
-                            value=sankey_df['occurrence']
-                        )
-                    )
-                    fig = go.Figure(data=[sankey_data])
-                    fig.update_layout(title_text="Geo Sankey: Country to Cluster Name", font_size=10)
+            with_aliases = st.sidebar.checkbox("Sankey: Show aliases under each cluster", value=False, key="sankey_with_aliases")
+            min_weight = st.sidebar.number_input("Sankey: Minimum link weight", min_value=0, value=0, step=1, key="sankey_min_weight")
+            top_k = st.sidebar.number_input("Sankey: Top links per node (0 = all)", min_value=0, value=0, step=1, key="sankey_top_k")
+            with instrument.stage("query"):
+                graph = sankey.build_sankey(cubes, date_range, country_filter, cluster_filter, with_aliases, min_weight, top_k)
+            if not graph.empty:
+                if graph.n_pruned:
+                    st.caption(f"{graph.n_pruned} weaker links hidden by the minimum weight / top links per node settings.")
+                title = "Geo Sankey: Country to Cluster Name to Alias" if with_aliases else "Geo Sankey: Country to Cluster Name"
+                fig_key = figure_key(
+                    dataset, "Sankey", date_range=date_range, countries=set(country_filter), clusters=set(cluster_filter),
+                    with_aliases=with_aliases, min_weight=min_weight, top_k=top_k,
+                )
+                with instrument.stage("figure"):
+                    fig = cached_figure(fig_key, lambda: sankey_figure(graph, title))
+                with instrument.stage("render (st.plotly_chart)"):
                     st.plotly_chart(fig, use_container_width=True, key="sankey_plot")
-                else:
-                    st.warning("No data available for Sankey plot after filtering. Try adjusting filters or check your data.")
             else:
-                st.warning("No country data available for Sankey plot after filtering. Try adjusting filters or check your data.")
+                st.warning("No data available for Sankey plot after filtering. Try adjusting filters or check your data.")
+
 
+# Default views of the other tabs, built in the background while this one is viewed
+prefetcher.schedule(dataset, current_tab=selected_tab)
 
 st.sidebar.markdown("---")
+cache_stats = dataset_cache().stats()
+st.sidebar.caption(
+    f"Dataset cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} cached. "
+    f"Query backend: {backend.name}"
+)
+fig_cache_stats = figure_cache().stats()
+st.sidebar.caption(
+    f"Figure cache: {fig_cache_stats['hits']} hits, {fig_cache_stats['misses']} misses, "
+    f"{fig_cache_stats['entries']} cached ({fig_cache_stats['bytes'] / 1e6:.1f} MB)"
+)
+if st.sidebar.checkbox("Show timing panel", value=False, key="debug_timing_panel"):
+    timing = pd.DataFrame(trace.rows())
+    timing["stage"] = ["\u2003" * depth + name for depth, name in zip(timing.pop("depth"), timing["stage"])]
+    st.sidebar.dataframe(timing, hide_index=True, use_container_width=True)
+    st.sidebar.caption(f"Rerun so far: {trace.elapsed_ms:.0f} ms. Memory is the whole server process.")
 st.sidebar.info("This dashboard is powered by Streamlit and Plotly.")
+trace.finish()
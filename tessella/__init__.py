@@ -0,0 +1 @@
+"""Data loading and query helpers behind the Tech Mapping Dashboard (app.py)."""
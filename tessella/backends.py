@@ -0,0 +1,445 @@
+"""Pluggable query backends for the Occurrence, CoOccurrence and Geo Map pipelines.
+
+``PandasBackend`` (the default) answers from the in-memory cubes through
+tessella.queries. ``DuckDBBackend`` is for datasets whose lookup tables do
+not fit in memory: the columnar cache is exported once to Parquet files
+(in chunks, so the export itself is out of core), and every query pushes
+the date range, the alias/country/cluster filters, the ranking and the
+groupbys down to DuckDB, which scans the files and spills to disk as
+needed. Only the rows of one page of bars (plus the "Other" bar) or of the
+map come back into pandas. Both backends return the same RankedPage and
+DataFrame shapes, so the tabs do not know which one they talk to. Both
+also answer the sidebar's lookups (name search, name -> code, which names
+occur in a table); the SQL one without building the cubes.
+
+The backend is chosen with ``TESSELLA_BACKEND`` ("pandas" or "duckdb");
+``duckdb`` is an optional dependency only needed for the latter. The SQL
+backend never builds the in-memory cubes, so what only the cubes answer
+(trend ranking and filters, cluster rollups, previews, the Heatmap and the
+Sankey) is not available with it: ``in_memory`` and ``supports_trends``
+tell the dashboard which views and options to offer, and asking the SQL
+backend for a trend ranking or filter is a ValueError.
+"""
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from tessella import columnar, queries
+from tessella.cache import LRUCache
+from tessella.countries import resolve_countries
+from tessella.search import CodeSet, NameIndex
+
+try:
+    import duckdb
+except ImportError:  # optional, only needed for TESSELLA_BACKEND=duckdb
+    duckdb = None
+
+BACKEND = os.environ.get("TESSELLA_BACKEND", "pandas")
+PARQUET_CHUNK_ROWS = int(os.environ.get("TESSELLA_PARQUET_CHUNK_ROWS", "5000000"))
+DUCKDB_MEMORY_LIMIT = os.environ.get("TESSELLA_DUCKDB_MEMORY_LIMIT", "2GB")
+# Selections with more codes than this are joined as a registered table instead of listed in the SQL.
+INLINE_CODES = 1000
+
+_backend_cache = LRUCache(max_entries=4)
+
+
+class PandasBackend:
+    """The in-memory path: tessella.queries over the dataset's cubes."""
+
+    name = "pandas"
+    in_memory = True
+    supports_trends = True
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    @property
+    def cubes(self):
+        return self.dataset.cubes()
+
+    def has(self, table):
+        """Whether ``table`` ("occ", "coocc" or "country") has rows to query."""
+        return getattr(self.cubes, table) is not None
+
+    def name_index(self, vocab):
+        return self.cubes.name_index(vocab)
+
+    def codes(self, vocab, names):
+        return getattr(self.cubes, f"{vocab}_codes")(names)
+
+    def present(self, table):
+        """Mask over the alias (``country`` table: country) codes that occur in ``table``."""
+        cubes = self.cubes
+        if table == "coocc":
+            mask = np.zeros(len(cubes.alias_names), dtype=bool)
+            mask[cubes.coocc.aliases()] = True
+            return mask
+        return getattr(cubes, table).present
+
+    def occurrence_page(self, date_range, aliases=(), clusters=(), by_total=True, per_page=50, page=0, **trend):
+        return queries.occurrence_page(self.cubes, date_range, aliases, clusters, by_total, per_page, page, **trend)
+
+    def cooccurrence_page(self, date_range, aliases_1=(), aliases_2=(), clusters_1=(), clusters_2=(),
+                          by_total=True, per_page=50, page=0, **trend):
+        return queries.cooccurrence_page(
+            self.cubes, date_range, aliases_1, aliases_2, clusters_1, clusters_2, by_total, per_page, page, **trend,
+        )
+
+    def country_by_year(self, date_range, country_names=()):
+        return queries.country_by_year(self.cubes, date_range, country_names)
+
+
+# --- Parquet export ---
+
+def parquet_path(dataset):
+    """Folder of the dataset's Parquet files: next to its columnar files, or a temporary one."""
+    if dataset.path:
+        return os.path.join(dataset.path, "parquet")
+    return os.path.join(columnar.CACHE_DIR, "parquet", dataset.key)
+
+
+def _alias_cluster(arrays, n_alias):
+    # One cluster per alias, the last listed, as tessella.cubes.Cubes.alias_cluster.
+    alias_cluster = np.full(n_alias, -1, dtype=np.int64)
+    fact = arrays.get("fact_alias_cluster")
+    if fact is not None and "alias" in fact and "cluster_name" in fact:
+        alias = np.asarray(fact["alias"]).astype(np.int64)
+        cluster = np.asarray(fact["cluster_name"]).astype(np.int64)
+        ok = (alias >= 0) & (cluster >= 0)
+        alias_cluster[alias[ok]] = cluster[ok]
+    alias = np.flatnonzero(alias_cluster >= 0)
+    return pd.DataFrame({"alias": alias, "cluster": alias_cluster[alias]})
+
+
+def export_parquet(dataset, path=None, chunk_rows=PARQUET_CHUNK_ROWS):
+    """Write the dataset's tables as Parquet under ``path`` (one file per chunk of rows); returns the path.
+
+    Reads the (memory-mapped) columnar arrays ``chunk_rows`` rows at a time,
+    so memory stays bounded whatever the table sizes.
+    """
+    path = path or parquet_path(dataset)
+    if os.path.exists(os.path.join(path, "done")):
+        return path
+    tmp = columnar.staging_dir(path)
+    con = duckdb.connect()
+    try:
+        for name in ("occ", "coocc", "country"):
+            columns = dataset.arrays.get(name)
+            if not columns or "month" not in columns:
+                continue
+            os.makedirs(os.path.join(tmp, name))
+            n_rows = len(columns["month"])
+            for part, start in enumerate(range(0, max(n_rows, 1), chunk_rows)):
+                chunk = pd.DataFrame({col: np.asarray(values[start:start + chunk_rows]) for col, values in columns.items()})
+                con.register("chunk", chunk)
+                con.execute(f"COPY chunk TO {_sql_string(os.path.join(tmp, name, f'part-{part:05d}.parquet'))} (FORMAT parquet)")
+                con.unregister("chunk")
+        con.register("chunk", _alias_cluster(dataset.arrays, len(dataset.vocabs.get("alias", ()))))
+        con.execute(f"COPY chunk TO {_sql_string(os.path.join(tmp, 'alias_cluster.parquet'))} (FORMAT parquet)")
+        open(os.path.join(tmp, "done"), "w").close()
+    finally:
+        con.close()
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return path
+
+
+# --- SQL helpers ---
+
+def month_range(date_range):
+    """``[lo, hi)`` month codes of ``date_range``, as tessella.cubes.MonthAxis.span (missing months excluded)."""
+    lo, hi = columnar.MISSING_MONTH + 1, np.iinfo(np.int32).max
+    start, end = date_range if date_range is not None else (None, None)
+    if start is not None:
+        lo = (start.year - 1970) * 12 + start.month - 1 + (start.day > 1)
+    if end is not None:
+        hi = (end.year - 1970) * 12 + end.month
+    return lo, max(lo, hi)
+
+
+def _sql_string(value):
+    """``value`` as a quoted SQL string literal."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _codes(names, wanted):
+    """Codes of the ``wanted`` names found in the sorted vocabulary ``names``, in their order (as tessella.cubes)."""
+    # Vocabularies are sorted, so codes can be found by binary search.
+    wanted = np.asarray(list(wanted), dtype=object)
+    if not len(names) or not len(wanted):
+        return np.zeros(0, dtype=np.int64)
+    pos = np.minimum(np.searchsorted(names, wanted), len(names) - 1)
+    return pos[names[pos] == wanted]
+
+
+def _year(month):
+    return f"(CAST(floor({month} / 12) AS INTEGER) + 1970)"
+
+
+class _Query:
+    """One cursor plus the selections registered on it."""
+
+    def __init__(self, db, names):
+        self.con = db.cursor()
+        self.names = names
+        self._n_tables = 0
+
+    def codes(self, selection, vocab):
+        """``(codes, exclude)`` of a CodeSet or a list of names, or None when it selects everything."""
+        if isinstance(selection, CodeSet):
+            return None if selection.is_everything else (selection.codes, selection.exclude)
+        if not len(selection):
+            return None
+        return _codes(self.names[vocab], selection), False
+
+    def member(self, column, selection):
+        """SQL condition: ``column`` is in the selection (None selects every row)."""
+        if selection is None:
+            return "TRUE"
+        codes, exclude = selection
+        if not len(codes):
+            return "TRUE" if exclude else "FALSE"
+        if len(codes) <= INLINE_CODES:
+            listed = "(" + ", ".join(str(int(code)) for code in codes) + ")"
+        else:
+            table = f"selection_{self._n_tables}"
+            self._n_tables += 1
+            self.con.register(table, pd.DataFrame({"code": np.asarray(codes, dtype=np.int64)}))
+            listed = f"(SELECT code FROM {table})"
+        return f"{column} {'NOT IN' if exclude else 'IN'} {listed}"
+
+    def side(self, alias_col, cluster_col, aliases, clusters):
+        """Alias filter and cluster filter (on the alias's cluster) of one side."""
+        condition = self.member(alias_col, self.codes(aliases, "alias"))
+        clusters = self.codes(clusters, "cluster_name")
+        if clusters is not None:
+            # Aliases without a cluster never match a cluster filter.
+            condition += f" AND {cluster_col} >= 0 AND {self.member(cluster_col, clusters)}"
+        return f"({condition})"
+
+    def df(self, sql, params=()):
+        return self.con.execute(sql, list(params)).df()
+
+    def close(self):
+        self.con.close()
+
+
+def _check_trends(backend, rank_by=None, min_trend=None):
+    """Raise ValueError when asked to rank or filter by trend and ``backend`` cannot."""
+    wanted = rank_by is not None or any(value is not None for value in (min_trend or {}).values())
+    if wanted and not backend.supports_trends:
+        raise ValueError(f"the {backend.name} backend cannot rank or filter by trend (supports_trends is False)")
+
+
+def _page(q, page_sql, monthly_sql, keys, label_of, label_col, value_col, value_type, per_page, page, noun):
+    """RankedPage from a ranking query (``keys..., total, rank``) and its monthly rows (``keys..., month, value``).
+
+    The ranking is materialized on the cursor; only the page's rows and the
+    per-year sums of the ranks after it are fetched. Sums are cast back to
+    ``value_type``: DuckDB widens integer sums to HUGEINT, which pandas reads
+    as float64.
+    """
+    q.con.execute(f"CREATE TEMP TABLE ranked AS {page_sql}")
+    n_total = int(q.con.execute("SELECT count(*) FROM ranked").fetchone()[0])
+    n_pages = max(1, -(-n_total // per_page))
+    page = min(max(page, 0), n_pages - 1)
+    start = page * per_page
+    stop = start + per_page
+    shown = q.df("SELECT * FROM ranked WHERE rank >= ? AND rank < ? ORDER BY rank", [start, stop])
+    labels = label_of(shown)
+    join = " AND ".join(f"m.{col} = r.{col}" for col in keys)
+    by_year = q.df(
+        f"SELECT CASE WHEN r.rank < ? THEN r.rank ELSE -1 END AS slot, {_year('m.month')} AS year, "
+        f"CAST(sum(m.value) AS {value_type}) AS value FROM ({monthly_sql}) m JOIN ranked r ON {join} "
+        "WHERE r.rank >= ? GROUP BY ALL HAVING sum(m.value) != 0 ORDER BY slot, year",
+        [stop, start],
+    )
+    rows = by_year[by_year["slot"] >= 0]
+    grouped = pd.DataFrame({
+        label_col: np.asarray(labels, dtype=object)[rows["slot"].to_numpy() - start],
+        "year": rows["year"].to_numpy().astype(int),
+        value_col: rows["value"].to_numpy(),
+    })
+    labels = labels.tolist()[::-1]
+    other_label = None
+    n_tail = max(n_total - stop, 0)
+    if n_tail:
+        other_label = f"Other ({n_tail} more {noun})"
+        other = by_year[by_year["slot"] < 0]
+        grouped = pd.concat([grouped, pd.DataFrame({
+            label_col: other_label,
+            "year": other["year"].to_numpy().astype(int),
+            value_col: other["value"].to_numpy(),
+        })], ignore_index=True)
+        labels = [other_label] + labels
+    return queries.RankedPage(grouped, labels, n_total, page, n_pages, start, other_label)
+
+
+class DuckDBBackend:
+    """SQL over the dataset's Parquet files; see the module docstring."""
+
+    name = "duckdb"
+    in_memory = False
+    supports_trends = False
+
+    def __init__(self, dataset, path=None):
+        if duckdb is None:
+            raise ImportError("TESSELLA_BACKEND=duckdb needs the duckdb package (pip install duckdb)")
+        self.dataset = dataset
+        self.path = export_parquet(dataset, path)
+        self.names = {vocab: np.asarray(values, dtype=object) for vocab, values in dataset.vocabs.items()}
+        self.names.setdefault("cluster_name", np.zeros(0, dtype=object))
+        self._iso3 = None
+        self._name_indexes = {}
+        self._present = {}
+        self.tables = [name for name in ("occ", "coocc", "country") if os.path.isdir(os.path.join(self.path, name))]
+        self.db = duckdb.connect(config={"memory_limit": DUCKDB_MEMORY_LIMIT})
+        for name in self.tables:
+            files = _sql_string(os.path.join(self.path, name, "*.parquet"))
+            self.db.execute(f"CREATE VIEW {name} AS SELECT * FROM read_parquet({files})")
+        files = _sql_string(os.path.join(self.path, "alias_cluster.parquet"))
+        self.db.execute(f"CREATE VIEW alias_cluster AS SELECT * FROM read_parquet({files})")
+
+    def has(self, table):
+        return table in self.tables
+
+    def name_index(self, vocab):
+        index = self._name_indexes.get(vocab)
+        if index is None:
+            index = self._name_indexes[vocab] = NameIndex(self.names[_VOCABS[vocab]])
+        return index
+
+    def codes(self, vocab, names):
+        return _codes(self.names[_VOCABS[vocab]], names)
+
+    def present(self, table):
+        """As PandasBackend.present, from a scan of the table's Parquet files (once per backend)."""
+        mask = self._present.get(table)
+        if mask is None:
+            col, vocab = ("country", "country") if table == "country" else ("alias", "alias")
+            sql = f"SELECT DISTINCT {col} AS code FROM {table} WHERE {col} >= 0"
+            if table == "coocc":
+                sql = "SELECT DISTINCT alias_row AS code FROM coocc WHERE alias_row >= 0 AND alias_col >= 0"
+            q = _Query(self.db, self.names)
+            try:
+                codes = q.df(sql)["code"].to_numpy()
+            finally:
+                q.close()
+            mask = np.zeros(len(self.names[vocab]), dtype=bool)
+            mask[codes] = True
+            self._present[table] = mask
+        return mask
+
+    def _type(self, table, col):
+        return "BIGINT" if self.dataset.meta[table]["columns"][col]["kind"] == "int" else "DOUBLE"
+
+    def _value(self, table, col):
+        return f"CAST({col} AS {self._type(table, col)})"
+
+    def occurrence_page(self, date_range, aliases=(), clusters=(), by_total=True, per_page=50, page=0, **trend):
+        _check_trends(self, **trend)
+        lo, hi = month_range(date_range)
+        q = _Query(self.db, self.names)
+        try:
+            condition = q.side("o.alias", "coalesce(c.cluster, -1)", aliases, clusters)
+            monthly = (
+                f"SELECT o.alias, o.month, {self._value('occ', 'occurrence')} AS value FROM occ o "
+                f"LEFT JOIN alias_cluster c ON c.alias = o.alias "
+                f"WHERE o.alias >= 0 AND o.month >= {lo} AND o.month < {hi} AND {condition}"
+            )
+            order = "total DESC, alias" if by_total else "alias"
+            ranking = (
+                f"SELECT alias, total, row_number() OVER (ORDER BY {order}) - 1 AS rank FROM "
+                f"(SELECT alias, sum(value) AS total FROM ({monthly}) GROUP BY alias) WHERE total != 0"
+            )
+            return _page(
+                q, ranking, monthly, ["alias"], lambda shown: self.names["alias"][shown["alias"].to_numpy()],
+                "alias", "occurrence", self._type("occ", "occurrence"), per_page, page, "aliases",
+            )
+        finally:
+            q.close()
+
+    def cooccurrence_page(self, date_range, aliases_1=(), aliases_2=(), clusters_1=(), clusters_2=(),
+                          by_total=True, per_page=50, page=0, **trend):
+        _check_trends(self, **trend)
+        lo, hi = month_range(date_range)
+        q = _Query(self.db, self.names)
+        try:
+            # Each unordered pair once (i <= j); a month listed in both orientations keeps its
+            # alias_row <= alias_col rows, as tessella.cooccurrence does.
+            value = self._value("coocc", "cooccurrence")
+            monthly = (
+                f"SELECT least(alias_row, alias_col) AS i, greatest(alias_row, alias_col) AS j, month, "
+                f"CASE WHEN bool_or(alias_row <= alias_col) AND bool_or(alias_row > alias_col) "
+                f"THEN sum({value}) FILTER (WHERE alias_row <= alias_col) ELSE sum({value}) END AS value FROM coocc "
+                f"WHERE alias_row >= 0 AND alias_col >= 0 AND month >= {lo} AND month < {hi} GROUP BY ALL"
+            )
+            forward = (
+                f"{q.side('i', 'ci', aliases_1, clusters_1)} AND {q.side('j', 'cj', aliases_2, clusters_2)}"
+            )
+            backward = (
+                f"{q.side('j', 'cj', aliases_1, clusters_1)} AND {q.side('i', 'ci', aliases_2, clusters_2)}"
+            )
+            order = "total DESC, i, j" if by_total else "first, second"
+            ranking = (
+                f"SELECT i, j, first, second, total, row_number() OVER (ORDER BY {order}) - 1 AS rank FROM ("
+                f"SELECT i, j, CASE WHEN fwd THEN i ELSE j END AS first, CASE WHEN fwd THEN j ELSE i END AS second, total "
+                f"FROM (SELECT t.i, t.j, t.total, {forward} AS fwd, {backward} AS bwd FROM ("
+                f"SELECT p.i, p.j, sum(p.value) AS total, coalesce(any_value(ci.cluster), -1) AS ci, "
+                f"coalesce(any_value(cj.cluster), -1) AS cj FROM ({monthly}) p "
+                f"LEFT JOIN alias_cluster ci ON ci.alias = p.i LEFT JOIN alias_cluster cj ON cj.alias = p.j "
+                f"GROUP BY p.i, p.j) t) WHERE (fwd OR bwd) AND total != 0)"
+            )
+            names = self.names["alias"]
+            return _page(
+                q, ranking, monthly, ["i", "j"],
+                lambda shown: (
+                    pd.Series(names[shown["first"].to_numpy()], dtype=object) + " & "
+                    + pd.Series(names[shown["second"].to_numpy()], dtype=object)
+                ).to_numpy(dtype=object),
+                "combo", "cooccurrence", self._type("coocc", "cooccurrence"), per_page, page, "combos",
+            )
+        finally:
+            q.close()
+
+    def country_by_year(self, date_range, country_names=()):
+        lo, hi = month_range(date_range)
+        q = _Query(self.db, self.names)
+        try:
+            condition = q.member("country", q.codes(country_names, "country"))
+            agg = q.df(
+                f"SELECT * FROM (SELECT country, {_year('month')} AS year, "
+                f"CAST(sum({self._value('country', 'occurrence')}) AS {self._type('country', 'occurrence')}) AS total FROM country "
+                f"WHERE country >= 0 AND month >= {lo} AND month < {hi} AND {condition} GROUP BY ALL) "
+                "WHERE total != 0 ORDER BY year, country"
+            )
+        finally:
+            q.close()
+        if self._iso3 is None:
+            cache_dir = os.path.dirname(self.dataset.path) if self.dataset.path else None
+            self._iso3 = np.asarray(resolve_countries(self.names["country"].tolist(), cache_dir)[0], dtype=object)
+        codes = agg["country"].to_numpy()
+        return pd.DataFrame({
+            "country": self.names["country"][codes],
+            "iso_alpha": self._iso3[codes],
+            "year": agg["year"].to_numpy().astype(int),
+            "occurrence": agg["total"].to_numpy(),
+        })
+
+
+# Sidebar vocabulary names -> the dataset's vocabularies.
+_VOCABS = {"alias": "alias", "country": "country", "cluster": "cluster_name"}
+
+BACKENDS = {
+    "pandas": PandasBackend,
+    "duckdb": DuckDBBackend,
+}
+
+
+def backend_for(dataset, name=None):
+    """The query backend ``name`` (default ``TESSELLA_BACKEND``) of ``dataset``, one per dataset version."""
+    name = name or BACKEND
+    return _backend_cache.get_or_create((name, dataset.key), lambda: BACKENDS[name](dataset))
@@ -0,0 +1,204 @@
+"""Benchmarks for loading and for every dashboard tab, outside Streamlit.
+
+Each tab is run the way the dashboard runs it with its default sidebar
+state (full date range, "All" in every alias/cluster/country filter, first page),
+timing the query and the figure construction (including ``to_json``, which
+is what Streamlit sends to the browser) separately.
+
+    python -m tessella.bench --rows medium
+    python -m tessella.bench --data path/to/folder --json results.json
+    python -m tessella.bench --rows medium --compare results.json
+
+``--compare`` exits with status 1 when a stage is slower than the baseline
+by more than ``--tolerance`` (a factor), so it can gate a deployment.
+"""
+
+import json
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from tessella import columnar, heatmap, queries, sankey, synthetic, trends
+from tessella.charts import choropleth_figure, color_sequence, heatmap_figure, sankey_figure, stacked_bar_figure
+from tessella.dataset import Dataset, load_dataset, source_key
+from tessella.search import CodeSet
+
+
+def occurrence_data(cubes, date_range):
+    return queries.occurrence_page(cubes, date_range, CodeSet.everything(), CodeSet.everything(), by_total=True)
+
+
+def occurrence_figure(ranked):
+    min_occ, max_occ, _ = queries.bar_bounds(ranked, "occurrence")
+    return stacked_bar_figure(
+        ranked.grouped, "alias", "occurrence", ranked.labels, color_sequence("Viridis"), min_occ, max_occ,
+        title="Alias Occurrence Over Time (Color by Occurrence)", value_title="Occurrence", hover_name="Alias",
+    )
+
+
+def cooccurrence_data(cubes, date_range):
+    everything = CodeSet.everything()
+    return queries.cooccurrence_page(cubes, date_range, everything, everything, everything, everything, by_total=True)
+
+
+def cooccurrence_figure(ranked):
+    min_coocc, max_coocc, _ = queries.bar_bounds(ranked, "cooccurrence")
+    return stacked_bar_figure(
+        ranked.grouped, "combo", "cooccurrence", ranked.labels, color_sequence("Viridis"), min_coocc, max_coocc,
+        title="Alias Co-Occurrence Over Time (Color by Cooccurrence)", value_title="Cooccurrence", hover_name="Combo",
+    )
+
+
+def cluster_occurrence_data(cubes, date_range):
+    return queries.cluster_occurrence_page(cubes, date_range, CodeSet.everything(), by_total=True)
+
+
+def cluster_occurrence_figure(ranked):
+    min_occ, max_occ, _ = queries.bar_bounds(ranked, "occurrence")
+    return stacked_bar_figure(
+        ranked.grouped, "cluster", "occurrence", ranked.labels, color_sequence("Viridis"), min_occ, max_occ,
+        title="Cluster Occurrence Over Time (Color by Occurrence)", value_title="Occurrence", hover_name="Cluster",
+    )
+
+
+def cluster_cooccurrence_data(cubes, date_range):
+    everything = CodeSet.everything()
+    return queries.cluster_cooccurrence_page(cubes, date_range, everything, everything, by_total=True)
+
+
+def cooccurrence_growth_data(cubes, date_range):
+    # Emptied first so the trends of every pair are computed, not read back.
+    trends.trend_cache().clear()
+    everything = CodeSet.everything()
+    return queries.cooccurrence_page(
+        cubes, date_range, everything, everything, everything, everything, rank_by="growth",
+    )
+
+
+def heatmap_data(cubes, date_range):
+    return heatmap.build_heatmap(cubes, date_range, "alias")
+
+
+def geo_data(cubes, date_range):
+    return queries.country_by_year(cubes, date_range, CodeSet.everything())
+
+
+def geo_figure(agg):
+    return choropleth_figure(agg, color_sequence("Viridis"), int(agg["occurrence"].min()), int(agg["occurrence"].max()))
+
+
+def sankey_data(cubes, date_range):
+    return sankey.build_sankey(cubes, date_range, queries.top_countries(cubes, 5), queries.top_clusters(cubes, 5))
+
+
+def sankey_alias_data(cubes, date_range):
+    return sankey.build_sankey(
+        cubes, date_range, queries.top_countries(cubes, 5), queries.top_clusters(cubes, 5), with_aliases=True, top_k=10,
+    )
+
+
+# Tab -> (query, figure), in dashboard order.
+PIPELINES = {
+    "Occurrence": (occurrence_data, occurrence_figure),
+    "CoOccurrence": (cooccurrence_data, cooccurrence_figure),
+    "Occurrence (clusters)": (cluster_occurrence_data, cluster_occurrence_figure),
+    "CoOccurrence (clusters)": (cluster_cooccurrence_data, cooccurrence_figure),
+    "CoOccurrence (growth)": (cooccurrence_growth_data, cooccurrence_figure),
+    "Heatmap": (heatmap_data, lambda grid: heatmap_figure(grid, color_sequence("Viridis"), "Alias Co-Occurrence Heatmap")),
+    "Geo Map": (geo_data, geo_figure),
+    "Sankey": (sankey_data, lambda graph: sankey_figure(graph, "Geo Sankey: Country to Cluster Name")),
+    "Sankey (aliases)": (sankey_alias_data, lambda graph: sankey_figure(graph, "Geo Sankey: Country to Cluster Name to Alias")),
+}
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def run(data_dir, repeat=5, cache_dir=None):
+    """Time loading and every tab for the CSVs in ``data_dir``; returns ``{stage: seconds}`` (median of ``repeat``)."""
+    results = {}
+    own_cache = cache_dir is None
+    cache_dir = cache_dir or tempfile.mkdtemp(prefix="tessella-bench-")
+    try:
+        key = source_key(demo_dir=data_dir)
+        path = columnar.dataset_path(key, cache_dir)
+        shutil.rmtree(path, ignore_errors=True)
+        dataset, results["load: ingest CSVs"] = _timed(load_dataset, None, data_dir, cache_dir)
+        _, results["load: memory-map cached"] = _timed(Dataset.from_columnar, key, path)
+        cubes, results["load: build cubes"] = _timed(dataset.cubes)
+        date_range = dataset.date_bounds
+        for tab, (query, figure) in PIPELINES.items():
+            timings = {"query": [], "figure": [], "to_json": []}
+            for _ in range(repeat):
+                data, seconds = _timed(query, cubes, date_range)
+                timings["query"].append(seconds)
+                fig, seconds = _timed(figure, data)
+                timings["figure"].append(seconds)
+                _, seconds = _timed(fig.to_json)
+                timings["to_json"].append(seconds)
+            for stage, values in timings.items():
+                results[f"{tab}: {stage}"] = statistics.median(values)
+    finally:
+        if own_cache:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Stages slower than ``tolerance`` x their baseline time, as ``(stage, baseline, now)``."""
+    return [
+        (stage, baseline[stage], seconds) for stage, seconds in results.items()
+        if stage in baseline and seconds > tolerance * baseline[stage] and seconds - baseline[stage] > 0.005
+    ]
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark dataset loading and every dashboard tab.")
+    parser.add_argument("--data", help="folder with the four lookup CSVs (default: generate synthetic data)")
+    parser.add_argument("--rows", default="demo", help=f"synthetic rows per monthly table, or one of {', '.join(synthetic.SCALES)}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per tab; the median is reported")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="baseline results (from --json) to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown factor against the baseline")
+    args = parser.parse_args(argv)
+
+    data_dir = args.data
+    tmp = None
+    if data_dir is None:
+        tmp = tempfile.mkdtemp(prefix="tessella-synthetic-")
+        rows = synthetic.SCALES[args.rows] if args.rows in synthetic.SCALES else int(args.rows)
+        start = time.perf_counter()
+        sizes = synthetic.generate(tmp, rows, seed=args.seed)
+        print(f"generated {rows} rows per table {sizes} in {time.perf_counter() - start:.1f} s")
+        data_dir = tmp
+    try:
+        results = run(data_dir, args.repeat)
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    width = max(len(stage) for stage in results)
+    for stage, seconds in results.items():
+        print(f"{stage:<{width}}  {seconds * 1000:10.1f} ms")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(results, json.load(f), args.tolerance)
+        for stage, before, now in slower:
+            print(f"REGRESSION {stage}: {before * 1000:.1f} ms -> {now * 1000:.1f} ms")
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
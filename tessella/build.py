@@ -0,0 +1,339 @@
+"""Build the four lookup CSVs from publication-level records.
+
+Input is one record per publication with an id, a month, a list of
+countries and a list of aliases, as CSV (lists joined with ``--list-sep``)
+or JSON lines (lists as arrays). Output is exactly what the dashboard
+reads: ``lookup_occurrence.csv``, ``lookup_cooccurrence.csv``,
+``lookup_country_occurrence.csv`` and ``fact_alias_cluster.csv``, in a
+folder or a ZIP ready to upload.
+
+Counts are numbers of publications per month: an alias (or an alias pair,
+or an alias and a country) counts once per publication however often it
+is listed. Every pair is written in both orientations, as the dashboard
+expects.
+
+The work is a map-reduce over a pool of processes:
+
+* shuffle: records are spilled to disk hash-partitioned by id, and each
+  partition keeps the first record of every id, so a publication listed
+  twice anywhere in the input is counted once,
+* map: the partitions are cut into shards holding at most ``--shard-pairs``
+  alias pairs (pair counts grow quadratically with aliases per publication,
+  so shards are sized by pairs, not by publications). A publication with more
+  pairs than that is a shard of its own, and its pairs are generated a block
+  of aliases at a time. Each worker counts its shard and spills the partial
+  counts to disk, hash-partitioned by key,
+* reduce: each partition is summed on its own and appended to the output.
+
+Memory is bounded by the shard size, the number of shards in flight
+(twice the worker count) and the size of one partition. Records with a
+missing or blank id are never deduplicated. Records whose month does not
+parse are left out, counted and reported (``build`` returns a
+tessella.ingest.ValidationReport; the command line prints it).
+
+    python -m tessella.build publications.csv out.zip --clusters clusters.csv
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from tessella.dataset import TABLE_FILES
+from tessella.ingest import MAX_ERRORS, ValidationReport
+
+# Output table -> key columns and count column.
+TABLES = {
+    "occ": (["alias", "month"], "occurrence"),
+    "coocc": (["alias_row", "alias_col", "month"], "cooccurrence"),
+    "country": (["alias", "country", "month"], "occurrence"),
+}
+
+UNCLUSTERED = "Unclustered"
+
+
+def _as_lists(values, sep):
+    """Column of lists (JSON) or separated strings -> list of stripped, non-empty names."""
+    out = []
+    for value in values:
+        if isinstance(value, (list, tuple, np.ndarray)):
+            items = value
+        elif isinstance(value, str):
+            items = value.split(sep)
+        else:
+            items = []
+        out.append([str(item).strip() for item in items if str(item).strip()])
+    return out
+
+
+def read_records(path, id_col="id", month_col="month", countries_col="countries", aliases_col="aliases",
+                 sep=";", chunk_rows=50_000):
+    """Yield DataFrames of ``id, month, countries, aliases`` records (lists in the last two)."""
+    columns = [id_col, month_col, countries_col, aliases_col]
+    if path.endswith((".jsonl", ".json", ".ndjson")):
+        chunks = pd.read_json(path, lines=True, chunksize=chunk_rows, dtype=False)
+    else:
+        chunks = pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False, usecols=columns)
+    for chunk in chunks:
+        missing = [col for col in columns if col not in chunk.columns]
+        if missing:
+            raise ValueError(f"{path}: missing column(s) {', '.join(missing)}")
+        yield pd.DataFrame({
+            "id": chunk[id_col].to_numpy(),
+            "month": chunk[month_col].to_numpy(),
+            "countries": _as_lists(chunk[countries_col], sep),
+            "aliases": _as_lists(chunk[aliases_col], sep),
+        })
+
+
+def _cuts(weights, limit):
+    """``(start, end)`` runs of consecutive items weighing at most ``limit`` together (or one item)."""
+    total = np.cumsum(weights)
+    start = 0
+    while start < len(total):
+        base = total[start - 1] if start else 0
+        end = max(int(np.searchsorted(total, base + limit, side="right")), start + 1)
+        yield start, end
+        start = end
+
+
+def shards(records, max_pairs):
+    """Split record chunks so each shard holds at most ``max_pairs`` alias pairs (or one publication)."""
+    for chunk in records:
+        k = np.fromiter((len(set(a)) for a in chunk["aliases"]), dtype=np.int64, count=len(chunk))
+        for start, end in _cuts(k * (k - 1) // 2, max_pairs):
+            yield chunk.iloc[start:end]
+
+
+def _months(values):
+    months = pd.to_datetime(pd.Series(values, dtype=object), errors="coerce")
+    return months.dt.to_period("M").dt.to_timestamp().dt.strftime("%Y-%m-%d")
+
+
+def count_shard(shard, max_pairs=2_000_000):
+    """Partial counts of one shard, as ``(table, DataFrame of keys + count)`` pieces.
+
+    Records whose month does not parse are not counted; they come first, as
+    ``("rejected", DataFrame of record + month)``. Co-occurrence comes in
+    blocks of at most about ``max_pairs`` candidate pairs, so a publication
+    with thousands of aliases (a shard of its own) is never expanded at once.
+    """
+    month = _months(shard["month"]).to_numpy(dtype=object)
+    ok = pd.notna(month)
+    yield "rejected", pd.DataFrame({"record": shard["record"].to_numpy()[~ok], "month": shard["month"].to_numpy()[~ok]})
+    aliases = [a for a, keep in zip(shard["aliases"], ok) if keep]
+    countries = [c for c, keep in zip(shard["countries"], ok) if keep]
+    month = month[ok]
+
+    n_alias = np.fromiter(map(len, aliases), dtype=np.int64, count=len(aliases))
+    pub_alias = pd.DataFrame({
+        "pub": np.repeat(np.arange(len(aliases)), n_alias),
+        "alias": np.array([a for names in aliases for a in names], dtype=object),
+    }).drop_duplicates(ignore_index=True)
+    pub_alias["month"] = month[pub_alias["pub"].to_numpy()]
+
+    yield "occ", pub_alias.groupby(["alias", "month"], sort=False).size().rename("occurrence").reset_index()
+
+    n_country = np.fromiter(map(len, countries), dtype=np.int64, count=len(countries))
+    pub_country = pd.DataFrame({
+        "pub": np.repeat(np.arange(len(countries)), n_country),
+        "country": np.array([c for names in countries for c in names], dtype=object),
+    }).drop_duplicates()
+    country = pub_alias.merge(pub_country, on="pub")
+    yield "country", country.groupby(["alias", "country", "month"], sort=False).size().rename("occurrence").reset_index()
+
+    # Pairs within each publication, lower alias first. Each (publication, alias)
+    # row is paired with every alias of its publication, a block of rows at a time.
+    codes, names = pd.factorize(pub_alias["alias"], sort=True)
+    names = np.asarray(names, dtype=object)
+    pub = pub_alias["pub"].to_numpy()
+    coded = pd.DataFrame({"pub": pub, "code": codes})
+    per_row = np.bincount(pub, minlength=len(aliases))[pub]
+    for start, end in _cuts(per_row, max_pairs):
+        # Rows are grouped by publication, so the block's publications are one slice.
+        lo = np.searchsorted(pub, pub[start], side="left")
+        hi = np.searchsorted(pub, pub[end - 1], side="right")
+        pairs = coded.iloc[start:end].merge(coded.iloc[lo:hi], on="pub")
+        pairs = pairs[pairs["code_x"] < pairs["code_y"]]
+        coocc = pd.DataFrame({
+            "alias_row": names[pairs["code_x"].to_numpy()],
+            "alias_col": names[pairs["code_y"].to_numpy()],
+            "month": month[pairs["pub"].to_numpy()],
+        })
+        yield "coocc", coocc.groupby(["alias_row", "alias_col", "month"], sort=False).size().rename("cooccurrence").reset_index()
+
+
+def _partition(df, keys, n_partitions):
+    return pd.util.hash_pandas_object(df[keys], index=False).to_numpy() % n_partitions
+
+
+def _spill_records(chunk_id, chunk, record_dir, n_partitions):
+    part = _partition(chunk, ["id"], n_partitions)
+    for p in np.unique(part):
+        chunk[part == p].to_pickle(os.path.join(record_dir, f"{p:04d}", f"{chunk_id}.pkl"))
+
+
+def _unique_records(record_dir, n_partitions):
+    """Yield each partition of spilled records with repeated ids dropped (first record kept)."""
+    for p in range(n_partitions):
+        part_dir = os.path.join(record_dir, f"{p:04d}")
+        files = sorted(os.listdir(part_dir), key=lambda f: int(f.split(".")[0]))
+        if not files:
+            continue
+        df = pd.concat([pd.read_pickle(os.path.join(part_dir, f)) for f in files], ignore_index=True)
+        has_id = df["id"].notna() & (df["id"].astype(str).str.strip() != "")
+        yield df[~(df["id"].duplicated() & has_id)]
+
+
+def _map_shard(args):
+    """Count one shard and spill its pieces; returns ``(rejected records, their first MAX_ERRORS)``."""
+    shard_id, shard, spill_dir, n_partitions, max_pairs = args
+    rejected = None
+    for piece, (table, df) in enumerate(count_shard(shard, max_pairs)):
+        if table == "rejected":
+            rejected = df
+            continue
+        keys, _ = TABLES[table]
+        part = _partition(df, keys, n_partitions)
+        for p in np.unique(part):
+            df[part == p].to_pickle(os.path.join(spill_dir, table, f"{p:04d}", f"{shard_id}-{piece}.pkl"))
+    return len(rejected), rejected.sort_values("record").head(MAX_ERRORS)
+
+
+def _reduce_partition(args):
+    table, part_dir, out_path = args
+    keys, value = TABLES[table]
+    files = sorted(os.listdir(part_dir))
+    if not files:
+        return out_path, []
+    df = pd.concat([pd.read_pickle(os.path.join(part_dir, f)) for f in files], ignore_index=True)
+    df = df.groupby(keys, sort=False)[value].sum().reset_index()
+    if table == "coocc":
+        flipped = df.rename(columns={"alias_row": "alias_col", "alias_col": "alias_row"})
+        df = pd.concat([df, flipped[df.columns]], ignore_index=True)
+    df.to_csv(out_path, header=False, index=False)
+    aliases = pd.unique(df["alias"]).tolist() if table == "occ" else []
+    return out_path, aliases
+
+
+def _concat_csv(out_path, header, parts):
+    with open(out_path, "w", newline="") as out:
+        out.write(",".join(header) + "\n")
+        for part in parts:
+            with open(part) as f:
+                shutil.copyfileobj(f, out)
+
+
+def build(records, out_dir, clusters=None, workers=None, max_pairs=2_000_000, n_partitions=64, tmp_dir=None):
+    """Run the map-reduce over ``records`` (an iterable of record DataFrames) into ``out_dir``.
+
+    ``clusters`` is a CSV with ``alias`` and ``cluster_name`` columns; without
+    it every alias goes into one "Unclustered" cluster. Returns ``(number of
+    shards, ValidationReport)``: the report lists the records left out for a
+    month that does not parse, numbered from 1 in input order.
+    """
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(out_dir, exist_ok=True)
+    work = tempfile.mkdtemp(prefix="tessella-build-", dir=tmp_dir)
+    try:
+        record_dir = os.path.join(work, "records")
+        for p in range(n_partitions):
+            os.makedirs(os.path.join(record_dir, f"{p:04d}"))
+        report = ValidationReport("records")
+        for chunk_id, chunk in enumerate(records):
+            chunk = chunk.assign(record=np.arange(report.rows + 1, report.rows + 1 + len(chunk)))
+            report.rows += len(chunk)
+            _spill_records(chunk_id, chunk, record_dir, n_partitions)
+
+        spill_dir = os.path.join(work, "spill")
+        for table in TABLES:
+            for p in range(n_partitions):
+                os.makedirs(os.path.join(spill_dir, table, f"{p:04d}"))
+        with multiprocessing.Pool(workers) as pool:
+            # Map, keeping at most two shards per worker in flight.
+            pending = []
+            rejected = []
+            n_shards = 0
+            for shard in shards(_unique_records(record_dir, n_partitions), max_pairs):
+                pending.append(pool.apply_async(_map_shard, ((n_shards, shard, spill_dir, n_partitions, max_pairs),)))
+                n_shards += 1
+                while len(pending) >= 2 * workers:
+                    rejected.append(pending.pop(0).get())
+            rejected.extend(result.get() for result in pending)
+            report.invalid_rows = sum(n for n, _ in rejected)
+            if report.invalid_rows:
+                examples = pd.concat([df for _, df in rejected], ignore_index=True).sort_values("record")
+                report.add(examples["record"].to_numpy(), "month", examples["month"].to_numpy(), "not a date")
+
+            # Reduce each partition of each table.
+            tasks = [
+                (table, os.path.join(spill_dir, table, f"{p:04d}"), os.path.join(work, f"{table}-{p:04d}.csv"))
+                for table in TABLES for p in range(n_partitions)
+            ]
+            reduced = pool.map(_reduce_partition, tasks, chunksize=1)
+
+        aliases = set()
+        for table in TABLES:
+            keys, value = TABLES[table]
+            parts = [path for (t, _, _), (path, _) in zip(tasks, reduced) if t == table and os.path.exists(path)]
+            _concat_csv(os.path.join(out_dir, TABLE_FILES[table]), keys + [value], parts)
+        for (table, _, _), (_, names) in zip(tasks, reduced):
+            aliases.update(names)
+
+        fact_path = os.path.join(out_dir, TABLE_FILES["fact_alias_cluster"])
+        if clusters is not None:
+            fact = pd.read_csv(clusters, dtype=str, keep_default_na=False)
+            missing = [col for col in ("alias", "cluster_name") if col not in fact.columns]
+            if missing:
+                raise ValueError(f"{clusters}: missing column(s) {', '.join(missing)}")
+            fact.to_csv(fact_path, index=False)
+        else:
+            pd.DataFrame({"alias": sorted(aliases), "cluster_name": UNCLUSTERED}).to_csv(fact_path, index=False)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return n_shards, report
+
+
+def write_zip(out_dir, zip_path):
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        for filename in TABLE_FILES.values():
+            z.write(os.path.join(out_dir, filename), filename)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the dashboard's lookup CSVs from publication-level records.")
+    parser.add_argument("records", help="CSV or JSON-lines file with one publication per row")
+    parser.add_argument("output", help="output folder, or a .zip file to upload to the dashboard")
+    parser.add_argument("--clusters", help="CSV with alias and cluster_name columns (default: one 'Unclustered' cluster)")
+    parser.add_argument("--id-col", default="id")
+    parser.add_argument("--month-col", default="month")
+    parser.add_argument("--countries-col", default="countries")
+    parser.add_argument("--aliases-col", default="aliases")
+    parser.add_argument("--list-sep", default=";", help="separator of the country and alias lists in CSV input")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--shard-pairs", type=int, default=2_000_000, help="maximum alias pairs per shard")
+    parser.add_argument("--partitions", type=int, default=64, help="hash partitions for the reduce step")
+    args = parser.parse_args(argv)
+
+    records = read_records(args.records, args.id_col, args.month_col, args.countries_col, args.aliases_col, args.list_sep)
+    as_zip = args.output.endswith(".zip")
+    out_dir = tempfile.mkdtemp(prefix="tessella-out-") if as_zip else args.output
+    try:
+        n_shards, report = build(records, out_dir, args.clusters, args.workers, args.shard_pairs, args.partitions)
+        if as_zip:
+            write_zip(out_dir, args.output)
+    finally:
+        if as_zip:
+            shutil.rmtree(out_dir, ignore_errors=True)
+    print(json.dumps({"shards": n_shards, "output": args.output, "records": report.to_json()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Small thread-safe LRU cache shared by every session in the Streamlit process."""
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Least-recently-used cache bounded by entry count and total size.
+
+    ``sizeof`` returns the size in bytes of a cached value; entries are
+    evicted oldest-first until both bounds hold again. Hits, misses and
+    evictions are counted so the app can report them.
+    """
+
+    def __init__(self, max_entries=4, max_bytes=None, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self._evict()
+
+    def get_or_create(self, key, factory):
+        # Only one caller builds a missing entry; concurrent callers asking
+        # for the same key wait for it instead of building it again.
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return self._entries[key]
+                    self.misses += 1
+                value = factory()
+                self.put(key, value)
+        finally:
+            # Also when ``factory`` raises, so a failed build does not leave its lock behind.
+            with self._lock:
+                self._key_locks.pop(key, None)
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            self._sizes.pop(key, None)
+            return self._entries.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(self._sizes.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _evict(self):
+        # Never evict the entry that was just inserted, even if it alone is
+        # larger than max_bytes.
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and sum(self._sizes.values()) > self.max_bytes)
+        ):
+            old_key, _ = self._entries.popitem(last=False)
+            self._sizes.pop(old_key, None)
+            self.evictions += 1
@@ -0,0 +1,134 @@
+"""Plotly figure builders shared by the dashboard tabs."""
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+COLOR_SCALES = ["Viridis", "Inferno", "YlGnBu", "Cividis"]
+
+
+def color_sequence(name):
+    return getattr(px.colors.sequential, name) if hasattr(px.colors.sequential, name) else px.colors.sequential.Viridis
+
+
+def truncate_labels(labels, width=40):
+    labels = pd.Series(labels, dtype=object).astype(str)
+    long = labels.str.len() > width
+    labels[long] = labels[long].str.slice(0, width) + "..."
+    return labels.to_numpy(dtype=object)
+
+
+def stacked_bar_figure(grouped, entity_col, value_col, sorted_entities, color_seq, color_min, color_max,
+                       title, value_title, hover_name):
+    """Horizontal bars per entity, stacked by year and colored by value.
+
+    ``grouped`` has one row per (entity, year). ``sorted_entities`` lists the
+    entities to draw, bottom to top. All segments go into a single bar trace
+    (plotly stacks bars sharing a position within one trace) whose colors
+    are mapped by the layout's shared coloraxis in the browser, so the
+    payload is one numeric array per field instead of a trace per year with
+    a color string per bar.
+    """
+    order = pd.Categorical(grouped[entity_col], categories=sorted_entities)
+    keep = order.codes >= 0
+    positions = order.codes[keep]
+    years = grouped["year"].to_numpy()[keep]
+    values = grouped[value_col].to_numpy()[keep]
+    # Earlier years first so each bar reads left to right in time.
+    idx = np.lexsort((positions, years))
+    positions, years, values = positions[idx], years[idx], values[idx]
+    names = np.asarray(sorted_entities, dtype=object)
+
+    fig = go.Figure(go.Bar(
+        x=values,
+        y=positions,
+        orientation="h",
+        marker=dict(color=values, coloraxis="coloraxis"),
+        customdata=np.column_stack([names[positions], years]),
+        hovertemplate=hover_name + ": %{customdata[0]}<br>Year: %{customdata[1]}<br>" + value_title + ": %{x}<extra></extra>",
+        showlegend=False,
+    ))
+    fig.update_layout(
+        barmode="stack",
+        title=title,
+        xaxis_title=value_title,
+        yaxis_title=None,
+        coloraxis=dict(
+            colorscale=color_seq,
+            cmin=color_min,
+            cmax=color_max,
+            colorbar=dict(
+                title=value_title,
+                tickvals=[color_min, color_max],
+                ticktext=[str(color_min), str(color_max)],
+                lenmode="pixels",
+                len=200,
+            ),
+        ),
+        height=max(400, len(sorted_entities) * 30 + 200),
+        width=3600,
+        margin=dict(l=40, r=40, t=100, b=40),
+    )
+    fig.update_yaxes(
+        tickmode="array",
+        tickvals=np.arange(len(sorted_entities)),
+        ticktext=truncate_labels(sorted_entities),
+        range=[-0.5, len(sorted_entities) - 0.5],
+    )
+    return fig
+
+
+def choropleth_figure(agg, color_seq, color_min, color_max):
+    """Animated world map of ``country_by_year`` rows that have an ISO-3 code."""
+    agg = agg.dropna(subset=["iso_alpha"])
+    return px.choropleth(
+        agg,
+        locations="iso_alpha",
+        color="occurrence",
+        hover_name="country",
+        animation_frame="year",
+        color_continuous_scale=color_seq,
+        range_color=(color_min, color_max),
+        title="Geographic Occurrence Heatmap",
+    )
+
+
+def sankey_figure(graph, title):
+    """Figure for a tessella.sankey.SankeyGraph."""
+    fig = go.Figure(data=[graph.trace()])
+    fig.update_layout(title_text=title, font_size=10)
+    return fig
+
+
+def heatmap_figure(grid, color_seq, title, log=False):
+    """Heatmap of a tessella.heatmap.HeatmapGrid, cluster blocks marked on the axes.
+
+    With ``log`` the colors follow log10(1 + total) while the hover still
+    shows the total.
+    """
+    z = np.log10(1 + grid.z).round(3) if log else grid.z
+    fig = go.Figure(go.Heatmap(
+        z=z,
+        x=grid.col_labels,
+        y=grid.row_labels,
+        customdata=grid.z if log else None,
+        colorscale=color_seq,
+        colorbar=dict(title="log10(1 + total)" if log else "Cooccurrence"),
+        hovertemplate="Rows: %{y}<br>Columns: %{x}<br>Cooccurrence: "
+        + ("%{customdata}" if log else "%{z}") + "<extra></extra>",
+        xgap=0,
+        ygap=0,
+    ))
+    fig.update_layout(title=title, height=900, margin=dict(l=40, r=40, t=100, b=40))
+    fig.update_yaxes(autorange="reversed")
+    for update, labels, blocks in ((fig.update_xaxes, grid.col_labels, grid.col_blocks),
+                                   (fig.update_yaxes, grid.row_labels, grid.row_blocks)):
+        if blocks:
+            # One tick per cluster block instead of one per bin.
+            update(tickmode="array", tickvals=[labels[b] for b, _ in blocks], ticktext=truncate_labels([n for _, n in blocks], 20))
+        else:
+            update(ticktext=None, tickvals=None)
+        if len(labels) > 60 and not blocks:
+            update(showticklabels=False)
+    return fig
@@ -0,0 +1,189 @@
+"""Compact columnar on-disk format for the lookup tables.
+
+Each dataset is stored under ``<cache dir>/<dataset key>/`` as one ``.npy``
+file per column plus a ``dataset.json`` describing the columns:
+
+* string columns are dictionary-encoded; the alias columns of every table
+  share one vocabulary so their integer codes can be compared and joined
+  directly, and codes use the same integer width pandas uses for
+  categoricals so they can be wrapped without copying,
+* ``month`` is stored as int32 month codes (months since 1970-01),
+* counts are downcast to the smallest signed integer type that fits,
+* rows are sorted by month and then by entity (``SORT_KEYS``), so the rows
+  of any date range form one contiguous span (see tessella.cubes.TimeIndex).
+
+Loading memory-maps every column, so only pages that are actually touched
+are read and the same pages are shared by every process on the machine.
+
+Run ``python -m tessella.columnar <ZIP or folder>`` to convert a dataset
+ahead of time.
+"""
+
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 2
+
+CACHE_DIR = os.environ.get("TESSELLA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "tessella"))
+
+# Shared vocabulary name -> columns (in any table) encoded with it.
+VOCAB_COLUMNS = {
+    "alias": ["alias", "alias_row", "alias_col"],
+    "country": ["country"],
+    "cluster_name": ["cluster_name"],
+}
+
+# Physical row order of each table, after ``month``. Rows with a missing
+# month (MISSING_MONTH, the smallest int32) sort first.
+SORT_KEYS = {
+    "occ": ["alias"],
+    "coocc": ["alias_row", "alias_col"],
+    "country": ["country", "alias"],
+}
+
+MISSING_MONTH = np.iinfo(np.int32).min
+
+
+def month_codes(months):
+    """Datetime values -> int32 months since 1970-01 (``MISSING_MONTH`` for NaT)."""
+    months = pd.Series(months)
+    codes = ((months.dt.year - 1970) * 12 + months.dt.month - 1).to_numpy(dtype="float64", na_value=np.nan)
+    out = np.full(len(codes), MISSING_MONTH, dtype=np.int32)
+    ok = ~np.isnan(codes)
+    out[ok] = codes[ok].astype(np.int32)
+    return out
+
+
+def month_datetimes(codes):
+    """int32 month codes -> datetime64[s] array (NaT for ``MISSING_MONTH``)."""
+    codes = np.asarray(codes)
+    out = codes.astype("int64")
+    out[codes == MISSING_MONTH] = np.iinfo(np.int64).min
+    return out.view("datetime64[M]").astype("datetime64[s]")
+
+
+def code_dtype(n_categories):
+    # Same widths pandas picks for Categorical codes, so wrapping the
+    # memory-mapped codes in a Categorical does not copy them.
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def sort_by_month(name, columns):
+    """Reorder a table's column arrays by month, then by its SORT_KEYS."""
+    if "month" not in columns:
+        return columns
+    keys = [columns[col] for col in reversed(SORT_KEYS.get(name, [])) if col in columns]
+    order = np.lexsort(keys + [columns["month"]])
+    return {col: np.asarray(values)[order] for col, values in columns.items()}
+
+
+def dataset_path(key, cache_dir=None):
+    return os.path.join(cache_dir or CACHE_DIR, key)
+
+
+def exists(path):
+    try:
+        with open(os.path.join(path, "dataset.json")) as f:
+            return json.load(f).get("format") == FORMAT_VERSION
+    except (OSError, ValueError):
+        return False
+
+
+def staging_dir(path):
+    """Fresh temporary directory next to ``path`` to build a dataset in."""
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(prefix=".tmp-", dir=parent)
+
+
+def finish_dataset(tmp, path, vocabs, meta, missing_files=(), empty_files=(), **info):
+    """Write the vocabularies and dataset.json into ``tmp`` and move it to ``path``.
+
+    Column files must already be in ``tmp/<table>/``. Extra keyword
+    arguments are stored in dataset.json as they are.
+    """
+    os.makedirs(os.path.join(tmp, "vocab"), exist_ok=True)
+    for vocab, categories in vocabs.items():
+        with open(os.path.join(tmp, "vocab", vocab + ".json"), "w") as f:
+            json.dump(categories.tolist(), f)
+    with open(os.path.join(tmp, "dataset.json"), "w") as f:
+        json.dump({
+            "format": FORMAT_VERSION,
+            "tables": meta,
+            "missing_files": list(missing_files),
+            "empty_files": list(empty_files),
+            **info,
+        }, f, indent=1)
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        # Another process finished converting the same dataset first.
+        if not exists(path):
+            raise
+
+
+def decode_tables(arrays, meta, vocabs):
+    """Wrap column arrays as DataFrames (categoricals for codes, datetime64 months)."""
+    dtypes = {vocab: pd.CategoricalDtype(categories) for vocab, categories in vocabs.items()}
+    tables = {}
+    for name, table_meta in meta.items():
+        columns = {}
+        for col, col_meta in table_meta["columns"].items():
+            values = arrays[name][col]
+            if col_meta["kind"] == "category":
+                columns[col] = pd.Categorical.from_codes(values, dtype=dtypes[col_meta["vocab"]], validate=False)
+            elif col_meta["kind"] == "month":
+                columns[col] = month_datetimes(values)
+            else:
+                columns[col] = values
+        tables[name] = pd.DataFrame(columns, copy=False)
+    return tables
+
+
+def read_dataset(path, mmap_mode="r"):
+    """Memory-map a converted dataset (``mmap_mode=None`` reads it into memory).
+
+    Returns ``(tables, arrays, vocabs, info)``: pandas DataFrames backed by
+    the mapped files (string columns as categoricals, ``month`` as
+    datetime64), the raw column arrays (codes, month codes, counts), the
+    vocabularies as pandas Index objects, and the dataset.json contents.
+    """
+    with open(os.path.join(path, "dataset.json")) as f:
+        info = json.load(f)
+    vocabs = {}
+    for filename in os.listdir(os.path.join(path, "vocab")):
+        with open(os.path.join(path, "vocab", filename)) as f:
+            vocabs[filename[:-len(".json")]] = pd.Index(json.load(f))
+    arrays = {}
+    for name, table_meta in info["tables"].items():
+        arrays[name] = {
+            col: np.load(os.path.join(path, name, col + ".npy"), mmap_mode=mmap_mode)
+            for col in table_meta["columns"]
+        }
+    return decode_tables(arrays, info["tables"], vocabs), arrays, vocabs, info
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from tessella.dataset import load_dataset
+
+    parser = argparse.ArgumentParser(description="Convert a dataset ZIP or folder to the columnar cache format.")
+    parser.add_argument("source", help="ZIP file or folder containing the four lookup CSVs")
+    parser.add_argument("--cache-dir", default=None, help=f"cache directory (default: {CACHE_DIR})")
+    args = parser.parse_args()
+    if os.path.isdir(args.source):
+        ds = load_dataset(demo_dir=args.source, cache_dir=args.cache_dir)
+    else:
+        with open(args.source, "rb") as f:
+            ds = load_dataset(f, cache_dir=args.cache_dir)
+    print(ds.path or "(not written)")
+    for filename in ds.missing_files:
+        print(f"missing or unreadable: {filename}")
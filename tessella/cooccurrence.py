@@ -0,0 +1,165 @@
+"""Sparse co-occurrence matrix over integer alias codes.
+
+``lookup_cooccurrence.csv`` lists every pair twice (A & B and B & A). Where
+a pair's month is listed in both orientations, only its ``alias_row <=
+alias_col`` rows are kept; whatever remains is summed, so sources that list
+a pair once, or repeat a row in the same orientation, keep all their
+counts. Each unordered pair is stored once, as its upper-triangle cell (i <= j in
+alias code order, which is alphabetical), with its monthly counts in a
+SparseCube. A per-alias incidence index lists the pairs each alias takes
+part in, so partner and cluster queries touch only the relevant pairs and
+never build "A & B" strings.
+"""
+
+import numpy as np
+
+from tessella.columnar import MISSING_MONTH
+from tessella.cubes import SparseCube, expand_memberships
+
+
+class CooccurrenceMatrix:
+    """Monthly pair counts for unordered alias pairs (upper triangle only)."""
+
+    def __init__(self, alias_row, alias_col, month, counts, n_alias, axis, mirrored=True):
+        # ``mirrored``: the rows may list pairs in both orientations (see the module docstring).
+        self.n_alias = n_alias
+        self.axis = axis
+        if mirrored:
+            keep = _one_orientation(alias_row, alias_col, month, n_alias, axis)
+            alias_row, alias_col = np.asarray(alias_row)[keep], np.asarray(alias_col)[keep]
+            month, counts = np.asarray(month)[keep], np.asarray(counts)[keep]
+        self.pair_keys, pair = np.unique(_pair_keys(alias_row, alias_col, n_alias), return_inverse=True)
+        if len(self.pair_keys) and self.pair_keys[0] < 0:
+            self.pair_keys = self.pair_keys[1:]
+            pair = pair - 1
+        self.cube = SparseCube(pair, month, counts, axis)
+        self._index()
+
+    def _index(self):
+        n_alias = self.n_alias
+        self.pair_i = (self.pair_keys // max(n_alias, 1)).astype(np.int32)
+        self.pair_j = (self.pair_keys % max(n_alias, 1)).astype(np.int32)
+        # alias code -> pair indices it takes part in (CSR layout).
+        ends = np.concatenate([self.pair_i, self.pair_j[self.pair_j != self.pair_i]]).astype(np.int64)
+        pairs = np.concatenate([np.arange(len(self.pair_keys)), np.flatnonzero(self.pair_j != self.pair_i)])
+        order = np.argsort(ends, kind="stable")
+        self.incidence = pairs[order]
+        self.offsets = np.r_[0, np.cumsum(np.bincount(ends, minlength=n_alias))]
+
+    def updated(self, alias_map, n_alias, axis, alias_row, alias_col, month, counts):
+        """This matrix plus extra rows, on renumbered (order-preserving) alias codes and a wider axis.
+
+        Existing pairs keep their monthly sums; only pairs in the delta get
+        new cells, and the incidence index is rebuilt from the pair list.
+        """
+        alias_map = np.asarray(alias_map, dtype=np.int64)
+        keep = _one_orientation(alias_row, alias_col, month, n_alias, axis)
+        alias_row, alias_col = np.asarray(alias_row)[keep], np.asarray(alias_col)[keep]
+        month, counts = np.asarray(month)[keep], np.asarray(counts)[keep]
+        old_keys = alias_map[self.pair_i] * n_alias + alias_map[self.pair_j]
+        delta_keys = _pair_keys(alias_row, alias_col, n_alias)
+        matrix = CooccurrenceMatrix.__new__(CooccurrenceMatrix)
+        matrix.n_alias = n_alias
+        matrix.axis = axis
+        matrix.pair_keys = np.union1d(old_keys, delta_keys[delta_keys >= 0])
+        pair = np.where(delta_keys >= 0, np.searchsorted(matrix.pair_keys, delta_keys), -1)
+        matrix.cube = self.cube.updated(
+            np.searchsorted(matrix.pair_keys, old_keys), axis, pair, month, counts,
+        )
+        matrix._index()
+        return matrix
+
+    def rollup(self, member_alias, member_cluster, n_cluster):
+        """Cluster x cluster matrix: each cluster pair sums the pairs of their member aliases.
+
+        An alias in several clusters counts towards each; pairs of aliases
+        in the same cluster land on the diagonal.
+        """
+        n_months = max(self.axis.n, 1)
+        pair = self.cube.keys // n_months
+        month = self.cube.keys % n_months + self.axis.first
+        sums = np.diff(self.cube.cum)
+        rows_i, cluster_i = expand_memberships(self.pair_i[pair], member_alias, member_cluster)
+        rows_j, cluster_j = expand_memberships(self.pair_j[pair[rows_i]], member_alias, member_cluster)
+        rows = rows_i[rows_j]
+        return CooccurrenceMatrix(cluster_i[rows_j], cluster_j, month[rows], sums[rows], n_cluster, self.axis, mirrored=False)
+
+    @property
+    def n_pairs(self):
+        return len(self.pair_keys)
+
+    def aliases(self):
+        """Codes of every alias that co-occurs with at least one other."""
+        return np.flatnonzero(np.diff(self.offsets))
+
+    def pairs_of(self, alias):
+        return self.incidence[self.offsets[alias]:self.offsets[alias + 1]]
+
+    def totals(self, lo, hi, pairs=None):
+        pairs = np.arange(self.n_pairs) if pairs is None else pairs
+        return self.cube.totals(lo, hi, pairs)
+
+    def by_year(self, lo, hi, pairs):
+        return self.cube.by_year(lo, hi, pairs)
+
+    def match(self, mask_1, mask_2):
+        """Pairs with one end in ``mask_1`` and the other in ``mask_2``.
+
+        Returns ``(pairs, swapped)``: ``swapped`` is True where only the
+        (j, i) orientation matches, so callers can label the pair in the
+        order the filters were given.
+        """
+        i, j = self.pair_i, self.pair_j
+        forward = mask_1[i] & mask_2[j]
+        backward = mask_1[j] & mask_2[i]
+        pairs = np.flatnonzero(forward | backward)
+        return pairs, ~forward[pairs]
+
+    def top_partners(self, alias, lo, hi, k=10):
+        """``(partner codes, totals)`` of the k strongest partners of ``alias`` in [lo, hi)."""
+        pairs = self.pairs_of(alias)
+        totals = self.totals(lo, hi, pairs)
+        partners = np.where(self.pair_i[pairs] == alias, self.pair_j[pairs], self.pair_i[pairs])
+        keep = totals > 0
+        return _top_k(partners[keep], totals[keep], k)
+
+    def strongest_pairs(self, lo, hi, k=20, alias_mask=None):
+        """``(pair indices, totals)`` of the k strongest pairs with both ends in ``alias_mask``."""
+        if alias_mask is None:
+            pairs = np.arange(self.n_pairs)
+        else:
+            pairs = np.flatnonzero(alias_mask[self.pair_i] & alias_mask[self.pair_j])
+        totals = self.totals(lo, hi, pairs)
+        keep = totals > 0
+        return _top_k(pairs[keep], totals[keep], k)
+
+
+def _pair_keys(alias_row, alias_col, n_alias):
+    # Unordered pair -> lower code * n_alias + higher code; -1 where an end is missing.
+    row = np.asarray(alias_row).astype(np.int64)
+    col = np.asarray(alias_col).astype(np.int64)
+    valid = (row >= 0) & (col >= 0)
+    return np.where(valid, np.minimum(row, col) * n_alias + np.maximum(row, col), -1)
+
+
+def _one_orientation(alias_row, alias_col, month, n_alias, axis):
+    """Mask of the rows to keep, without the mirrored copies of pairs listed in both orientations.
+
+    An ``alias_row > alias_col`` row is dropped where the same pair and month
+    also has an ``alias_row <= alias_col`` row.
+    """
+    row = np.asarray(alias_row).astype(np.int64)
+    col = np.asarray(alias_col).astype(np.int64)
+    month = np.asarray(month)
+    valid = (row >= 0) & (col >= 0) & (month != MISSING_MONTH)
+    keys = np.where(valid, _pair_keys(row, col, n_alias) * max(axis.n, 1) + axis.index(month), -1)
+    forward = row <= col
+    return ~(valid & ~forward & np.isin(keys, keys[valid & forward]))
+
+
+def _top_k(ids, totals, k):
+    if len(totals) > k:
+        part = np.argpartition(-totals, k - 1)[:k]
+        ids, totals = ids[part], totals[part]
+    order = np.argsort(-totals, kind="stable")
+    return ids[order], totals[order]
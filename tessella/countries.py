@@ -0,0 +1,152 @@
+"""Country name -> ISO-3 code resolution for the Geo Map.
+
+Each distinct country string is resolved once, at dataset load, and the
+result is kept in a mapping table (``country_iso3.csv`` in the cache
+directory) shared by every dataset and process. Names are tried in order
+as an exact pycountry match, a known alias (``COUNTRY_ALIASES``), and a
+close fuzzy match on the pycountry names; anything left is reported as
+unresolved rather than dropped silently. Rows in the table can be edited by
+hand to fix or override a resolution; a row, resolved or not, is never looked
+up again, so deleting it is how a name gets retried.
+"""
+
+import csv
+import difflib
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+
+from tessella import columnar
+
+# Common spellings pycountry does not know, keyed by normalized name.
+COUNTRY_ALIASES = {
+    "uk": "GBR",
+    "great britain": "GBR",
+    "england": "GBR",
+    "scotland": "GBR",
+    "wales": "GBR",
+    "northern ireland": "GBR",
+    "usa": "USA",
+    "us": "USA",
+    "united states of america": "USA",
+    "uae": "ARE",
+    "russia": "RUS",
+    "turkey": "TUR",
+    "turkiye": "TUR",
+    "korea": "KOR",
+    "south korea": "KOR",
+    "republic of korea": "KOR",
+    "north korea": "PRK",
+    "peoples r china": "CHN",
+    "pr china": "CHN",
+    "macedonia": "MKD",
+    "ivory coast": "CIV",
+    "cote d ivoire": "CIV",
+    "cape verde": "CPV",
+    "swaziland": "SWZ",
+    "burma": "MMR",
+    "brunei": "BRN",
+    "palestine": "PSE",
+    "kosovo": "XKX",
+    "democratic republic of the congo": "COD",
+    "dr congo": "COD",
+    "republic of the congo": "COG",
+    "micronesia": "FSM",
+    "vatican": "VAT",
+    "vatican city": "VAT",
+    "macau": "MAC",
+    "macao": "MAC",
+}
+
+FUZZY_CUTOFF = 0.88
+
+MAPPING_FILE = "country_iso3.csv"
+
+_lock = threading.Lock()
+
+
+def normalize(name):
+    """Casefold, strip accents and punctuation, drop a leading "the"."""
+    name = unicodedata.normalize("NFKD", str(name))
+    name = "".join(ch for ch in name if not unicodedata.combining(ch))
+    name = name.casefold().replace("&", " and ")
+    name = re.sub(r"[^a-z0-9]+", " ", name).strip()
+    if name.startswith("the "):
+        name = name[4:]
+    return name
+
+
+def _pycountry_index():
+    import pycountry
+
+    index = {}
+    for c in pycountry.countries:
+        for attr in ("name", "official_name", "common_name", "alpha_3", "alpha_2"):
+            value = getattr(c, attr, None)
+            if value:
+                index.setdefault(normalize(value), c.alpha_3)
+    return index
+
+
+def resolve_name(name, index):
+    """``(iso3, method)`` for one country name; ``(None, "unresolved")`` if nothing matches."""
+    key = normalize(name)
+    if key in index:
+        return index[key], "exact"
+    if key in COUNTRY_ALIASES:
+        return COUNTRY_ALIASES[key], "alias"
+    close = difflib.get_close_matches(key, index.keys(), n=1, cutoff=FUZZY_CUTOFF)
+    if close:
+        return index[close[0]], "fuzzy"
+    return None, "unresolved"
+
+
+def mapping_path(cache_dir=None):
+    return os.path.join(cache_dir or columnar.CACHE_DIR, MAPPING_FILE)
+
+
+def read_mapping(path):
+    """``{country: (iso3, method)}`` from a mapping table; empty if missing."""
+    try:
+        with open(path, newline="", encoding="utf-8") as f:
+            return {row["country"]: (row["iso3"] or None, row["method"]) for row in csv.DictReader(f)}
+    except (OSError, KeyError, csv.Error):
+        return {}
+
+
+def write_mapping(path, mapping):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", suffix=".csv", dir=os.path.dirname(path))
+    with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["country", "iso3", "method"])
+        for country in sorted(mapping):
+            iso3, method = mapping[country]
+            writer.writerow([country, iso3 or "", method])
+    os.replace(tmp, path)
+
+
+def resolve_countries(names, cache_dir=None):
+    """Resolve country names to ISO-3 codes through the persisted mapping table.
+
+    Returns ``(iso3, unresolved)``: a list aligned with ``names`` (None where
+    unresolved) and the sorted unresolved names. Only names missing from the
+    table are looked up; the table is rewritten only when there were any.
+    """
+    path = mapping_path(cache_dir)
+    with _lock:
+        mapping = read_mapping(path)
+        todo = [name for name in set(names) if name not in mapping]
+        if todo:
+            index = _pycountry_index()
+            for name in todo:
+                mapping[name] = resolve_name(name, index)
+            try:
+                write_mapping(path, mapping)
+            except OSError:
+                pass
+    iso3 = [mapping[name][0] for name in names]
+    unresolved = sorted(name for name, code in zip(names, iso3) if code is None)
+    return iso3, unresolved
@@ -0,0 +1,485 @@
+"""Pre-aggregated entity x month count cubes, built once per dataset.
+
+Every tab used to filter the raw monthly rows by date, alias, country and
+cluster and then group by year on each rerun. The cubes here hold the same
+sums indexed by integer entity code (see tessella.columnar) and month bucket,
+stored as running totals along the month axis. A date range then becomes two
+column lookups and a filter becomes a row selection, so a query costs time
+proportional to the number of selected entities, not to the table size.
+"""
+
+import os
+
+import numpy as np
+
+from tessella import instrument
+from tessella.columnar import MISSING_MONTH
+from tessella.countries import resolve_countries
+from tessella.search import NameIndex
+
+# Members summed at a time by DenseCube.rollup, to bound its temporary copy.
+ROLLUP_CHUNK = 4096
+
+
+class MonthAxis:
+    """Contiguous range of month codes covered by a dataset."""
+
+    def __init__(self, first, last):
+        self.first = int(first)
+        self.n = int(last) - int(first) + 1
+        self.codes = np.arange(self.first, self.first + self.n, dtype=np.int32)
+        self.years = self.codes // 12 + 1970
+
+    @classmethod
+    def from_codes(cls, *code_arrays):
+        firsts = []
+        lasts = []
+        for codes in code_arrays:
+            codes = np.asarray(codes)
+            codes = codes[codes != MISSING_MONTH]
+            if len(codes):
+                firsts.append(codes.min())
+                lasts.append(codes.max())
+        if not firsts:
+            return cls(0, -1)
+        return cls(min(firsts), max(lasts))
+
+    def covering(self, *code_arrays):
+        """The smallest axis covering this one and the given month codes."""
+        edges = [np.array([self.first, self.first + self.n - 1], dtype=np.int64)] if self.n else []
+        return MonthAxis.from_codes(*edges, *code_arrays)
+
+    def index(self, codes):
+        return np.asarray(codes).astype(np.int64) - self.first
+
+    def span(self, date_range):
+        """Half-open bucket range [lo, hi) of the months inside ``date_range``.
+
+        Months are stored as their first day, so a range starting mid-month
+        begins with the following month, matching ``month >= start``.
+        """
+        lo, hi = 0, self.n
+        if date_range is None:
+            return lo, hi
+        start, end = date_range
+        if start is not None:
+            code = (start.year - 1970) * 12 + start.month - 1
+            if start.day > 1:
+                code += 1
+            lo = min(max(code - self.first, 0), self.n)
+        if end is not None:
+            code = (end.year - 1970) * 12 + end.month - 1
+            hi = min(max(code - self.first + 1, 0), self.n)
+        return lo, max(lo, hi)
+
+    def year_edges(self, lo, hi):
+        """Years touched by [lo, hi) and the bucket edges between them."""
+        years = self.years[lo:hi]
+        if not len(years):
+            return years, np.array([lo], dtype=np.int64)
+        starts = lo + np.flatnonzero(np.r_[True, years[1:] != years[:-1]])
+        return self.years[starts], np.r_[starts, hi].astype(np.int64)
+
+
+class TimeIndex:
+    """Row offsets of each month bucket in a table sorted by month.
+
+    Rows of buckets [lo, hi) are ``slice(offsets[lo], offsets[hi])``, found
+    once per table by binary search.
+    """
+
+    def __init__(self, months, axis):
+        self.offsets = np.searchsorted(months, axis.first + np.arange(axis.n + 1), side="left")
+
+    def rows(self, lo, hi):
+        return slice(int(self.offsets[lo]), int(self.offsets[hi]))
+
+
+def _valid_rows(entity, month):
+    return (np.asarray(month) != MISSING_MONTH) & (np.asarray(entity) >= 0)
+
+
+class DenseCube:
+    """Running totals for every entity x month, as an (n_entities, n_months + 1) array."""
+
+    def __init__(self, entity, month, values, n_entities, axis):
+        self.axis = axis
+        self.n_entities = n_entities
+        valid = _valid_rows(entity, month)
+        entity = np.asarray(entity)[valid].astype(np.int64)
+        values = np.asarray(values)[valid]
+        flat = entity * axis.n + axis.index(np.asarray(month)[valid])
+        counts = np.bincount(flat, weights=values, minlength=n_entities * axis.n).reshape(n_entities, axis.n)
+        dtype = np.int64 if np.issubdtype(values.dtype, np.integer) else np.float64
+        self.cum = np.zeros((n_entities, axis.n + 1), dtype=dtype)
+        self.cum[:, 1:] = np.cumsum(counts, axis=1)
+        # Entities that have at least one row, whatever the date range.
+        self.present = np.bincount(entity, minlength=n_entities) > 0
+
+    def updated(self, entity_map, n_entities, axis, entity, month, values):
+        """This cube with extra rows added, on a renumbered entity set and a wider axis.
+
+        ``entity_map`` gives each old entity's new code. Old running totals
+        are copied over (and carried forward into appended months); only the
+        rows of entities in the delta, from its first month on, are recomputed.
+        """
+        cube = DenseCube.__new__(DenseCube)
+        cube.axis = axis
+        cube.n_entities = n_entities
+        valid = _valid_rows(entity, month)
+        entity = np.asarray(entity)[valid].astype(np.int64)
+        values = np.asarray(values)[valid]
+        month = axis.index(np.asarray(month)[valid])
+        dtype = np.result_type(self.cum.dtype, np.int64 if np.issubdtype(values.dtype, np.integer) else np.float64)
+        cube.cum = np.zeros((n_entities, axis.n + 1), dtype=dtype)
+        shift = self.axis.first - axis.first if self.axis.n else 0
+        width = self.cum.shape[1]
+        cube.cum[entity_map, shift:shift + width] = self.cum
+        cube.cum[entity_map, shift + width:] = self.cum[:, -1:]
+        cube.present = np.zeros(n_entities, dtype=bool)
+        cube.present[entity_map] = self.present
+        if len(entity):
+            affected, row = np.unique(entity, return_inverse=True)
+            first = int(month.min())
+            span = axis.n - first
+            counts = np.bincount(row * span + (month - first), weights=values, minlength=len(affected) * span)
+            cube.cum[affected, first + 1:] += np.cumsum(counts.reshape(len(affected), span), axis=1).astype(dtype)
+            cube.present[affected] = True
+        return cube
+
+    def rollup(self, member_entity, member_group, n_groups):
+        """Cube of groups of entities (clusters of aliases): each group sums its members.
+
+        ``member_entity`` and ``member_group`` list the (entity, group)
+        memberships; an entity in several groups counts towards each.
+        """
+        cube = DenseCube.__new__(DenseCube)
+        cube.axis = self.axis
+        cube.n_entities = n_groups
+        cube.cum = np.zeros((n_groups, self.cum.shape[1]), dtype=self.cum.dtype)
+        order = np.argsort(member_group, kind="stable")
+        member_entity = np.asarray(member_entity)[order]
+        member_group = np.asarray(member_group)[order]
+        for start in range(0, len(order), ROLLUP_CHUNK):
+            group = member_group[start:start + ROLLUP_CHUNK]
+            groups, starts = np.unique(group, return_index=True)
+            cube.cum[groups] += np.add.reduceat(self.cum[member_entity[start:start + ROLLUP_CHUNK]], starts, axis=0)
+        cube.present = np.bincount(member_group, weights=self.present[member_entity], minlength=n_groups) > 0
+        return cube
+
+    def totals(self, lo, hi, entities=None):
+        cum = self.cum if entities is None else self.cum[entities]
+        return cum[:, hi] - cum[:, lo]
+
+    def by_year(self, lo, hi, entities=None):
+        """``(years, sums)`` with one row per entity and one column per year in [lo, hi)."""
+        years, edges = self.axis.year_edges(lo, hi)
+        cum = self.cum if entities is None else self.cum[entities]
+        return years, np.diff(cum[:, edges], axis=1)
+
+
+class SparseCube:
+    """Running totals for entity x month keys that actually occur.
+
+    Suited to entity spaces too large for a dense array (alias pairs). Keys
+    ``entity * n_months + month`` are kept sorted, so the sum for any set of
+    entities and bucket edges is found by binary search.
+    """
+
+    def __init__(self, entity, month, values, axis):
+        # Rows sharing an (entity, month) key are summed.
+        self.axis = axis
+        valid = _valid_rows(entity, month)
+        keys = np.asarray(entity)[valid].astype(np.int64) * axis.n + axis.index(np.asarray(month)[valid])
+        values = np.asarray(values)[valid]
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        values = values[order]
+        values = values.astype(np.int64 if np.issubdtype(values.dtype, np.integer) else np.float64)
+        self.keys, starts = np.unique(keys, return_index=True)
+        sums = np.add.reduceat(values, starts) if len(keys) else values
+        self._set(self.keys, sums)
+
+    def _set(self, keys, sums):
+        self.keys = keys
+        self.cum = np.r_[sums.dtype.type(0), np.cumsum(sums)]
+        self.entities = np.unique(self.keys // max(self.axis.n, 1))
+
+    def updated(self, entity_map, axis, entity, month, values):
+        """This cube plus extra rows, on renumbered entities and a wider axis.
+
+        ``entity_map`` is an array indexed by old entity code, or a function
+        of the old entity codes. The delta's rows are added to the old sums.
+        """
+        delta = SparseCube(entity, month, values, axis)
+        shift = self.axis.first - axis.first if self.axis.n else 0
+        old_n = max(self.axis.n, 1)
+        old_entity = self.keys // old_n
+        new_entity = entity_map(old_entity) if callable(entity_map) else np.asarray(entity_map, dtype=np.int64)[old_entity]
+        keys = np.asarray(new_entity, dtype=np.int64) * axis.n + (self.keys % old_n + shift)
+        sums = np.diff(self.cum)
+        delta_sums = np.diff(delta.cum)
+        all_keys = np.concatenate([keys, delta.keys])
+        order = np.argsort(all_keys, kind="stable")
+        all_keys = all_keys[order]
+        all_sums = np.concatenate([sums, delta_sums.astype(np.result_type(sums.dtype, delta_sums.dtype))])[order]
+        merged, starts = np.unique(all_keys, return_index=True)
+        cube = SparseCube.__new__(SparseCube)
+        cube.axis = axis
+        cube._set(merged, np.add.reduceat(all_sums, starts) if len(all_keys) else all_sums)
+        return cube
+
+    def _at(self, entities, edges):
+        entities = np.asarray(entities, dtype=np.int64)
+        pos = np.searchsorted(self.keys, entities[:, None] * self.axis.n + edges[None, :])
+        return self.cum[pos]
+
+    def totals(self, lo, hi, entities):
+        at = self._at(entities, np.array([lo, hi], dtype=np.int64))
+        return at[:, 1] - at[:, 0]
+
+    def by_year(self, lo, hi, entities):
+        years, edges = self.axis.year_edges(lo, hi)
+        return years, np.diff(self._at(entities, edges), axis=1)
+
+
+def expand_memberships(alias_codes, member_alias, member_cluster):
+    """Pair each row's alias with every cluster it belongs to.
+
+    Returns ``(row_index, cluster_code)``; rows whose alias has no cluster
+    are dropped, rows whose alias has several clusters are repeated, like
+    a left merge on ``alias`` followed by dropping missing clusters.
+    """
+    alias_codes = np.asarray(alias_codes).astype(np.int64)
+    n_alias = int(max(alias_codes.max(initial=-1), np.max(member_alias, initial=-1))) + 1
+    order = np.argsort(member_alias, kind="stable")
+    member_alias = np.asarray(member_alias)[order]
+    member_cluster = np.asarray(member_cluster)[order]
+    offsets = np.r_[0, np.cumsum(np.bincount(member_alias, minlength=n_alias))]
+    safe = np.where(alias_codes >= 0, alias_codes, 0)
+    degree = np.where(alias_codes >= 0, offsets[safe + 1] - offsets[safe], 0)
+    rows = np.repeat(np.arange(len(alias_codes)), degree)
+    # Position of each repeated row within its alias's membership list.
+    within = np.arange(len(rows)) - np.repeat(np.cumsum(degree) - degree, degree)
+    return rows, member_cluster[offsets[safe[rows]] + within]
+
+
+class Cubes:
+    """All cubes and code lookups of one dataset."""
+
+    def __init__(self, dataset):
+        arrays = dataset.arrays
+        vocabs = dataset.vocabs
+        # Dataset version these cubes belong to, for caches of derived results.
+        self.key = dataset.key
+        self.alias_names = np.asarray(vocabs.get("alias", []), dtype=object)
+        self.country_names = np.asarray(vocabs.get("country", []), dtype=object)
+        self.cluster_names = np.asarray(vocabs.get("cluster_name", []), dtype=object)
+        # Built lazily by name_index() when the sidebar first searches a vocabulary.
+        self._name_indexes = {}
+        n_alias = len(self.alias_names)
+        n_country = len(self.country_names)
+        n_cluster = len(self.cluster_names)
+        self.axis = MonthAxis.from_codes(*[
+            arrays[name]["month"] for name in ("occ", "coocc", "country")
+            if _has(arrays, name, ["month"])
+        ])
+        self.time_index = {
+            name: TimeIndex(arrays[name]["month"], self.axis)
+            for name in ("occ", "coocc", "country")
+            if _has(arrays, name, ["month"])
+        }
+
+        # alias code -> cluster code. ``alias_cluster`` keeps one cluster per
+        # alias (the last listed, as dict(zip(alias, cluster_name)) would);
+        # the member_* arrays keep every (alias, cluster) membership.
+        self.alias_cluster = np.full(n_alias, -1, dtype=np.int32)
+        self.member_alias = np.zeros(0, dtype=np.int64)
+        self.member_cluster = np.zeros(0, dtype=np.int64)
+        if _has(arrays, "fact_alias_cluster", ["alias", "cluster_name"]):
+            fact = arrays["fact_alias_cluster"]
+            ok = (np.asarray(fact["alias"]) >= 0) & (np.asarray(fact["cluster_name"]) >= 0)
+            self.member_alias = np.asarray(fact["alias"])[ok].astype(np.int64)
+            self.member_cluster = np.asarray(fact["cluster_name"])[ok].astype(np.int64)
+            self.alias_cluster[self.member_alias] = self.member_cluster
+
+        self.occ = None
+        if _has(arrays, "occ", ["alias", "month", "occurrence"]):
+            t = arrays["occ"]
+            with instrument.stage("occurrence cube"):
+                self.occ = DenseCube(t["alias"], t["month"], t["occurrence"], n_alias, self.axis)
+
+        self.coocc = None
+        if _has(arrays, "coocc", ["alias_row", "alias_col", "month", "cooccurrence"]):
+            # Imported here: tessella.cooccurrence builds on SparseCube above.
+            from tessella.cooccurrence import CooccurrenceMatrix
+            t = arrays["coocc"]
+            with instrument.stage("co-occurrence matrix"):
+                self.coocc = CooccurrenceMatrix(t["alias_row"], t["alias_col"], t["month"], t["cooccurrence"], n_alias, self.axis)
+
+        self.country = None
+        self.country_cluster = None
+        self.country_alias = None
+        if _has(arrays, "country", ["alias", "country", "month", "occurrence"]):
+            t = arrays["country"]
+            with instrument.stage("country cubes"):
+                self.country = DenseCube(t["country"], t["month"], t["occurrence"], n_country, self.axis)
+                # country code -> ISO-3 code (None when unresolved), once per dataset.
+                cache_dir = os.path.dirname(dataset.path) if dataset.path else None
+                iso3, self.unresolved_countries = resolve_countries(self.country_names.tolist(), cache_dir)
+                self.country_iso3 = np.asarray(iso3, dtype=object)
+                # (country, alias) pairs that occur, for the Sankey's cluster -> alias level.
+                country_alias = np.where(
+                    np.asarray(t["alias"]) >= 0, np.asarray(t["country"]).astype(np.int64) * n_alias + np.asarray(t["alias"]), -1,
+                )
+                self.country_alias = SparseCube(country_alias, t["month"], t["occurrence"], self.axis)
+                if len(self.member_alias):
+                    rows, clusters = expand_memberships(t["alias"], self.member_alias, self.member_cluster)
+                    countries = np.asarray(t["country"])[rows].astype(np.int64)
+                    entity = np.where(countries >= 0, countries * n_cluster + clusters, -1)
+                    self.country_cluster = DenseCube(
+                        entity, np.asarray(t["month"])[rows], np.asarray(t["occurrence"])[rows],
+                        n_country * n_cluster, self.axis,
+                    )
+
+        self._cluster_rollups()
+
+    def _cluster_rollups(self):
+        """Cluster index and cluster-level cubes, rolled up from the alias cubes.
+
+        ``cluster_offsets``/``cluster_members`` list each cluster's alias codes
+        (CSR layout). ``cluster_occ`` holds cluster x month occurrence and
+        ``cluster_coocc`` cluster x cluster x month co-occurrence, with an
+        alias in several clusters counting towards each (the diagonal holds
+        pairs within one cluster). They are None without cluster memberships.
+        """
+        n_cluster = len(self.cluster_names)
+        # Repeated (alias, cluster) rows in fact_alias_cluster count once.
+        membership = np.unique(np.column_stack([self.member_cluster, self.member_alias]).reshape(-1, 2), axis=0)
+        self.cluster_members = membership[:, 1]
+        self.cluster_offsets = np.r_[0, np.cumsum(np.bincount(membership[:, 0], minlength=n_cluster))]
+        self.cluster_occ = None
+        self.cluster_coocc = None
+        if not len(membership):
+            return
+        with instrument.stage("cluster rollups"):
+            if self.occ is not None:
+                self.cluster_occ = self.occ.rollup(membership[:, 1], membership[:, 0], n_cluster)
+            if self.coocc is not None:
+                self.cluster_coocc = self.coocc.rollup(membership[:, 1], membership[:, 0], n_cluster)
+
+    def updated(self, dataset, code_maps, delta):
+        """Cubes of ``dataset``, which is this cubes' dataset plus the ``delta`` tables.
+
+        ``code_maps`` maps each vocabulary to an array giving every old code
+        its new code; ``delta`` holds the added rows' column arrays, already
+        in the new codes. Only the entities and months the delta touches are
+        recomputed. A delta that changes cluster memberships, or adds a
+        table the old dataset lacked, rebuilds everything.
+        """
+        if _has(delta, "fact_alias_cluster", ["alias"]) and len(delta["fact_alias_cluster"]["alias"]):
+            return Cubes(dataset)
+        for name, cube in (("occ", self.occ), ("coocc", self.coocc), ("country", self.country)):
+            if cube is None and _has(delta, name, ["month"]) and len(delta[name]["month"]):
+                return Cubes(dataset)
+        empty = np.zeros(0, dtype=np.int64)
+        alias_map = code_maps.get("alias", empty)
+        country_map = code_maps.get("country", empty)
+        cluster_map = code_maps.get("cluster_name", empty)
+
+        cubes = Cubes.__new__(Cubes)
+        cubes.__dict__.update(self.__dict__)
+        cubes._name_indexes = {}
+        cubes.key = dataset.key
+        vocabs = dataset.vocabs
+        cubes.alias_names = np.asarray(vocabs.get("alias", []), dtype=object)
+        cubes.country_names = np.asarray(vocabs.get("country", []), dtype=object)
+        cubes.cluster_names = np.asarray(vocabs.get("cluster_name", []), dtype=object)
+        n_alias = len(cubes.alias_names)
+        n_country = len(cubes.country_names)
+        n_cluster = len(cubes.cluster_names)
+        cubes.axis = self.axis.covering(*[
+            delta[name]["month"] for name in ("occ", "coocc", "country") if _has(delta, name, ["month"])
+        ])
+        cubes.time_index = {
+            name: TimeIndex(dataset.arrays[name]["month"], cubes.axis)
+            for name in ("occ", "coocc", "country")
+            if _has(dataset.arrays, name, ["month"])
+        }
+        cubes.alias_cluster = np.full(n_alias, -1, dtype=np.int32)
+        cubes.alias_cluster[alias_map] = self.alias_cluster
+        cubes.member_alias = alias_map[self.member_alias] if len(self.member_alias) else self.member_alias
+        cubes.member_cluster = cluster_map[self.member_cluster] if len(self.member_cluster) else self.member_cluster
+
+        def rows(name, columns):
+            if _has(delta, name, columns):
+                return [delta[name][col] for col in columns]
+            return [np.zeros(0, dtype=np.int64) for _ in columns]
+
+        if self.occ is not None:
+            alias, month, values = rows("occ", ["alias", "month", "occurrence"])
+            with instrument.stage("occurrence cube"):
+                cubes.occ = self.occ.updated(alias_map, n_alias, cubes.axis, alias, month, values)
+        if self.coocc is not None:
+            alias_row, alias_col, month, values = rows("coocc", ["alias_row", "alias_col", "month", "cooccurrence"])
+            with instrument.stage("co-occurrence matrix"):
+                cubes.coocc = self.coocc.updated(alias_map, n_alias, cubes.axis, alias_row, alias_col, month, values)
+        if self.country is not None:
+            alias, country, month, values = rows("country", ["alias", "country", "month", "occurrence"])
+            alias = np.asarray(alias).astype(np.int64)
+            country = np.asarray(country).astype(np.int64)
+            with instrument.stage("country cubes"):
+                cubes.country = self.country.updated(country_map, n_country, cubes.axis, country, month, values)
+                cache_dir = os.path.dirname(dataset.path) if dataset.path else None
+                iso3, cubes.unresolved_countries = resolve_countries(cubes.country_names.tolist(), cache_dir)
+                cubes.country_iso3 = np.asarray(iso3, dtype=object)
+                old_n_alias = max(len(self.alias_names), 1)
+                cubes.country_alias = self.country_alias.updated(
+                    lambda key: country_map[key // old_n_alias] * n_alias + alias_map[key % old_n_alias], cubes.axis,
+                    np.where((alias >= 0) & (country >= 0), country * n_alias + alias, -1), month, values,
+                )
+                if self.country_cluster is not None:
+                    member_rows, clusters = expand_memberships(alias, cubes.member_alias, cubes.member_cluster)
+                    entity = np.where(country[member_rows] >= 0, country[member_rows] * n_cluster + clusters, -1)
+                    cell_map = (country_map[:, None] * n_cluster + cluster_map[None, :]).ravel()
+                    cubes.country_cluster = self.country_cluster.updated(
+                        cell_map, n_country * n_cluster, cubes.axis,
+                        entity, np.asarray(month)[member_rows], np.asarray(values)[member_rows],
+                    )
+        # Cheap next to the alias cubes: one pass over memberships and pair cells.
+        cubes._cluster_rollups()
+        return cubes
+
+    def name_index(self, vocab):
+        """Search index (tessella.search.NameIndex) over ``alias``, ``country`` or ``cluster`` names, built on first use."""
+        index = self._name_indexes.get(vocab)
+        if index is None:
+            index = self._name_indexes[vocab] = NameIndex(getattr(self, vocab + "_names"))
+        return index
+
+    def cluster_aliases(self, cluster):
+        """Codes of the aliases in cluster code ``cluster``."""
+        return self.cluster_members[self.cluster_offsets[cluster]:self.cluster_offsets[cluster + 1]]
+
+    def alias_codes(self, names):
+        return _codes(self.alias_names, names)
+
+    def country_codes(self, names):
+        return _codes(self.country_names, names)
+
+    def cluster_codes(self, names):
+        return _codes(self.cluster_names, names)
+
+
+def _has(arrays, name, columns):
+    return name in arrays and all(col in arrays[name] for col in columns)
+
+
+def _codes(vocab_names, names):
+    # Vocabularies are sorted, so codes can be found by binary search.
+    names = np.asarray(list(names), dtype=object)
+    if not len(names) or not len(vocab_names):
+        return np.zeros(0, dtype=np.int64)
+    pos = np.searchsorted(vocab_names, names)
+    pos = np.minimum(pos, len(vocab_names) - 1)
+    return pos[vocab_names[pos] == names]
@@ -0,0 +1,291 @@
+"""Content-addressed dataset loading.
+
+A dataset (an uploaded ZIP or the bundled demo_data folder) is identified by
+the SHA-256 of its bytes. Each distinct dataset is streamed once through the
+schema-validated ingestion (see tessella.ingest) into the columnar cache
+format (see tessella.columnar) and memory-mapped from there; later processes
+skip the CSV parsing entirely. The resulting DataFrames are handed to every
+rerun and every session. They are shared, so callers must treat them as
+read-only and copy before adding columns.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from tessella import columnar, ingest
+from tessella.cache import LRUCache
+from tessella.cubes import Cubes
+
+if int(pd.__version__.split(".")[0]) < 3:
+    # Derived frames never write back into the shared cached ones.
+    pd.set_option("mode.copy_on_write", True)
+
+DEMO_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "demo_data")
+
+# Attribute name -> file name expected inside the ZIP / demo folder.
+TABLE_FILES = {
+    "occ": "lookup_occurrence.csv",
+    "coocc": "lookup_cooccurrence.csv",
+    "country": "lookup_country_occurrence.csv",
+    "fact_alias_cluster": "fact_alias_cluster.csv",
+}
+
+DATASET_CACHE_ENTRIES = int(os.environ.get("TESSELLA_DATASET_CACHE_ENTRIES", "4"))
+DATASET_CACHE_MB = int(os.environ.get("TESSELLA_DATASET_CACHE_MB", "4096"))
+
+
+class Dataset:
+    """The four lookup tables of one dataset plus load diagnostics."""
+
+    def __init__(self, key, tables, missing_files, empty_files, arrays=None, vocabs=None, path=None, validation=None,
+                 meta=None, version=1, source=None, deltas=()):
+        self.key = key
+        # Version 1 is the upload itself; each applied delta (see
+        # tessella.incremental) adds one. ``source`` is the key of the upload
+        # and ``deltas`` the keys of the deltas applied on top of it.
+        self.version = version
+        self.source = source or key
+        self.deltas = list(deltas)
+        # Raw column arrays (codes, month codes, counts) and vocabularies of
+        # the columnar format; memory-mapped when loaded from the cache dir.
+        self.arrays = arrays
+        self.vocabs = vocabs
+        self.meta = meta
+        self.path = path
+        self.occ = tables.get("occ")
+        self.coocc = tables.get("coocc")
+        self.country = tables.get("country")
+        self.fact_alias_cluster = tables.get("fact_alias_cluster")
+        self.missing_files = missing_files
+        self.empty_files = empty_files
+        # File name -> {"rows", "invalid_rows", "errors"} from ingestion.
+        self.validation = validation or {}
+        self.date_bounds = _date_bounds([
+            arrays[name]["month"] for name in ("occ", "coocc", "country")
+            if arrays is not None and name in arrays and "month" in arrays[name]
+        ])
+        self._cubes = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_columnar(cls, key, path, mmap_mode="r"):
+        tables, arrays, vocabs, info = columnar.read_dataset(path, mmap_mode)
+        return cls(
+            key, tables, info["missing_files"], info["empty_files"], arrays=arrays, vocabs=vocabs,
+            path=path if mmap_mode else None, validation=info.get("validation"), meta=info["tables"],
+            version=info.get("version", 1), source=info.get("source"), deltas=info.get("deltas", ()),
+        )
+
+    def cubes(self):
+        """Pre-aggregated cubes (tessella.cubes.Cubes), built on first use."""
+        with self._lock:
+            if self._cubes is None:
+                self._cubes = Cubes(self)
+            return self._cubes
+
+    def rows_in_range(self, name, date_range):
+        """Rows of table ``name`` inside ``date_range``, as a slice of the shared table.
+
+        The span is found by binary search on the month-sorted rows, so no
+        mask is built and nothing is copied.
+        """
+        cubes = self.cubes()
+        lo, hi = cubes.axis.span(date_range)
+        return self.tables()[name].iloc[cubes.time_index[name].rows(lo, hi)]
+
+    def tables(self):
+        return {name: getattr(self, name) for name in TABLE_FILES}
+
+    @property
+    def nbytes(self):
+        return sum(int(df.memory_usage(deep=True).sum()) for df in self.tables().values() if df is not None)
+
+
+def _date_bounds(month_arrays):
+    # Tables are sorted by month with missing months first, so the bounds
+    # are the first valid and the last entry of each month column.
+    firsts = []
+    lasts = []
+    for months in month_arrays:
+        start = np.searchsorted(months, columnar.MISSING_MONTH, side="right")
+        if start < len(months):
+            firsts.append(int(months[start]))
+            lasts.append(int(months[-1]))
+    if not firsts:
+        return (None, None)
+    first, last = columnar.month_datetimes([min(firsts), max(lasts)])
+    return (pd.Timestamp(first).date(), pd.Timestamp(last).date())
+
+
+def _hash_file(path, h):
+    with open(path, "rb") as f:
+        _hash_stream(f, h)
+
+
+def _hash_stream(f, h):
+    for block in iter(lambda: f.read(1 << 20), b""):
+        h.update(block)
+
+
+# (path, size, mtime) of every demo file -> content hash, so reruns do not
+# re-read the demo folder just to find out it has not changed.
+_dir_key_memo = {}
+# Streamlit upload file_id -> content hash, so reruns do not rehash the ZIP.
+_upload_key_memo = LRUCache(max_entries=64)
+
+
+def source_key(zip_file=None, demo_dir=DEMO_DATA_DIR):
+    """Return the content hash identifying an uploaded ZIP or the demo folder.
+
+    ``zip_file`` is raw bytes or a seekable binary file object, which is
+    hashed in blocks and rewound.
+    """
+    h = hashlib.sha256()
+    if zip_file is not None:
+        h.update(b"zip\0")
+        if isinstance(zip_file, (bytes, bytearray)):
+            h.update(zip_file)
+        else:
+            zip_file.seek(0)
+            _hash_stream(zip_file, h)
+            zip_file.seek(0)
+        return h.hexdigest()
+    stamp = []
+    for filename in sorted(TABLE_FILES.values()):
+        path = os.path.join(demo_dir, filename)
+        try:
+            info = os.stat(path)
+            stamp.append((path, info.st_size, info.st_mtime_ns))
+        except OSError:
+            stamp.append((path, None, None))
+    stamp = tuple(stamp)
+    if stamp in _dir_key_memo:
+        return _dir_key_memo[stamp]
+    h.update(b"dir\0")
+    for path, size, _ in stamp:
+        h.update(os.path.basename(path).encode() + b"\0")
+        if size is not None:
+            _hash_file(path, h)
+    _dir_key_memo[stamp] = h.hexdigest()
+    return _dir_key_memo[stamp]
+
+
+def _ingest(path, zip_file, demo_dir, progress):
+    """Stream the CSVs of a ZIP (members are decompressed as they are read) or the demo folder into ``path``."""
+    if zip_file is None:
+        def open_demo(filename):
+            full = os.path.join(demo_dir, filename)
+            if not os.path.isfile(full):
+                return None
+            return open(full, "rb"), os.path.getsize(full)
+
+        return ingest.ingest(path, TABLE_FILES, open_demo, progress)
+
+    zip_file.seek(0)
+    with zipfile.ZipFile(zip_file) as z:
+        members = {info.filename: info for info in z.infolist()}
+
+        def open_member(filename):
+            if filename not in members:
+                return None
+            return z.open(members[filename]), members[filename].file_size
+
+        return ingest.ingest(path, TABLE_FILES, open_member, progress)
+
+
+_dataset_cache = LRUCache(
+    max_entries=DATASET_CACHE_ENTRIES,
+    max_bytes=DATASET_CACHE_MB * 1024 * 1024,
+    sizeof=lambda ds: ds.nbytes,
+)
+
+
+def dataset_cache():
+    return _dataset_cache
+
+
+def _head_path(source, cache_dir=None):
+    return columnar.dataset_path(source, cache_dir) + ".head"
+
+
+def head(source, cache_dir=None):
+    """Key of the latest version of the dataset from ``source`` (the source key when no delta was applied)."""
+    try:
+        with open(_head_path(source, cache_dir)) as f:
+            key = f.read().strip()
+    except OSError:
+        return source
+    return key if key and columnar.exists(columnar.dataset_path(key, cache_dir)) else source
+
+
+def set_head(source, key, cache_dir=None):
+    """Make ``key`` the version loaded for ``source`` from now on (best effort)."""
+    path = _head_path(source, cache_dir)
+    try:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(key)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def default_data_dir():
+    """Folder loaded when nothing is uploaded: ``TESSELLA_DATA_DIR``, else the bundled demo data."""
+    return os.environ.get("TESSELLA_DATA_DIR") or DEMO_DATA_DIR
+
+
+def load_dataset(uploaded_zip=None, demo_dir=None, cache_dir=None, progress=None):
+    """Load (or fetch from cache) the dataset for an uploaded ZIP or the demo folder.
+
+    ``uploaded_zip`` is a Streamlit UploadedFile, any seekable binary file
+    object, or raw bytes; ``None`` selects the demo folder (``demo_dir``,
+    default ``default_data_dir()``). ``cache_dir`` overrides the columnar
+    cache location (``TESSELLA_CACHE_DIR``).
+    ``progress(filename, fraction)`` is called while a new dataset is read.
+    When monthly deltas have been appended (tessella.incremental), the
+    latest version is loaded.
+    """
+    demo_dir = demo_dir or default_data_dir()
+    if isinstance(uploaded_zip, (bytes, bytearray)):
+        zip_file = io.BytesIO(uploaded_zip)
+    else:
+        zip_file = uploaded_zip
+    file_id = getattr(uploaded_zip, "file_id", None)
+    if file_id is not None:
+        key = _upload_key_memo.get(file_id)
+        if key is None:
+            key = source_key(zip_file)
+            _upload_key_memo.put(file_id, key)
+    else:
+        key = source_key(zip_file, demo_dir)
+
+    def build():
+        latest = head(key, cache_dir)
+        if latest != key:
+            return Dataset.from_columnar(latest, columnar.dataset_path(latest, cache_dir))
+        path = columnar.dataset_path(key, cache_dir)
+        if columnar.exists(path):
+            return Dataset.from_columnar(key, path)
+        try:
+            _ingest(path, zip_file, demo_dir, progress)
+        except OSError:
+            # Cache directory not writable: build in a temporary directory
+            # and keep the dataset in memory instead.
+            tmp = tempfile.mkdtemp(prefix="tessella-")
+            try:
+                _ingest(os.path.join(tmp, key), zip_file, demo_dir, progress)
+                return Dataset.from_columnar(key, os.path.join(tmp, key), mmap_mode=None)
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+        return Dataset.from_columnar(key, path)
+
+    return _dataset_cache.get_or_create(key, build)
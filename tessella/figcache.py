@@ -0,0 +1,84 @@
+"""Server-wide cache of built figures, keyed on the state they were built from.
+
+Building a figure (above all the animated choropleth, which has one frame
+per year) costs far more than reading it back from its JSON. Every figure a
+tab draws is therefore stored as its serialized payload under a key made of
+the dataset version, the tab and a canonical hash of everything that went
+into it: filters, date range, color scale and bounds, axis scale. Going back
+to a tab, or to a filter state anyone on the server has seen before, reuses
+the payload instead of rebuilding the figure.
+
+Filters are canonicalized before hashing, so the order in which options
+were picked in a multiselect does not matter, and dates, numpy scalars and
+tuples hash the same as their plain equivalents. The cache holds at most
+``TESSELLA_FIGURE_CACHE_ENTRIES`` figures (default 64) and
+``TESSELLA_FIGURE_CACHE_MB`` of JSON (default 256), evicting the least
+recently used.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+
+import numpy as np
+import plotly.io as pio
+
+from tessella.cache import LRUCache
+
+FIGURE_CACHE_ENTRIES = int(os.environ.get("TESSELLA_FIGURE_CACHE_ENTRIES", "64"))
+FIGURE_CACHE_MB = int(os.environ.get("TESSELLA_FIGURE_CACHE_MB", "256"))
+
+_figure_cache = LRUCache(
+    max_entries=FIGURE_CACHE_ENTRIES,
+    max_bytes=FIGURE_CACHE_MB * 1024 * 1024,
+    sizeof=len,
+)
+
+
+def figure_cache():
+    return _figure_cache
+
+
+def _canonical(value):
+    """JSON-ready value where equal filter states give equal results."""
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (set, frozenset)):
+        return sorted((_canonical(v) for v in value), key=json.dumps)
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def filter_hash(**state):
+    """Hash of a tab's widget state. Pass selections as sets when their order does not matter."""
+    payload = json.dumps(_canonical(state), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def figure_key(dataset, tab, **state):
+    """Cache key of a figure: dataset version (its key changes with every update), tab and state hash."""
+    return (dataset.key, tab, filter_hash(**state))
+
+
+def cached_figure(key, build):
+    """The figure stored under ``key``, or ``build()``'s result, which is then stored.
+
+    Concurrent sessions asking for the same missing figure build it once.
+    Only a hit parses the stored JSON; the caller that built the figure
+    gets it back as is.
+    """
+    built = []
+
+    def build_payload():
+        figure = build()
+        built.append(figure)
+        return figure.to_json()
+
+    payload = _figure_cache.get_or_create(key, build_payload)
+    return built[0] if built else pio.from_json(payload)
@@ -0,0 +1,144 @@
+"""Co-occurrence heatmap cells, aggregated on the server to a bounded grid.
+
+Rows and columns are alias (or cluster) codes laid out in cluster order:
+each alias is placed under the first cluster it is listed in, aliases of a
+cluster are kept together (A-Z within it) and aliases in no cluster come
+last, so each cluster is a contiguous block on both axes. The axes are then
+cut into at most ``bins`` bins of nearly equal size and every pair adds its
+total for the date range to the cell of its row and column bins, so the
+payload is ``bins x bins`` numbers however many aliases there are. Pairs
+are unordered: a pair whose ends are both on each axis fills both of its
+cells, and the full matrix is symmetric.
+
+Drilling down is choosing other axes: the aliases of one cluster for rows
+and/or columns, and a range of positions on each axis, which is binned
+again at the same resolution.
+"""
+
+import os
+
+import numpy as np
+
+from tessella.cache import LRUCache
+
+HEATMAP_BINS = int(os.environ.get("TESSELLA_HEATMAP_BINS", "200"))
+
+_order_cache = LRUCache(max_entries=8)
+
+
+class HeatmapGrid:
+    """Binned pair totals: ``z[r, c]`` sums the pairs between row bin r and column bin c.
+
+    ``row_edges``/``col_edges`` are the bins' boundaries as positions on
+    each axis; ``row_blocks``/``col_blocks`` list ``(bin, cluster name)``
+    where a cluster's block starts, when the axis is in cluster order.
+    """
+
+    def __init__(self, z, row_labels, col_labels, row_edges, col_edges, row_blocks, col_blocks):
+        self.z = z
+        self.row_labels = row_labels
+        self.col_labels = col_labels
+        self.row_edges = row_edges
+        self.col_edges = col_edges
+        self.row_blocks = row_blocks
+        self.col_blocks = col_blocks
+
+    @property
+    def empty(self):
+        return not self.z.any()
+
+    @property
+    def cell_size(self):
+        """Most entries per row bin and per column bin (1 means no downsampling)."""
+        return int(np.diff(self.row_edges).max(initial=1)), int(np.diff(self.col_edges).max(initial=1))
+
+
+def cluster_order(cubes):
+    """``(alias codes in cluster order, cluster code of each position or -1)``, cached per dataset version."""
+
+    def build():
+        n_alias = len(cubes.alias_names)
+        primary = np.full(n_alias, -1, dtype=np.int64)
+        if len(cubes.cluster_members):
+            member_cluster = np.repeat(np.arange(len(cubes.cluster_offsets) - 1), np.diff(cubes.cluster_offsets))
+            # Memberships are grouped by cluster code, so the first one of an alias is its lowest cluster.
+            aliases, first = np.unique(cubes.cluster_members, return_index=True)
+            primary[aliases] = member_cluster[first]
+        order = np.lexsort((np.arange(n_alias), np.where(primary < 0, n_alias, primary)))
+        return order, primary[order]
+
+    return _order_cache.get_or_create(cubes.key, build)
+
+
+def bin_edges(n, bins=HEATMAP_BINS):
+    """Boundaries of at most ``bins`` nearly equal bins over positions 0..n."""
+    return np.unique(np.linspace(0, n, min(n, bins) + 1).round().astype(np.int64))
+
+
+def _labels(names, entities, edges):
+    first = names[entities[edges[:-1]]]
+    last = names[entities[edges[1:] - 1]]
+    sizes = np.diff(edges)
+    return np.array([
+        str(a) if size == 1 else f"{a} … {b} ({size})" for a, b, size in zip(first, last, sizes)
+    ], dtype=object)
+
+
+def _blocks(clusters, edges, cluster_names):
+    if clusters is None or not len(clusters):
+        return []
+    starts = np.flatnonzero(np.r_[True, clusters[1:] != clusters[:-1]])
+    starts = starts[clusters[starts] >= 0]
+    bins = np.searchsorted(edges, starts, side="right") - 1
+    return [(int(b), str(cluster_names[clusters[s]])) for b, s in zip(bins, starts)]
+
+
+def build_heatmap(cubes, date_range, level="alias", rows=None, cols=None, row_range=None, col_range=None,
+                  bins=HEATMAP_BINS):
+    """Binned co-occurrence of ``rows`` x ``cols`` in ``date_range``.
+
+    ``level`` is "alias" (``cubes.coocc``) or "cluster" (``cubes.cluster_coocc``).
+    ``rows``/``cols`` are the entity codes on each axis, in display order
+    (default: every alias in cluster order, or every cluster); ``row_range``
+    and ``col_range`` are optional ``(start, stop)`` positions to zoom into.
+    """
+    if level == "cluster":
+        matrix, names = cubes.cluster_coocc, cubes.cluster_names
+        default, default_clusters = np.arange(len(names)), None
+    else:
+        matrix, names = cubes.coocc, cubes.alias_names
+        default, default_clusters = cluster_order(cubes)
+    axes = []
+    for entities, zoom in ((rows, row_range), (cols, col_range)):
+        clusters = default_clusters if entities is None else None
+        entities = default if entities is None else np.asarray(entities, dtype=np.int64)
+        if zoom is not None:
+            entities = entities[zoom[0]:zoom[1]]
+            clusters = None if clusters is None else clusters[zoom[0]:zoom[1]]
+        axes.append((entities, clusters))
+    (rows, row_clusters), (cols, col_clusters) = axes
+
+    row_pos = np.full(matrix.n_alias, -1, dtype=np.int64)
+    row_pos[rows] = np.arange(len(rows))
+    col_pos = np.full(matrix.n_alias, -1, dtype=np.int64)
+    col_pos[cols] = np.arange(len(cols))
+    i, j = matrix.pair_i, matrix.pair_j
+    forward = (row_pos[i] >= 0) & (col_pos[j] >= 0)
+    backward = (row_pos[j] >= 0) & (col_pos[i] >= 0) & (i != j)
+    pairs = np.flatnonzero(forward | backward)
+    lo, hi = matrix.axis.span(date_range)
+    totals = matrix.totals(lo, hi, pairs)
+    fwd, bwd = forward[pairs], backward[pairs]
+    r = np.concatenate([row_pos[i[pairs[fwd]]], row_pos[j[pairs[bwd]]]])
+    c = np.concatenate([col_pos[j[pairs[fwd]]], col_pos[i[pairs[bwd]]]])
+    w = np.concatenate([totals[fwd], totals[bwd]]).astype(np.float64)
+
+    row_edges = bin_edges(len(rows), bins)
+    col_edges = bin_edges(len(cols), bins)
+    n_r, n_c = max(len(row_edges) - 1, 0), max(len(col_edges) - 1, 0)
+    cell = (np.searchsorted(row_edges, r, side="right") - 1) * n_c + np.searchsorted(col_edges, c, side="right") - 1
+    z = np.bincount(cell, weights=w, minlength=n_r * n_c).reshape(n_r, n_c)
+    return HeatmapGrid(
+        z, _labels(names, rows, row_edges), _labels(names, cols, col_edges), row_edges, col_edges,
+        _blocks(row_clusters, row_edges, cubes.cluster_names), _blocks(col_clusters, col_edges, cubes.cluster_names),
+    )
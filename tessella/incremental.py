@@ -0,0 +1,196 @@
+"""Append a monthly delta to a cached dataset without rebuilding it.
+
+A delta is a ZIP (or folder) holding new rows for any of the lookup tables,
+in the same format as a full upload. It is ingested on its own and merged
+into the base dataset's columns: vocabularies are widened, old codes are
+renumbered, and rows are re-sorted only from the delta's first month on.
+The result is written as a new version next to the base. If the base's
+cubes are built, the new version's are derived from them, recomputing only
+the entities and months the delta touches (see ``Cubes.updated``).
+
+A delta must only hold months the base has no rows for: its counts would
+otherwise be added on top of the existing ones, so ``append_delta`` rejects
+a delta that overlaps. The merge still concatenates every column, so
+writing a version costs time proportional to the whole dataset; what it
+saves over a rebuild is parsing the CSVs again and re-sorting the old rows.
+
+Each version has its own key (the hash of the base key and the delta), so
+anything cached per dataset key is invalidated exactly when a delta is
+applied. The source (upload or demo folder) points at its latest version
+through a ``<source key>.head`` file in the cache directory, and a delta
+that was already applied is skipped.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from tessella import columnar, instrument
+from tessella.dataset import TABLE_FILES, Dataset, _dataset_cache, _ingest, set_head, source_key
+
+
+def _merge_vocabs(base_vocabs, delta_vocabs):
+    """``(merged vocabs, base code maps, delta code maps)``; merged vocabularies stay sorted."""
+    merged = {}
+    base_maps = {}
+    delta_maps = {}
+    for vocab in set(base_vocabs) | set(delta_vocabs):
+        base = base_vocabs.get(vocab, pd.Index([]))
+        delta = delta_vocabs.get(vocab, pd.Index([]))
+        names = pd.Index(sorted(set(base.tolist()) | set(delta.tolist())))
+        merged[vocab] = names
+        base_maps[vocab] = names.get_indexer(base).astype(np.int64)
+        delta_maps[vocab] = names.get_indexer(delta).astype(np.int64)
+    return merged, base_maps, delta_maps
+
+
+def _recode(columns, table_meta, maps, vocabs):
+    """Column arrays with category codes translated through ``maps`` (missing values stay -1)."""
+    out = {}
+    for col, values in columns.items():
+        col_meta = table_meta["columns"][col]
+        values = np.asarray(values)
+        if col_meta["kind"] == "category":
+            vocab = col_meta["vocab"]
+            codes = values.astype(np.int64)
+            codes = np.where(codes >= 0, maps[vocab][np.maximum(codes, 0)], -1) if len(maps[vocab]) else codes
+            values = codes.astype(columnar.code_dtype(len(vocabs[vocab])))
+        out[col] = values
+    return out
+
+
+def _merge_table(name, base, delta):
+    """Base rows followed by delta rows, in month order, re-sorting only from the delta's first month."""
+    if base is None:
+        return columnar.sort_by_month(name, delta)
+    if delta is None:
+        return base
+    if "month" not in base:
+        merged = {col: np.concatenate([base[col], delta[col]]) for col in base}
+        if name == "fact_alias_cluster":
+            # Memberships are a set; a delta may repeat existing ones.
+            _, keep = np.unique(np.column_stack([merged["alias"], merged["cluster_name"]]), axis=0, return_index=True)
+            merged = {col: values[np.sort(keep)] for col, values in merged.items()}
+        return merged
+    # Rows without a month sort first, so a delta holding any rebuilds the order from the start.
+    months = delta["month"]
+    first = months.min() if len(months) else np.iinfo(np.int32).max
+    split = int(np.searchsorted(base["month"], first, side="left"))
+    tail = columnar.sort_by_month(name, {col: np.concatenate([base[col][split:], delta[col]]) for col in base})
+    return {col: np.concatenate([base[col][:split], tail[col]]) for col in base}
+
+
+def _overlapping_months(base, delta):
+    """Months of ``delta`` that ``base`` (sorted by month) already has rows for."""
+    months = np.unique(delta["month"])
+    months = months[months != columnar.MISSING_MONTH]
+    at = np.searchsorted(base["month"], months)
+    found = at < len(base["month"])
+    found[found] = base["month"][at[found]] == months[found]
+    return months[found]
+
+
+def version_key(base_key, delta_key):
+    return hashlib.sha256(f"{base_key}\0{delta_key}".encode()).hexdigest()
+
+
+def _write(path, columns, vocabs, meta, missing_files, empty_files, **info):
+    staging = columnar.staging_dir(path)
+    try:
+        for name, table in columns.items():
+            os.makedirs(os.path.join(staging, name))
+            for col, values in table.items():
+                np.save(os.path.join(staging, name, col + ".npy"), values)
+        columnar.finish_dataset(staging, path, vocabs, meta, missing_files, empty_files, **info)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def append_delta(dataset, delta, cache_dir=None, progress=None):
+    """Apply ``delta`` (ZIP bytes, a seekable ZIP file object or a folder path) to ``dataset``.
+
+    Returns the new version, or ``dataset`` itself when this delta has
+    already been applied. Raises ValueError when the delta has rows for a
+    month that one of the base tables already covers. The new version replaces the old one in the
+    in-memory dataset cache and is the one ``load_dataset`` returns for the
+    same source from now on.
+    """
+    if isinstance(delta, (bytes, bytearray)):
+        delta = io.BytesIO(delta)
+    delta_zip, delta_dir = (None, delta) if isinstance(delta, (str, os.PathLike)) else (delta, None)
+    delta_key = source_key(delta_zip, delta_dir)
+    if delta_key in dataset.deltas:
+        return dataset
+    key = version_key(dataset.key, delta_key)
+    path = columnar.dataset_path(key, cache_dir)
+    if columnar.exists(path):
+        updated = Dataset.from_columnar(key, path)
+    else:
+        tmp = tempfile.mkdtemp(prefix="tessella-delta-")
+        try:
+            with instrument.stage("read delta"):
+                _, _, reports = _ingest(os.path.join(tmp, "delta"), delta_zip, delta_dir, progress)
+                _, delta_arrays, delta_vocabs, delta_info = columnar.read_dataset(os.path.join(tmp, "delta"), mmap_mode=None)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        for name, table in delta_arrays.items():
+            if name in dataset.arrays and "month" in table:
+                overlap = _overlapping_months(dataset.arrays[name], table)
+                if len(overlap):
+                    months = np.datetime_as_string(columnar.month_datetimes(overlap), unit="M")
+                    raise ValueError(
+                        f"{TABLE_FILES[name]} has rows for month(s) the dataset already holds: {', '.join(months)}. "
+                        "An update must only contain new months."
+                    )
+
+        with instrument.stage("merge tables"):
+            vocabs, base_maps, delta_maps = _merge_vocabs(dataset.vocabs, delta_vocabs)
+            columns = {}
+            meta = {}
+            delta_columns = {}
+            for name in set(dataset.arrays) | set(delta_arrays):
+                base = _recode(dataset.arrays[name], dataset.meta[name], base_maps, vocabs) if name in dataset.arrays else None
+                added = _recode(delta_arrays[name], delta_info["tables"][name], delta_maps, vocabs) if name in delta_arrays else None
+                columns[name] = _merge_table(name, base, added)
+                meta[name] = {**(dataset.meta.get(name) or delta_info["tables"][name]), "rows": len(next(iter(columns[name].values())))}
+                if added is not None:
+                    delta_columns[name] = added
+
+        validation = dict(dataset.validation)
+        for filename, report in reports.items():
+            if report.invalid_rows:
+                validation[f"{filename} (update {dataset.version + 1})"] = report.to_json()
+        info = dict(
+            missing_files=[f for f in dataset.missing_files if f in delta_info["missing_files"]],
+            empty_files=[f for f in dataset.empty_files if f in delta_info["empty_files"] + delta_info["missing_files"]],
+            validation=validation,
+            version=dataset.version + 1,
+            parent=dataset.key,
+            source=dataset.source,
+            deltas=dataset.deltas + [delta_key],
+        )
+        with instrument.stage("write version"):
+            try:
+                _write(path, columns, vocabs, meta, **info)
+                updated = Dataset.from_columnar(key, path)
+            except OSError:
+                # Cache directory not writable: keep the new version in memory only.
+                tmp = tempfile.mkdtemp(prefix="tessella-")
+                try:
+                    _write(os.path.join(tmp, key), columns, vocabs, meta, **info)
+                    updated = Dataset.from_columnar(key, os.path.join(tmp, key), mmap_mode=None)
+                finally:
+                    shutil.rmtree(tmp, ignore_errors=True)
+        if dataset._cubes is not None:
+            # Cubes not built yet (the SQL backend never builds them) are built from scratch on first use.
+            with instrument.stage("update cubes"):
+                updated._cubes = dataset.cubes().updated(updated, base_maps, delta_columns)
+    set_head(dataset.source, key, cache_dir)
+    _dataset_cache.put(dataset.source, updated)
+    return updated
@@ -0,0 +1,387 @@
+"""Streaming, schema-validated ingestion of the four lookup CSVs.
+
+Each CSV is read in chunks of ``CHUNK_ROWS`` rows against an explicit
+schema (``SCHEMAS``), so memory use is bounded by the chunk size and the
+vocabularies, not by the file size:
+
+1. every chunk is validated row by row; rows with a bad month, count,
+   empty name or too many fields are dropped and reported
+   (``ValidationReport``) instead of failing the whole file; names are kept
+   as written, only months and counts are trimmed,
+2. valid rows are encoded (strings to provisional integer codes, months to
+   month codes) and spilled to ``.npy`` files in a staging directory next to
+   the dataset's cache directory,
+3. once every file is read, the vocabularies are sorted and the spilled
+   chunks are scattered into the final memory-mapped columns in month order
+   (a counting sort on the month histogram), then each month bucket is
+   sorted by the table's ``SORT_KEYS``.
+
+The result is written in the columnar format described in tessella.columnar.
+Columns not in the schema are ignored.
+"""
+
+import csv
+import os
+import shutil
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from tessella import columnar, instrument
+
+CHUNK_ROWS = int(os.environ.get("TESSELLA_INGEST_CHUNK_ROWS", "250000"))
+
+# Errors kept per file; further invalid rows are only counted.
+MAX_ERRORS = 100
+
+# Spare column name: anything read into it is a field past the header's.
+_OVERFLOW = "\x00overflow"
+
+# Table -> column -> kind. "string" columns are dictionary-encoded with the
+# vocabulary in columnar.VOCAB_COLUMNS, "month" columns must parse as dates,
+# "count" columns must be non-negative integers.
+SCHEMAS = {
+    "occ": {"alias": "string", "month": "month", "occurrence": "count"},
+    "coocc": {"alias_row": "string", "alias_col": "string", "month": "month", "cooccurrence": "count"},
+    "country": {"alias": "string", "country": "string", "month": "month", "occurrence": "count"},
+    "fact_alias_cluster": {"alias": "string", "cluster_name": "string"},
+}
+
+
+class ValidationReport:
+    """Invalid rows of one file: the first ``MAX_ERRORS`` as ``(line, column, value, message)``."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.rows = 0
+        self.invalid_rows = 0
+        self.errors = []
+
+    def add(self, lines, column, values, message):
+        room = MAX_ERRORS - len(self.errors)
+        for line, value in zip(lines[:room], values[:room]):
+            self.errors.append((int(line), column, str(value), message))
+
+    def to_json(self):
+        return {"rows": self.rows, "invalid_rows": self.invalid_rows, "errors": [list(e) for e in self.errors]}
+
+
+class _Vocab:
+    """String -> provisional code in first-seen order; sorted once at the end."""
+
+    def __init__(self):
+        self.codes = {}
+
+    def encode(self, values):
+        codes, uniques = pd.factorize(values)
+        provisional = np.fromiter(
+            (self.codes.setdefault(u, len(self.codes)) for u in uniques), dtype=np.int64, count=len(uniques),
+        )
+        return provisional[codes]
+
+    def finish(self):
+        """``(sorted names as pd.Index, provisional code -> final code)``."""
+        names = np.asarray(list(self.codes), dtype=object)
+        order = np.argsort(names, kind="stable")
+        remap = np.empty(len(names), dtype=np.int64)
+        remap[order] = np.arange(len(names))
+        return pd.Index(names[order].tolist()), remap
+
+
+class _CountingReader:
+    """File wrapper that reports how many bytes have been read."""
+
+    def __init__(self, f, total, on_read):
+        self.f = f
+        self.total = max(total, 1)
+        self.done = 0
+        self.on_read = on_read
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.done += len(data)
+        self.on_read(min(self.done / self.total, 1.0))
+        return data
+
+    def readline(self, size=-1):
+        data = self.f.readline(size)
+        self.done += len(data)
+        return data
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+
+def _skipped_lines(caught):
+    # pandas reports malformed lines as "Skipping line N: expected X fields, saw Y",
+    # counting from the first line it reads: the line after the header.
+    skipped = []
+    for w in caught:
+        for part in str(w.message).split("\n"):
+            if part.startswith("Skipping line "):
+                number = part[len("Skipping line "):].partition(": ")[0]
+                if number.isdigit():
+                    skipped.append(int(number) + 1)
+    return skipped
+
+
+def _read_header(reader):
+    """Column names of the CSV's first line (the reader is left at the first data line)."""
+    line = reader.readline()
+    columns = next(csv.reader([line.decode("utf-8-sig")]), []) if line.strip() else []
+    if not columns:
+        raise pd.errors.EmptyDataError("No columns to parse from file")
+    return columns
+
+
+def _validate(chunk, schema, lines, report):
+    """Encode-ready values of the valid rows of ``chunk`` and their mask."""
+    ok = np.ones(len(chunk), dtype=bool)
+    parsed = {}
+    for col, kind in schema.items():
+        raw = chunk[col].fillna("").astype(str)
+        if kind != "string":
+            # Names are kept as written (" AI" and "AI" stay apart); only numbers and dates are trimmed.
+            raw = raw.str.strip()
+        if kind == "month":
+            values = pd.to_datetime(raw.where(raw != ""), errors="coerce")
+            bad = values.isna().to_numpy()
+            message = "not a date"
+        elif kind == "count":
+            numbers = pd.to_numeric(raw.where(raw != ""), errors="coerce").to_numpy(dtype="float64")
+            bad = np.isnan(numbers) | (numbers < 0) | (numbers != np.floor(numbers))
+            values = np.where(bad, 0, numbers).astype(np.int64)
+            message = "not a non-negative integer"
+        else:
+            values = raw.to_numpy(dtype=object)
+            bad = (raw == "").to_numpy()
+            message = "empty value"
+        new = bad & ok
+        if new.any():
+            report.add(lines[new], col, raw.to_numpy()[new], message)
+        ok &= ~bad
+        parsed[col] = values
+    return parsed, ok
+
+
+def _spill_file(staging, name, f, total_bytes, schema, vocabs, report, progress):
+    """Read one CSV in chunks, spilling valid encoded rows; returns the spill list."""
+    on_read = (lambda fraction: progress(report.filename, fraction)) if progress else (lambda fraction: None)
+    reader = _CountingReader(f, total_bytes, on_read)
+    spills = []
+    skipped = []
+    header = _read_header(reader)
+    missing = [col for col in schema if col not in header]
+    if missing:
+        raise ValueError(f"missing column(s): {', '.join(missing)}")
+    too_long = f"malformed line: more than {len(header)} fields"
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        # One spare column catches a field too many: the C parser reports longer
+        # lines, but silently cuts one that starts a chunk (and, with usecols, any).
+        try:
+            chunks = pd.read_csv(
+                reader, chunksize=CHUNK_ROWS, header=None, names=header + [_OVERFLOW], dtype=str,
+                keep_default_na=False, on_bad_lines="warn",
+            )
+        except pd.errors.EmptyDataError:
+            chunks = []  # a header and no rows
+        first_row = 0
+        for i, chunk in enumerate(chunks):
+            skipped.extend(_skipped_lines(caught))
+            caught.clear()
+            # Physical line numbers: header is line 1, skipped lines shift the rest.
+            lines = first_row + np.arange(len(chunk)) + 2
+            for number in sorted(skipped):
+                lines[lines >= number] += 1
+            first_row += len(chunk)
+            long = (chunk[_OVERFLOW].fillna("") != "").to_numpy()
+            report.add(lines[long], "", [""] * int(long.sum()), too_long)
+            report.rows += len(chunk)
+            report.invalid_rows += int(long.sum())
+            chunk, lines = chunk.loc[~long, list(schema)], lines[~long]
+            parsed, ok = _validate(chunk, schema, lines, report)
+            report.invalid_rows += int((~ok).sum())
+            columns = {}
+            for col, kind in schema.items():
+                values = parsed[col][ok]
+                if kind == "month":
+                    columns[col] = columnar.month_codes(values)
+                elif kind == "count":
+                    columns[col] = values
+                else:
+                    columns[col] = vocabs[_vocab_name(col)].encode(values)
+            spill = os.path.join(staging, f"{name}-{i}")
+            os.makedirs(spill)
+            for col, values in columns.items():
+                np.save(os.path.join(spill, col + ".npy"), values)
+            spills.append((spill, int(ok.sum())))
+        skipped.extend(_skipped_lines(caught))
+    for number in sorted(skipped)[:MAX_ERRORS - len(report.errors)]:
+        report.errors.append((number, "", "", too_long))
+    report.rows += len(skipped)
+    report.invalid_rows += len(skipped)
+    return spills
+
+
+def _vocab_name(col):
+    for vocab, columns in columnar.VOCAB_COLUMNS.items():
+        if col in columns:
+            return vocab
+    return col
+
+
+def _int_dtype(lo, hi):
+    # Signed on purpose: subtracting from unsigned counts wraps around.
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _load_spill(spill, schema):
+    return {col: np.load(os.path.join(spill, col + ".npy")) for col in schema}
+
+
+def _write_table(tmp, name, schema, spills, remaps, vocab_sizes):
+    """Merge one table's spills into its final columns under ``tmp/<name>``; returns its meta."""
+    n_rows = sum(n for _, n in spills)
+    meta = {"rows": n_rows, "columns": {}}
+    dtypes = {}
+    months = []
+    count_range = {col: (0, 0) for col, kind in schema.items() if kind == "count"}
+    for spill, n in spills:
+        if not n:
+            continue
+        columns = _load_spill(spill, schema)
+        for col in count_range:
+            lo, hi = count_range[col]
+            count_range[col] = (min(lo, int(columns[col].min())), max(hi, int(columns[col].max())))
+        if "month" in schema:
+            months.append(np.unique(columns["month"]))
+    for col, kind in schema.items():
+        if kind == "month":
+            dtypes[col] = np.dtype(np.int32)
+            meta["columns"][col] = {"kind": "month"}
+        elif kind == "count":
+            dtypes[col] = _int_dtype(*count_range[col])
+            meta["columns"][col] = {"kind": "int"}
+        else:
+            vocab = _vocab_name(col)
+            dtypes[col] = columnar.code_dtype(vocab_sizes[vocab])
+            meta["columns"][col] = {"kind": "category", "vocab": vocab}
+
+    os.makedirs(os.path.join(tmp, name))
+    out = {
+        col: np.lib.format.open_memmap(os.path.join(tmp, name, col + ".npy"), mode="w+", dtype=dtypes[col], shape=(n_rows,))
+        for col in schema
+    }
+
+    # Month buckets and their first row in the output, from the histogram.
+    buckets = np.unique(np.concatenate(months)) if months else np.zeros(0, dtype=np.int32)
+    counts = np.zeros(len(buckets), dtype=np.int64)
+    for spill, n in spills:
+        if n and "month" in schema:
+            counts += np.bincount(np.searchsorted(buckets, np.load(os.path.join(spill, "month.npy"))), minlength=len(buckets))
+    starts = np.r_[0, np.cumsum(counts)]
+    filled = np.zeros(len(buckets), dtype=np.int64)
+
+    position = 0
+    for spill, n in spills:
+        if not n:
+            continue
+        columns = _load_spill(spill, schema)
+        for col, kind in schema.items():
+            if kind == "string":
+                columns[col] = remaps[_vocab_name(col)][columns[col]]
+        if "month" in schema:
+            bucket = np.searchsorted(buckets, columns["month"])
+            order = np.argsort(bucket, kind="stable")
+            bucket = bucket[order]
+            group_start = np.r_[0, np.flatnonzero(bucket[1:] != bucket[:-1]) + 1]
+            within = np.arange(n) - np.repeat(group_start, np.diff(np.r_[group_start, n]))
+            dest = starts[bucket] + filled[bucket] + within
+            filled += np.bincount(bucket, minlength=len(buckets))
+        else:
+            order = slice(None)
+            dest = slice(position, position + n)
+            position += n
+        for col in schema:
+            out[col][dest] = columns[col][order]
+
+    # Within each month, order rows by the table's sort keys.
+    keys = [col for col in reversed(columnar.SORT_KEYS.get(name, [])) if col in schema]
+    if "month" in schema and keys:
+        for lo, hi in zip(starts[:-1], starts[1:]):
+            if hi - lo < 2:
+                continue
+            order = np.lexsort([out[col][lo:hi] for col in keys])
+            for col in schema:
+                out[col][lo:hi] = out[col][lo:hi][order]
+    for values in out.values():
+        values.flush()
+    return meta
+
+
+def ingest(path, table_files, open_file, progress=None):
+    """Stream the lookup CSVs into a columnar dataset at ``path``.
+
+    ``table_files`` maps table names (keys of ``SCHEMAS``) to file names;
+    ``open_file(filename)`` returns ``(binary file object, size in bytes)``
+    or None when the file is absent. ``progress(filename, fraction)`` is
+    called as each file is read. Returns ``(missing_files, empty_files,
+    reports)`` with a ValidationReport per file that was read.
+    """
+    tmp = columnar.staging_dir(path)
+    try:
+        staging = os.path.join(tmp, "spill")
+        os.makedirs(staging)
+        vocabs = {_vocab_name(col): _Vocab() for schema in SCHEMAS.values() for col, kind in schema.items() if kind == "string"}
+        missing_files = []
+        empty_files = []
+        reports = {}
+        spills = {}
+        for name, filename in table_files.items():
+            schema = SCHEMAS[name]
+            report = ValidationReport(filename)
+            try:
+                opened = open_file(filename)
+            except OSError:
+                opened = None
+            if opened is None:
+                missing_files.append(filename)
+                continue
+            f, size = opened
+            try:
+                with f, instrument.stage(f"read {filename}"):
+                    spills[name] = _spill_file(staging, name, f, size, schema, vocabs, report, progress)
+            except (ValueError, pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+                # Unreadable as a whole: wrong header, not a CSV, not text.
+                report.errors.insert(0, (1, "", "", str(e).splitlines()[0] if str(e) else type(e).__name__))
+                reports[filename] = report
+                missing_files.append(filename)
+                continue
+            reports[filename] = report
+            if not sum(n for _, n in spills[name]):
+                empty_files.append(filename)
+            if progress:
+                progress(filename, 1.0)
+
+        used = {_vocab_name(col) for name in spills for col, kind in SCHEMAS[name].items() if kind == "string"}
+        finished = {vocab: vocabs[vocab].finish() for vocab in used}
+        remaps = {vocab: remap for vocab, (_, remap) in finished.items()}
+        sizes = {vocab: len(names) for vocab, (names, _) in finished.items()}
+        meta = {}
+        for name, table_spills in spills.items():
+            with instrument.stage(f"sort and write {name}"):
+                meta[name] = _write_table(tmp, name, SCHEMAS[name], table_spills, remaps, sizes)
+        shutil.rmtree(staging)
+        columnar.finish_dataset(
+            tmp, path, {vocab: names for vocab, (names, _) in finished.items()}, meta,
+            missing_files, empty_files, validation={f: r.to_json() for f, r in reports.items()},
+        )
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return missing_files, empty_files, reports
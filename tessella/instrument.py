@@ -0,0 +1,144 @@
+"""Per-stage timing and memory instrumentation of dashboard reruns.
+
+A ``Trace`` is started (``start``) at the top of every rerun and made
+current for the script thread; code anywhere in the package then wraps its
+expensive steps in ``stage(name)``, which records wall time and resident
+memory before and after. With no current trace, ``stage`` costs almost nothing, so the
+helpers can stay in library code that also runs headless.
+
+``Trace.finish`` appends one JSON object per rerun to the file named by
+``TESSELLA_TIMING_LOG`` (nothing is written when it is unset), so timings
+can be aggregated across sessions. Resident memory is that of the whole
+server process, which all sessions share; deltas are indicative only when
+reruns overlap.
+"""
+
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+LOG_PATH = os.environ.get("TESSELLA_TIMING_LOG")
+
+_current = contextvars.ContextVar("tessella_trace", default=None)
+_log_lock = threading.Lock()
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes():
+    """Current resident set size of the process, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class Trace:
+    """Stages of one rerun, in the order they finished."""
+
+    def __init__(self, **context):
+        self.context = context
+        self.stages = []
+        self.start = time.perf_counter()
+        self.start_rss = rss_bytes()
+        self._depth = 0
+        self._started = 0
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self._started += 1
+        order = self._started
+        rss_before = rss_bytes()
+        start = time.perf_counter()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            rss_after = rss_bytes()
+            self.stages.append({
+                "order": order,
+                "stage": name,
+                "depth": self._depth,
+                "ms": round((time.perf_counter() - start) * 1000, 2),
+                "rss_mb": _mb(rss_after),
+                "rss_delta_mb": _mb(rss_after - rss_before) if rss_after is not None and rss_before is not None else None,
+            })
+
+    @property
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.start) * 1000, 2)
+
+    def rows(self):
+        """Stages in start order (parents before their children), with the untimed remainder as "other"."""
+        rows = _start_order(self.stages)
+        timed = sum(row["ms"] for row in self.stages if row["depth"] == 0)
+        rows.append({"stage": "other (widgets, layout)", "depth": 0, "ms": round(self.elapsed_ms - timed, 2),
+                     "rss_mb": _mb(rss_bytes()), "rss_delta_mb": None})
+        return rows
+
+    def finish(self, path=None):
+        """Write the rerun as one JSON line to ``path`` (default ``TESSELLA_TIMING_LOG``)."""
+        path = path or LOG_PATH
+        if not path:
+            return
+        record = {
+            "time": time.time(),
+            **self.context,
+            "total_ms": self.elapsed_ms,
+            "rss_mb": _mb(rss_bytes()),
+            "peak_rss_mb": _mb(peak_rss_bytes()),
+            "stages": _start_order(self.stages),
+        }
+        line = json.dumps(record, default=str)
+        with _log_lock:
+            try:
+                with open(path, "a") as f:
+                    f.write(line + "\n")
+            except OSError:
+                pass
+
+
+def _start_order(stages):
+    # Stages are recorded when they end, so a parent follows its children.
+    return [
+        {key: value for key, value in row.items() if key != "order"}
+        for row in sorted(stages, key=lambda row: row["order"])
+    ]
+
+
+def _mb(n):
+    return None if n is None else round(n / (1024 * 1024), 1)
+
+
+def start(**context):
+    """Begin a new trace and make it current for this thread (the rerun's script thread)."""
+    trace = Trace(**context)
+    _current.set(trace)
+    return trace
+
+
+def current():
+    return _current.get()
+
+
+def stage(name):
+    """Time ``name`` in the current rerun's trace; a no-op outside one."""
+    trace = _current.get()
+    return trace.stage(name) if trace is not None else contextlib.nullcontext()
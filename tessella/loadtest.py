@@ -0,0 +1,342 @@
+"""Load test: many simulated dashboard sessions on one in-process server, driven with Streamlit's AppTest.
+
+Each simulated session opens the dashboard and then performs random
+interactions the way an analyst would: switching tabs, dragging the date
+slider, searching and picking aliases or countries, editing the Sankey
+country list, paging and re-sorting. Every interaction is one rerun of
+app.py. All sessions run in this process and therefore share the
+server-wide caches (datasets, cubes, figures, trends) and the prefetch
+pool, exactly as the sessions of one ``streamlit run`` server do.
+
+For each number of sessions the run reports, for every kind of
+interaction, the percentiles of the rerun time and, separately, of the
+time spent queueing for a turn (see below), the throughput in reruns per
+second, the shared figure cache's hit rate, and the resident memory of
+this one server process (peak and at the end of the level), so servers
+can be sized and cache or memory changes checked under load:
+
+    python -m tessella.loadtest --rows small --sessions 1,4,16 --steps 20
+    python -m tessella.loadtest --data path/to/folder --sessions 8 --json load.json
+
+AppTest is not thread-safe: every run swaps process-wide Streamlit globals
+(the runtime instance and its config). The sessions' reruns therefore take
+turns; the time a session waits for its turn is reported as queueing, not
+as rerun time, so the rerun percentiles show what a rerun costs with the
+caches the other sessions filled. Background work started by the app (see
+tessella.prefetch) runs concurrently with the reruns. ``--think`` adds a
+random pause between a session's interactions. Levels run in the order
+given on one warm server; peak RSS never goes down, so list the session
+counts in increasing order.
+"""
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from tessella import instrument, synthetic
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+TABS = ["Occurrence", "CoOccurrence", "Heatmap", "Geo Map", "Sankey"]
+
+# Tab -> key prefix of its search filter (see app.search_filter).
+SEARCH_FILTERS = {
+    "Occurrence": "occ_alias_filter",
+    "CoOccurrence": "coocc_alias1_filter",
+    "Geo Map": "geo_country_filter",
+}
+
+# One AppTest run at a time (see the module docstring).
+_run_lock = threading.Lock()
+
+
+class Session:
+    """One simulated user: an AppTest, a random generator and the tab on screen."""
+
+    def __init__(self, seed, timeout=300):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.rng = random.Random(seed)
+        self.tab = TABS[0]
+        self._months = {}
+
+    def run(self, element=None):
+        """Rerun the app (after ``element``'s change); returns ``(seconds queueing, seconds rerunning)``."""
+        start = time.perf_counter()
+        with _run_lock:
+            turn = time.perf_counter()
+            (element or self.at).run()
+        return turn - start, time.perf_counter() - turn
+
+    def months(self, slider):
+        # The slider starts on the full range; remember it to pick sub-ranges later.
+        if slider.key not in self._months:
+            lo, hi = slider.value
+            self._months[slider.key] = pd.date_range(lo, hi, freq="MS").to_pydatetime().tolist()
+        return self._months[slider.key]
+
+
+# --- Interactions: each changes one widget and returns it (None when not possible on this tab) ---
+
+def switch_tab(session):
+    session.tab = session.rng.choice([tab for tab in TABS if tab != session.tab])
+    return session.at.sidebar.radio(key="main_tab_selector").set_value(session.tab)
+
+
+def drag_dates(session):
+    slider = next((s for s in session.at.sidebar.slider if (s.key or "").startswith("date_range_slider_")), None)
+    if slider is None:
+        return None
+    months = session.months(slider)
+    if len(months) < 2:
+        return None
+    start, end = sorted(session.rng.sample(range(len(months)), 2))
+    return slider.set_value((months[start], months[end]))
+
+
+def search_filter(session):
+    key = SEARCH_FILTERS.get(session.tab)
+    if key is None:
+        return None
+    mode = session.at.sidebar.radio(key=f"{key}_mode")
+    if mode.value == "All":
+        return mode.set_value(session.rng.choice(["Only", "All except"]))
+    options = session.at.sidebar.multiselect(key=f"{key}_picked").options
+    if not options:
+        return mode.set_value("All")
+    # Type the start of a word of one of the names on offer.
+    word = session.rng.choice(session.rng.choice(options).split())
+    return session.at.sidebar.text_input(key=f"{key}_search").input(word[:session.rng.randint(1, max(len(word), 1))])
+
+
+def pick_names(session):
+    key = SEARCH_FILTERS.get(session.tab)
+    if key is None or session.at.sidebar.radio(key=f"{key}_mode").value == "All":
+        return None
+    picked = session.at.sidebar.multiselect(key=f"{key}_picked")
+    if not picked.options:
+        return None
+    return picked.set_value(session.rng.sample(picked.options, min(len(picked.options), session.rng.randint(1, 3))))
+
+
+def edit_sankey_countries(session):
+    if session.tab != "Sankey":
+        return None
+    countries = session.at.sidebar.multiselect(key="sankey_country_filter")
+    value = list(countries.value)
+    country = session.rng.choice(countries.options)
+    if country in value and len(value) > 1:
+        value.remove(country)
+    elif country not in value:
+        value.append(country)
+    return countries.set_value(value)
+
+
+def change_page(session):
+    key = {"Occurrence": "occ_page", "CoOccurrence": "coocc_page"}.get(session.tab)
+    if key is None:
+        return None
+    return session.at.sidebar.number_input(key=key).set_value(session.rng.randint(1, 3))
+
+
+def change_sort(session):
+    key = {"Occurrence": "occ_sort_option", "CoOccurrence": "coocc_sort_option"}.get(session.tab)
+    if key is None:
+        return None
+    sort = session.at.sidebar.selectbox(key=key)
+    return sort.set_value(session.rng.choice(sort.options))
+
+
+# Interaction -> relative weight in the random walk.
+INTERACTIONS = {
+    "switch tab": (switch_tab, 4),
+    "drag date slider": (drag_dates, 3),
+    "search filter": (search_filter, 2),
+    "pick names": (pick_names, 2),
+    "edit Sankey countries": (edit_sankey_countries, 2),
+    "change page": (change_page, 1),
+    "change sort": (change_sort, 1),
+}
+
+
+def _errors(at):
+    return len(at.exception)
+
+
+def run_session(session, steps, think, record):
+    """Open the app and perform ``steps`` random interactions, calling ``record(name, queued, seconds, ok)``."""
+    record("open", *session.run(), not _errors(session.at))
+    names = list(INTERACTIONS)
+    weights = [weight for _, weight in INTERACTIONS.values()]
+    for _ in range(steps):
+        if think:
+            time.sleep(session.rng.expovariate(1 / think))
+        element = None
+        while element is None:
+            name = session.rng.choices(names, weights)[0]
+            try:
+                element = INTERACTIONS[name][0](session)
+            except (KeyError, IndexError, ValueError):
+                # The widget is not on screen (e.g. a tab without data).
+                element = None
+        record(name, *session.run(element), not _errors(session.at))
+
+
+def run_level(n_sessions, steps, think=0.0, seed=0):
+    """Run ``n_sessions`` concurrent sessions on this process's server; returns their timings and its memory."""
+    from tessella.figcache import figure_cache
+
+    before = figure_cache().stats()
+    timings = {}
+    queued = {}
+    errors = {}
+    lock = threading.Lock()
+
+    def record(name, wait, seconds, ok):
+        with lock:
+            timings.setdefault(name, []).append(seconds)
+            queued.setdefault(name, []).append(wait)
+            errors[name] = errors.get(name, 0) + (not ok)
+
+    sessions = [Session(seed * 100_003 + i) for i in range(n_sessions)]
+    failures = []
+    barrier = threading.Barrier(n_sessions + 1)
+
+    def target(session):
+        barrier.wait()
+        try:
+            run_session(session, steps, think, record)
+        except Exception as exc:  # reported, not raised: one broken session must not stop the level
+            failures.append(repr(exc))
+
+    threads = [
+        threading.Thread(target=target, args=(session,), name=f"loadtest-session-{i}", daemon=True)
+        for i, session in enumerate(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    # Every session is ready; time from here.
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    after = figure_cache().stats()
+    hits, misses = after["hits"] - before["hits"], after["misses"] - before["misses"]
+    n = sum(len(values) for values in timings.values())
+    return {
+        "sessions": n_sessions,
+        "interactions": n,
+        "wall_s": wall,
+        "throughput_per_s": n / wall if wall else 0.0,
+        "errors": sum(errors.values()),
+        "failed_sessions": failures,
+        "figure_hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "peak_rss_mb": (instrument.peak_rss_bytes() or 0) / 1e6,
+        "rss_mb": (instrument.rss_bytes() or 0) / 1e6,
+        "all": _percentiles(_concat(timings)),
+        "queue": _percentiles(_concat(queued)),
+        "by_interaction": {
+            name: dict(_percentiles(np.asarray(values)), queue=_percentiles(np.asarray(queued[name])), errors=errors[name])
+            for name, values in timings.items()
+        },
+    }
+
+
+def _concat(by_name):
+    return np.concatenate(list(by_name.values())) if by_name else np.zeros(0)
+
+
+def _percentiles(seconds):
+    if not len(seconds):
+        return {"count": 0}
+    p50, p90, p99 = np.percentile(seconds, [50, 90, 99]) * 1000
+    return {"count": len(seconds), "p50_ms": p50, "p90_ms": p90, "p99_ms": p99, "max_ms": float(seconds.max() * 1000)}
+
+
+def _print_level(level):
+    rerun, queue = level["all"], level["queue"]
+    print(
+        f"{level['sessions']:>8}  {level['interactions']:>12}  {level['throughput_per_s']:>10.2f}  "
+        f"{rerun.get('p50_ms', 0):>8.0f}  {rerun.get('p90_ms', 0):>8.0f}  {rerun.get('p99_ms', 0):>8.0f}  "
+        f"{queue.get('p50_ms', 0):>9.0f}  {queue.get('p90_ms', 0):>9.0f}  "
+        f"{level['figure_hit_rate']:>9.0%}  {level['peak_rss_mb']:>12.0f}  {level['rss_mb']:>7.0f}  {level['errors']:>6}"
+    )
+
+
+def _print_interactions(level):
+    width = max(len(name) for name in level["by_interaction"])
+    print(f"\nPer interaction at {level['sessions']} session(s) (rerun times; queueing separately):")
+    print(
+        f"{'interaction':<{width}}  {'count':>6}  {'p50 ms':>8}  {'p90 ms':>8}  {'p99 ms':>8}  {'max ms':>8}  "
+        f"{'queue p50':>9}  {'queue p90':>9}  {'errors':>6}"
+    )
+    for name, stats in level["by_interaction"].items():
+        print(
+            f"{name:<{width}}  {stats['count']:>6}  {stats['p50_ms']:>8.0f}  {stats['p90_ms']:>8.0f}  "
+            f"{stats['p99_ms']:>8.0f}  {stats['max_ms']:>8.0f}  {stats['queue']['p50_ms']:>9.0f}  "
+            f"{stats['queue']['p90_ms']:>9.0f}  {stats['errors']:>6}"
+        )
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load-test the dashboard with simulated concurrent sessions.")
+    parser.add_argument("--data", help="folder with the four lookup CSVs (default: generate synthetic data)")
+    parser.add_argument("--rows", default="demo", help=f"synthetic rows per monthly table, or one of {', '.join(synthetic.SCALES)}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sessions", default="1,4,16", help="comma-separated numbers of concurrent sessions, one level each")
+    parser.add_argument("--steps", type=int, default=20, help="interactions per session after opening the app")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between a session's interactions, in seconds")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    data_dir = args.data
+    tmp = None
+    if data_dir is None:
+        tmp = tempfile.mkdtemp(prefix="tessella-synthetic-")
+        rows = synthetic.SCALES[args.rows] if args.rows in synthetic.SCALES else int(args.rows)
+        sizes = synthetic.generate(tmp, rows, seed=args.seed)
+        print(f"generated {rows} rows per table {sizes}")
+        data_dir = tmp
+    # The app loads this folder when nothing is uploaded (see tessella.dataset.default_data_dir).
+    os.environ["TESSELLA_DATA_DIR"] = os.path.abspath(data_dir)
+    levels = []
+    try:
+        from tessella.backends import backend_for
+        from tessella.dataset import load_dataset
+
+        # Convert (and export) once here, so the first level does not time the one-off conversion.
+        backend_for(load_dataset(None))
+        print(f"{'sessions':>8}  {'interactions':>12}  {'rerun/s':>10}  {'p50 ms':>8}  {'p90 ms':>8}  {'p99 ms':>8}  "
+              f"{'queue p50':>9}  {'queue p90':>9}  {'fig hits':>9}  {'peak RSS MB':>12}  {'RSS MB':>7}  {'errors':>6}")
+        for n_sessions in [int(n) for n in args.sessions.split(",") if n.strip()]:
+            level = run_level(n_sessions, args.steps, args.think, args.seed)
+            levels.append(level)
+            _print_level(level)
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+    if levels:
+        _print_interactions(levels[-1])
+    for level in levels:
+        for failure in level["failed_sessions"]:
+            print(f"FAILED session at {level['sessions']} session(s): {failure}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(levels, f, indent=1)
+    return 1 if any(level["failed_sessions"] for level in levels) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
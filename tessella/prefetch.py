@@ -0,0 +1,209 @@
+"""Background precomputation of the other tabs' default figures.
+
+Only the selected tab's branch of app.py runs on a rerun, so the first
+visit to another tab pays for its query and figure while the user waits.
+After each rerun the dashboard hands its session's ``Prefetcher`` the
+dataset and the tab on screen; the prefetcher queues the default view of
+every other tab (full date range, "All" filters, first page, default color
+scale and bounds: exactly the state a first visit starts in) on a small
+thread pool shared by the server, and each job stores its figure in the
+figure cache under the same key the tab will look up.
+
+Work is cancellable: a new rerun of the session cancels the jobs still
+queued, so the foreground rerun does not wait behind them, and they are
+queued again once it has drawn its chart. Loading another dataset (or
+appending an update, which makes a new version) also drops the results of
+jobs already running for the old one. ``TESSELLA_PREFETCH_WORKERS``
+(default 2) sets the pool size; 0 turns precomputation off.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from tessella import heatmap, queries, sankey
+from tessella.backends import backend_for
+from tessella.charts import choropleth_figure, color_sequence, heatmap_figure, sankey_figure, stacked_bar_figure
+from tessella.figcache import figure_cache, figure_key
+from tessella.search import CodeSet
+
+PREFETCH_WORKERS = int(os.environ.get("TESSELLA_PREFETCH_WORKERS", "2"))
+
+# Widget defaults of the dashboard's tabs (first option / initial value).
+DEFAULT_COLOR_SCALE = "Viridis"
+DEFAULT_AXIS_SCALE = "Linear"
+DEFAULT_PER_PAGE = 50
+NO_TREND_FILTER = {"growth": None, "ratio": None, "burst": None}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    """The server-wide worker pool, started on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(PREFETCH_WORKERS, 1), thread_name_prefix="tessella-prefetch")
+        return _executor
+
+
+def _bar_view(dataset, tab, ranked, entity_col, value_col, title, value_title, hover_name, **state):
+    min_value, max_value, max_stack = queries.bar_bounds(ranked, value_col)
+    x_range = (0, int(max_stack * 1.05))
+    key = figure_key(
+        dataset, tab, **state, sort=f"Total {value_title} (Descending)", min_trend=NO_TREND_FILTER,
+        per_page=DEFAULT_PER_PAGE, page=1, color_scale=DEFAULT_COLOR_SCALE, color_bounds=(min_value, max_value),
+        x_range=x_range, axis_scale=DEFAULT_AXIS_SCALE,
+    )
+
+    def build():
+        fig = stacked_bar_figure(
+            ranked.grouped, entity_col, value_col, ranked.labels, color_sequence(DEFAULT_COLOR_SCALE),
+            min_value, max_value, title=title, value_title=value_title, hover_name=hover_name,
+        )
+        fig.update_xaxes(range=list(x_range))
+        return fig
+
+    return key, build
+
+
+def occurrence_view(dataset, backend):
+    everything = CodeSet.everything()
+    ranked = backend.occurrence_page(dataset.date_bounds, everything, everything, per_page=DEFAULT_PER_PAGE)
+    if ranked.grouped.empty:
+        return None
+    return _bar_view(
+        dataset, "Occurrence", ranked, "alias", "occurrence", "Alias Occurrence Over Time (Color by Occurrence)",
+        "Occurrence", "Alias", date_range=dataset.date_bounds, group_by="alias",
+        aliases=everything.key(), clusters=everything.key(),
+    )
+
+
+def cooccurrence_view(dataset, backend):
+    everything = CodeSet.everything()
+    ranked = backend.cooccurrence_page(
+        dataset.date_bounds, everything, everything, everything, everything, per_page=DEFAULT_PER_PAGE,
+    )
+    if ranked.grouped.empty:
+        return None
+    return _bar_view(
+        dataset, "CoOccurrence", ranked, "combo", "cooccurrence", "Alias Co-Occurrence Over Time (Color by Cooccurrence)",
+        "Cooccurrence", "Combo", date_range=dataset.date_bounds, by_cluster=False,
+        aliases=(everything.key(), everything.key()), clusters=(everything.key(), everything.key()),
+    )
+
+
+def heatmap_view(dataset, cubes):
+    level = "cluster" if cubes.cluster_coocc is not None else "alias"
+    bins = min(heatmap.HEATMAP_BINS, 500)
+    n = len(cubes.cluster_names) if level == "cluster" else len(cubes.alias_names)
+    zoom = [(0, n) if n > bins else None] * 2
+    grid = heatmap.build_heatmap(cubes, dataset.date_bounds, level, None, None, *zoom, bins=bins)
+    if grid.empty:
+        return None
+    title = f"{'Cluster' if level == 'cluster' else 'Alias'} Co-Occurrence Heatmap"
+    key = figure_key(
+        dataset, "Heatmap", date_range=dataset.date_bounds, level=level, block=(None, None), zoom=zoom, bins=bins,
+        color_scale=DEFAULT_COLOR_SCALE, axis_scale=DEFAULT_AXIS_SCALE,
+    )
+    return key, lambda: heatmap_figure(grid, color_sequence(DEFAULT_COLOR_SCALE), title)
+
+
+def geo_view(dataset, backend):
+    everything = CodeSet.everything()
+    agg = backend.country_by_year(dataset.date_bounds, everything)
+    if agg.empty:
+        return None
+    bounds = (int(agg["occurrence"].min()), int(agg["occurrence"].max()))
+    key = figure_key(
+        dataset, "Geo Map", date_range=dataset.date_bounds, countries=everything.key(),
+        color_scale=DEFAULT_COLOR_SCALE, color_bounds=bounds,
+    )
+    return key, lambda: choropleth_figure(agg, color_sequence(DEFAULT_COLOR_SCALE), *bounds)
+
+
+def sankey_view(dataset, cubes):
+    if cubes.country_cluster is None:
+        return None
+    countries = queries.top_countries(cubes, 5)
+    clusters = queries.top_clusters(cubes, 5)
+    graph = sankey.build_sankey(cubes, dataset.date_bounds, countries, clusters, False, 0, 0)
+    if graph.empty:
+        return None
+    key = figure_key(
+        dataset, "Sankey", date_range=dataset.date_bounds, countries=set(countries), clusters=set(clusters),
+        with_aliases=False, min_weight=0, top_k=0,
+    )
+    return key, lambda: sankey_figure(graph, "Geo Sankey: Country to Cluster Name")
+
+
+# Tab -> default view: ``(figure key, build)`` or None when the tab has nothing to draw.
+# The Heatmap and the Sankey read the cubes, so they have none with the SQL backend.
+VIEWS = {
+    "Occurrence": lambda dataset, backend: occurrence_view(dataset, backend) if backend.has("occ") else None,
+    "CoOccurrence": lambda dataset, backend: cooccurrence_view(dataset, backend) if backend.has("coocc") else None,
+    "Heatmap": lambda dataset, backend: (
+        heatmap_view(dataset, backend.cubes) if backend.in_memory and backend.has("coocc") else None
+    ),
+    "Geo Map": lambda dataset, backend: geo_view(dataset, backend) if backend.has("country") else None,
+    "Sankey": lambda dataset, backend: (
+        sankey_view(dataset, backend.cubes)
+        if backend.in_memory and backend.has("coocc") and dataset.fact_alias_cluster is not None else None
+    ),
+}
+
+
+class Prefetcher:
+    """One session's background jobs; see the module docstring."""
+
+    def __init__(self):
+        self.dataset_key = None
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def cancel(self):
+        """Cancel the jobs that have not started; returns how many were cancelled."""
+        with self._lock:
+            cancelled = sum(future.cancel() for future in self._futures.values())
+            self._futures = {tab: f for tab, f in self._futures.items() if not f.cancelled()}
+        return cancelled
+
+    def schedule(self, dataset, current_tab=None, tabs=VIEWS):
+        """Queue the default view of every tab but ``current_tab`` not yet done for this dataset."""
+        if PREFETCH_WORKERS <= 0:
+            return
+        self.cancel()
+        with self._lock:
+            if dataset.key != self.dataset_key:
+                # Jobs still running for the previous dataset see the new key and drop their results.
+                self.dataset_key = dataset.key
+                self._futures = {}
+            for tab in tabs:
+                if tab == current_tab or tab in self._futures:
+                    continue
+                self._futures[tab] = executor().submit(self._run, dataset, tab)
+
+    def pending(self):
+        with self._lock:
+            return sorted(tab for tab, future in self._futures.items() if not future.done())
+
+    def _current(self, dataset):
+        return self.dataset_key == dataset.key
+
+    def _run(self, dataset, tab):
+        """Build and cache ``tab``'s default figure unless its dataset was replaced meanwhile."""
+        if not self._current(dataset):
+            return False
+        view = VIEWS[tab](dataset, backend_for(dataset))
+        if view is None or not self._current(dataset):
+            return False
+        key, build = view
+        cache = figure_cache()
+        if key in cache:
+            return False
+        payload = build().to_json()
+        if not self._current(dataset):
+            return False
+        cache.put(key, payload)
+        return True
@@ -0,0 +1,184 @@
+"""Progressive rendering: an approximate preview while the exact chart is computed.
+
+The exact Occurrence and CoOccurrence pages total every selected alias (or
+pair) over the date range, which for wide ranges of a large dataset takes a
+while, and Streamlit shows nothing in the chart's place until it is done.
+``compute`` runs that work on a small thread pool instead. If it has not
+finished after ``TESSELLA_PREVIEW_DELAY`` seconds (default 0.3), the
+dashboard fills the chart's placeholder with a preview, marked as
+approximate, and the exact chart replaces it when it is ready.
+
+The preview comes from a summary built once per dataset version in the
+background: the ``TESSELLA_PREVIEW_TOP`` (default 500) aliases or pairs
+with the largest all-time totals and their yearly sums. For a date range
+it ranks these by their totals over the whole years the range touches, so
+it costs a few thousand additions however large the dataset is.
+
+While it waits, the script updates the placeholder's progress note a few
+times a second. Every Streamlit call is a point where a rerun that the
+user has superseded (by changing a control mid-flight) is stopped; the
+waiting call then cancels its job, which is dropped if it has not started.
+A job already running cannot be interrupted, but its result goes unused
+and the rerun's later steps (the figure after the query) never start.
+``TESSELLA_PROGRESSIVE_WORKERS`` (default 4) sets the pool size; 0
+computes in the script thread without a preview.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import numpy as np
+
+from tessella import queries
+from tessella.cache import LRUCache
+
+PROGRESSIVE_WORKERS = int(os.environ.get("TESSELLA_PROGRESSIVE_WORKERS", "4"))
+PREVIEW_DELAY = float(os.environ.get("TESSELLA_PREVIEW_DELAY", "0.3"))
+PREVIEW_TOP = int(os.environ.get("TESSELLA_PREVIEW_TOP", "500"))
+# Seconds between progress updates (and cancellation checks) while waiting.
+POLL_INTERVAL = 0.1
+
+_summary_cache = LRUCache(max_entries=8)
+_summary_jobs = set()
+_executor = None
+_executor_lock = threading.Lock()
+_lock = threading.Lock()
+
+
+def executor():
+    """The server-wide worker pool, started on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(PROGRESSIVE_WORKERS, 1), thread_name_prefix="tessella-progressive")
+        return _executor
+
+
+class Summary:
+    """Yearly sums of the largest entities: ``sums[k, y]`` for ``labels[k]`` in ``years[y]``."""
+
+    def __init__(self, labels, years, sums):
+        self.labels = labels
+        self.years = years
+        self.sums = sums
+
+
+def _build_summary(cubes, kind, top):
+    if kind == "alias":
+        cube = cubes.occ
+        totals = cube.totals(0, cube.axis.n)
+        entities, _ = _largest(np.arange(len(totals)), totals, top)
+        years, sums = cube.by_year(0, cube.axis.n, entities)
+        labels = cubes.alias_names[entities]
+    else:
+        matrix = cubes.coocc
+        pairs, _ = matrix.strongest_pairs(0, matrix.axis.n, k=top)
+        years, sums = matrix.by_year(0, matrix.axis.n, pairs)
+        labels = queries._combo_labels(cubes.alias_names, matrix.pair_i[pairs], matrix.pair_j[pairs])
+    return Summary(labels, np.asarray(years), sums)
+
+
+def _largest(ids, totals, k):
+    keep = totals > 0
+    ids, totals = ids[keep], totals[keep]
+    if len(totals) > k:
+        part = np.argpartition(-totals, k - 1)[:k]
+        ids, totals = ids[part], totals[part]
+    order = np.argsort(-totals, kind="stable")
+    return ids[order], totals[order]
+
+
+def summary(cubes, kind, top=PREVIEW_TOP):
+    """The preview summary of ``kind`` ("alias" or "pair"), or None while it is being built in the background."""
+    key = (cubes.key, kind, top)
+    found = _summary_cache.get(key)
+    if found is not None or PROGRESSIVE_WORKERS <= 0:
+        return found
+    with _lock:
+        if key not in _summary_jobs:
+            def build():
+                try:
+                    _summary_cache.put(key, _build_summary(cubes, kind, top))
+                finally:
+                    with _lock:
+                        _summary_jobs.discard(key)
+
+            _summary_jobs.add(key)
+            executor().submit(build)
+    return None
+
+
+def warm(cubes):
+    """Start building the preview summaries of ``cubes`` that are not built yet."""
+    if cubes.occ is not None:
+        summary(cubes, "alias")
+    if cubes.coocc is not None:
+        summary(cubes, "pair")
+
+
+def preview_page(cubes, kind, date_range, per_page=50, top=PREVIEW_TOP):
+    """A RankedPage of the summary's entities with the largest totals over the years of ``date_range``.
+
+    Approximate twice over: whole years are counted, and only the ``top``
+    largest entities of the whole dataset can appear. None while the
+    summary is not built yet, or when nothing falls in the range.
+    """
+    found = summary(cubes, kind, top)
+    if found is None:
+        return None
+    start, end = date_range if date_range is not None else (None, None)
+    columns = np.ones(len(found.years), dtype=bool)
+    if start is not None:
+        columns &= found.years >= start.year
+    if end is not None:
+        columns &= found.years <= end.year
+    years, sums = found.years[columns], found.sums[:, columns]
+    rows, _ = _largest(np.arange(len(sums)), sums.sum(axis=1), per_page)
+    if not len(rows):
+        return None
+    label_col, value_col, noun = ("alias", "occurrence", "aliases") if kind == "alias" else ("combo", "cooccurrence", "combos")
+    return queries._ranked_page(
+        rows, lambda idx: found.labels[idx], lambda idx: (years, sums[idx]), label_col, value_col, per_page, 0, noun,
+    )
+
+
+class Cancelled(Exception):
+    """Raised in a job whose rerun was superseded before the job started."""
+
+
+def _run(cancelled, fn):
+    if cancelled.is_set():
+        raise Cancelled()
+    return fn()
+
+
+def compute(fn, on_wait=None, delay=PREVIEW_DELAY):
+    """``fn()``, run on the pool; while it runs, ``on_wait(seconds)`` is called every ``POLL_INTERVAL`` after ``delay``.
+
+    ``on_wait`` is where the dashboard draws the preview and the progress
+    note. If it raises (Streamlit stopping a superseded rerun), the job is
+    cancelled: dropped if it has not started, and its result unused if it has.
+    """
+    if PROGRESSIVE_WORKERS <= 0:
+        return fn()
+    cancelled = threading.Event()
+    start = time.perf_counter()
+    # Carry the rerun's context over so tessella.instrument stages inside ``fn`` are timed.
+    future = executor().submit(contextvars.copy_context().run, _run, cancelled, fn)
+    try:
+        while True:
+            try:
+                return future.result(timeout=POLL_INTERVAL)
+            except FutureTimeout:
+                pass
+            elapsed = time.perf_counter() - start
+            if on_wait is not None and elapsed >= delay:
+                on_wait(elapsed)
+    finally:
+        if not future.done():
+            cancelled.set()
+            future.cancel()
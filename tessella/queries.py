@@ -0,0 +1,310 @@
+"""Tab queries answered from the pre-aggregated cubes (see tessella.cubes).
+
+Filters are lists of names, where an empty list means "no filter", or
+tessella.search.CodeSet selections of codes as the sidebar's search filters
+produce them. Results are small long-format DataFrames ready for plotting.
+"""
+
+import numpy as np
+import pandas as pd
+
+from tessella import trends
+from tessella.search import member_mask, selection_mask
+
+
+def _long_frame(labels, years, sums, label_col, value_col):
+    rows, cols = np.nonzero(sums)
+    return pd.DataFrame({
+        label_col: np.asarray(labels, dtype=object)[rows],
+        "year": np.asarray(years)[cols].astype(int),
+        value_col: sums[rows, cols],
+    })
+
+
+def _clusters_of(cubes, alias_codes):
+    members = np.isin(cubes.member_alias, alias_codes)
+    return np.unique(cubes.member_cluster[members])
+
+
+# --- Filter options ---
+
+def occurrence_aliases(cubes):
+    return cubes.alias_names[cubes.occ.present].tolist()
+
+
+def cooccurrence_aliases(cubes):
+    """Sorted aliases that co-occur with at least one other alias."""
+    return cubes.alias_names[cubes.coocc.aliases()].tolist()
+
+
+def cooccurrence_clusters(cubes):
+    """Sorted clusters of the aliases in ``cooccurrence_aliases``."""
+    return cubes.cluster_names[_clusters_of(cubes, cubes.coocc.aliases())].tolist()
+
+
+def countries(cubes):
+    return cubes.country_names[cubes.country.present].tolist()
+
+
+def top_countries(cubes, k=5):
+    totals = cubes.country.totals(0, cubes.axis.n)
+    order = np.argsort(-totals, kind="stable")
+    order = order[cubes.country.present[order]]
+    return cubes.country_names[order[:k]].tolist()
+
+
+def top_clusters(cubes, k=5):
+    if cubes.country_cluster is None:
+        return []
+    n_cluster = len(cubes.cluster_names)
+    totals = cubes.country_cluster.totals(0, cubes.axis.n).reshape(-1, n_cluster)
+    present = cubes.country_cluster.present.reshape(-1, n_cluster).any(axis=0)
+    totals = totals.sum(axis=0)
+    order = np.argsort(-totals, kind="stable")
+    order = order[present[order]]
+    return cubes.cluster_names[order[:k]].tolist()
+
+
+# --- Tab aggregates ---
+
+def _alias_filter_mask(cubes, mask, aliases, clusters):
+    selected = selection_mask(len(mask), aliases, cubes.alias_codes)
+    if selected is not None:
+        mask &= selected
+    selected = selection_mask(len(cubes.cluster_names), clusters, cubes.cluster_codes)
+    if selected is not None:
+        mask &= member_mask(selected, cubes.alias_cluster)
+    return mask
+
+
+def _occurrence_selection(cubes, aliases, clusters):
+    return np.flatnonzero(_alias_filter_mask(cubes, cubes.occ.present.copy(), aliases, clusters))
+
+
+def _alias_side_mask(cubes, aliases, clusters):
+    return _alias_filter_mask(cubes, np.ones(len(cubes.alias_names), dtype=bool), aliases, clusters)
+
+
+def _matched_pairs(matrix, mask_1, mask_2):
+    """Matching pair indices and their two ends in filter-side order."""
+    pairs, swapped = matrix.match(mask_1, mask_2)
+    first = np.where(swapped, matrix.pair_j[pairs], matrix.pair_i[pairs])
+    second = np.where(swapped, matrix.pair_i[pairs], matrix.pair_j[pairs])
+    return pairs, first, second
+
+
+def _cooccurrence_selection(cubes, aliases_1, aliases_2, clusters_1, clusters_2):
+    return _matched_pairs(
+        cubes.coocc,
+        _alias_side_mask(cubes, aliases_1, clusters_1),
+        _alias_side_mask(cubes, aliases_2, clusters_2),
+    )
+
+
+def _combo_labels(names, first, second):
+    labels = pd.Series(names[first], dtype=object) + " & " + pd.Series(names[second], dtype=object)
+    return labels.to_numpy(dtype=object)
+
+
+# --- Ranked pages for the bar charts ---
+
+class RankedPage:
+    """One page of ranked bars plus an optional "Other" bar for the ranks after it.
+
+    ``grouped`` has ``label, year, value`` rows; ``labels`` lists the bars
+    bottom to top (best rank on top, "Other" at the bottom), ``other_label``
+    is None when nothing follows the page.
+    """
+
+    def __init__(self, grouped, labels, n_total, page, n_pages, start, other_label):
+        self.grouped = grouped
+        self.labels = labels
+        self.n_total = n_total
+        self.page = page
+        self.n_pages = n_pages
+        self.start = start
+        self.other_label = other_label
+
+    @property
+    def n_shown(self):
+        return len(self.labels) - (self.other_label is not None)
+
+
+def _ranked_page(order, label_of, by_year, label_col, value_col, per_page, page, noun):
+    n_pages = max(1, -(-len(order) // per_page))
+    page = min(max(page, 0), n_pages - 1)
+    start = page * per_page
+    shown = order[start:start + per_page]
+    tail = order[start + per_page:]
+    labels = label_of(shown)
+    years, sums = by_year(shown)
+    grouped = _long_frame(labels, years, sums, label_col, value_col)
+    labels = labels.tolist()[::-1]
+    other_label = None
+    if len(tail):
+        other_label = f"Other ({len(tail)} more {noun})"
+        tail_years, tail_sums = by_year(tail)
+        other = _long_frame([other_label], tail_years, tail_sums.sum(axis=0, keepdims=True), label_col, value_col)
+        grouped = pd.concat([grouped, other], ignore_index=True)
+        labels = [other_label] + labels
+    return RankedPage(grouped, labels, len(order), page, n_pages, start, other_label)
+
+
+def bar_bounds(ranked, value_col):
+    """``(min cell, max cell, max bar)`` of a RankedPage, for the color and axis inputs.
+
+    Cell bounds leave out the "Other" bar so it does not stretch the color
+    scale; the bar maximum (stacked over years) includes it. Empty pages
+    give ``(0, 1, 1)``.
+    """
+    grouped = ranked.grouped
+    label_col = grouped.columns[0]
+    cells = grouped.loc[grouped[label_col] != ranked.other_label, value_col]
+    min_cell, max_cell = (int(cells.min()), int(cells.max())) if len(cells) else (0, 1)
+    stacks = grouped.groupby(label_col, observed=True)[value_col].sum()
+    max_stack = int(stacks.max()) if len(stacks) else 1
+    return min_cell, max_cell, max_stack
+
+
+def _trends(cubes, kind, date_range, rank_by, min_trend):
+    """Trends of ``kind`` when ranking or filtering by them, else None."""
+    if rank_by is None and not any(v is not None for v in (min_trend or {}).values()):
+        return None
+    return trends.trends(cubes, kind, date_range)
+
+
+def _entity_page(cube, names, entities, date_range, by_total, per_page, page, label_col, noun,
+                 trend=None, rank_by=None, min_trend=None):
+    if trend is not None:
+        entities = entities[trend.mask(min_trend)[entities]]
+    lo, hi = cube.axis.span(date_range)
+    totals = cube.totals(lo, hi, entities)
+    entities = entities[totals != 0]
+    totals = totals[totals != 0]
+    if rank_by is not None:
+        # Strongest trend first, ties by total.
+        order = entities[np.lexsort((-totals, -trend.metric(rank_by)[entities]))]
+    elif by_total:
+        order = entities[np.argsort(-totals, kind="stable")]
+    else:
+        # Codes are in alphabetical order already.
+        order = entities
+    return _ranked_page(
+        order,
+        lambda codes: names[codes],
+        lambda codes: cube.by_year(lo, hi, codes),
+        label_col, "occurrence", per_page, page, noun,
+    )
+
+
+def occurrence_page(cubes, date_range, aliases=(), clusters=(), by_total=True, per_page=50, page=0,
+                    rank_by=None, min_trend=None):
+    """Page ``page`` of the Occurrence bars, ranked by total (or A-Z), with the tail as "Other".
+
+    ``rank_by`` names a tessella.trends metric to rank by instead;
+    ``min_trend`` maps metrics to the minimum an alias must reach.
+    """
+    entities = _occurrence_selection(cubes, aliases, clusters)
+    return _entity_page(
+        cubes.occ, cubes.alias_names, entities, date_range, by_total, per_page, page, "alias", "aliases",
+        _trends(cubes, "alias", date_range, rank_by, min_trend), rank_by, min_trend,
+    )
+
+
+def cluster_occurrence_page(cubes, date_range, clusters=(), by_total=True, per_page=50, page=0,
+                            rank_by=None, min_trend=None):
+    """Like ``occurrence_page`` with one bar per cluster (the sum of its aliases)."""
+    mask = cubes.cluster_occ.present.copy()
+    selected = selection_mask(len(mask), clusters, cubes.cluster_codes)
+    if selected is not None:
+        mask &= selected
+    entities = np.flatnonzero(mask)
+    return _entity_page(
+        cubes.cluster_occ, cubes.cluster_names, entities, date_range, by_total, per_page, page, "cluster", "clusters",
+        _trends(cubes, "cluster", date_range, rank_by, min_trend), rank_by, min_trend,
+    )
+
+
+def _pair_page(matrix, names, selection, date_range, by_total, per_page, page, noun,
+               trend=None, rank_by=None, min_trend=None):
+    pairs, first, second = selection
+    if trend is not None:
+        keep = trend.mask(min_trend)[pairs]
+        pairs, first, second = pairs[keep], first[keep], second[keep]
+    lo, hi = matrix.axis.span(date_range)
+    totals = matrix.totals(lo, hi, pairs)
+    keep = totals != 0
+    pairs, first, second, totals = pairs[keep], first[keep], second[keep], totals[keep]
+    if rank_by is not None:
+        order = np.lexsort((-totals, -trend.metric(rank_by)[pairs]))
+    elif by_total:
+        order = np.argsort(-totals, kind="stable")
+    else:
+        order = np.lexsort((second, first))
+    return _ranked_page(
+        order,
+        lambda idx: _combo_labels(names, first[idx], second[idx]),
+        lambda idx: matrix.by_year(lo, hi, pairs[idx]),
+        "combo", "cooccurrence", per_page, page, noun,
+    )
+
+
+def cooccurrence_page(cubes, date_range, aliases_1=(), aliases_2=(), clusters_1=(), clusters_2=(),
+                      by_total=True, per_page=50, page=0, rank_by=None, min_trend=None):
+    """Page ``page`` of the CoOccurrence bars, ranked by total (or A-Z), with the tail as "Other".
+
+    ``rank_by`` and ``min_trend`` work as in ``occurrence_page``, on the pairs' trends.
+    """
+    selection = _cooccurrence_selection(cubes, aliases_1, aliases_2, clusters_1, clusters_2)
+    return _pair_page(
+        cubes.coocc, cubes.alias_names, selection, date_range, by_total, per_page, page, "combos",
+        _trends(cubes, "pair", date_range, rank_by, min_trend), rank_by, min_trend,
+    )
+
+
+def cluster_cooccurrence_page(cubes, date_range, clusters_1=(), clusters_2=(), by_total=True, per_page=50, page=0,
+                              rank_by=None, min_trend=None):
+    """Like ``cooccurrence_page`` with one bar per cluster pair; "X & X" sums the pairs within cluster X."""
+    n_cluster = len(cubes.cluster_names)
+    masks = []
+    for clusters in (clusters_1, clusters_2):
+        selected = selection_mask(n_cluster, clusters, cubes.cluster_codes)
+        masks.append(np.ones(n_cluster, dtype=bool) if selected is None else selected)
+    selection = _matched_pairs(cubes.cluster_coocc, *masks)
+    return _pair_page(
+        cubes.cluster_coocc, cubes.cluster_names, selection, date_range, by_total, per_page, page, "cluster pairs",
+        _trends(cubes, "cluster_pair", date_range, rank_by, min_trend), rank_by, min_trend,
+    )
+
+
+def top_partners(cubes, alias, date_range, k=10):
+    """``partner, cooccurrence`` of the k aliases co-occurring most with ``alias``."""
+    codes = cubes.alias_codes([alias])
+    if not len(codes):
+        return pd.DataFrame({"partner": [], "cooccurrence": []})
+    lo, hi = cubes.axis.span(date_range)
+    partners, totals = cubes.coocc.top_partners(codes[0], lo, hi, k)
+    return pd.DataFrame({"partner": cubes.alias_names[partners], "cooccurrence": totals})
+
+
+def country_by_year(cubes, date_range, country_names=()):
+    """``country, iso_alpha, year, occurrence`` rows for the Geo Map tab, sorted by year.
+
+    ``iso_alpha`` comes from the dataset's precomputed resolution table and
+    is None for unresolved names (see ``cubes.unresolved_countries``).
+    """
+    mask = cubes.country.present.copy()
+    selected = selection_mask(len(mask), country_names, cubes.country_codes)
+    if selected is not None:
+        mask &= selected
+    entities = np.flatnonzero(mask)
+    lo, hi = cubes.axis.span(date_range)
+    years, sums = cubes.country.by_year(lo, hi, entities)
+    rows, cols = np.nonzero(sums)
+    agg = pd.DataFrame({
+        "country": cubes.country_names[entities][rows],
+        "iso_alpha": cubes.country_iso3[entities][rows],
+        "year": years[cols].astype(int),
+        "occurrence": sums[rows, cols],
+    })
+    return agg.sort_values("year", kind="stable", ignore_index=True)
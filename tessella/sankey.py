@@ -0,0 +1,123 @@
+"""Sankey node and link arrays for the Sankey tab, built from integer codes.
+
+Levels are country -> cluster and, optionally, cluster -> alias. Node ids
+are laid out level by level (countries, then clusters, then aliases) so a
+link is just a pair of offset codes; labels are only looked up for the
+nodes that survive filtering and pruning.
+"""
+
+import numpy as np
+
+from tessella.search import selection_mask
+
+
+class SankeyGraph:
+    """Nodes and links ready for ``go.Sankey``.
+
+    ``level`` gives each node's column (0 country, 1 cluster, 2 alias);
+    ``n_pruned`` counts the links dropped by the weight and top-k limits.
+    """
+
+    def __init__(self, labels, level, source, target, value, n_pruned):
+        self.labels = labels
+        self.level = level
+        self.source = source
+        self.target = target
+        self.value = value
+        self.n_pruned = n_pruned
+
+    @property
+    def empty(self):
+        return not len(self.value)
+
+    def trace(self):
+        return dict(
+            type="sankey",
+            node=dict(label=self.labels.tolist()),
+            link=dict(source=self.source.tolist(), target=self.target.tolist(), value=self.value.tolist()),
+        )
+
+
+def _selection_mask(n, selection, to_codes):
+    mask = selection_mask(n, selection, to_codes)
+    return np.ones(n, dtype=bool) if mask is None else mask
+
+
+def prune_links(source, value, min_weight=0, top_k=None):
+    """Mask of links kept: weight at least ``min_weight`` and among the ``top_k`` heaviest of their source."""
+    keep = (value > 0) & (value >= min_weight)
+    if top_k:
+        order = np.lexsort((-value, source))
+        ranked = source[order]
+        starts = np.r_[0, np.flatnonzero(ranked[1:] != ranked[:-1]) + 1]
+        rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        in_top = np.zeros(len(order), dtype=bool)
+        in_top[order] = rank < top_k
+        keep &= in_top
+    return keep
+
+
+def _country_cluster_links(cubes, lo, hi, country_mask, cluster_mask):
+    n_cluster = len(cubes.cluster_names)
+    totals = cubes.country_cluster.totals(lo, hi).reshape(-1, n_cluster)
+    totals = totals * country_mask[:, None] * cluster_mask[None, :]
+    country, cluster = np.nonzero(totals)
+    return country, cluster, totals[country, cluster]
+
+
+def _cluster_alias_links(cubes, lo, hi, country_mask, cluster_mask):
+    """Cluster -> alias weights: each alias's occurrence in the selected countries, under each selected cluster it belongs to."""
+    n_alias = len(cubes.alias_names)
+    keys = cubes.country_alias.entities
+    keys = keys[country_mask[keys // max(n_alias, 1)]]
+    totals = cubes.country_alias.totals(lo, hi, keys)
+    alias_totals = np.bincount(keys % max(n_alias, 1), weights=totals, minlength=n_alias).astype(totals.dtype)
+    members = cluster_mask[cubes.member_cluster]
+    alias = cubes.member_alias[members]
+    cluster = cubes.member_cluster[members]
+    value = alias_totals[alias]
+    keep = value != 0
+    return cluster[keep], alias[keep], value[keep]
+
+
+def build_sankey(cubes, date_range, country_names=(), clusters=(), with_aliases=False, min_weight=0, top_k=None):
+    """Country -> cluster (-> alias) Sankey for ``date_range``.
+
+    An alias listed under several clusters counts towards each of them. Links
+    lighter than ``min_weight`` or outside the ``top_k`` heaviest per source
+    node are pruned level by level: a cluster whose inflow is all pruned
+    loses its alias links too, and nodes left without links are dropped.
+    """
+    n_country = len(cubes.country_names)
+    n_cluster = len(cubes.cluster_names)
+    country_mask = _selection_mask(n_country, country_names, cubes.country_codes)
+    cluster_mask = _selection_mask(n_cluster, clusters, cubes.cluster_codes)
+    lo, hi = cubes.axis.span(date_range)
+
+    country, cluster, value = _country_cluster_links(cubes, lo, hi, country_mask, cluster_mask)
+    keep = prune_links(country, value, min_weight, top_k)
+    n_pruned = int((value > 0).sum() - keep.sum())
+    country, cluster, value = country[keep], cluster[keep], value[keep]
+    source = [country]
+    target = [n_country + cluster]
+    values = [value]
+    if with_aliases and cubes.country_alias is not None:
+        # Only clusters that still have inflow after pruning the level above keep their aliases.
+        fed = np.zeros(n_cluster, dtype=bool)
+        fed[cluster] = True
+        cluster, alias, value = _cluster_alias_links(cubes, lo, hi, country_mask, cluster_mask)
+        keep = prune_links(cluster, value, min_weight, top_k) & fed[cluster]
+        n_pruned += int((value > 0).sum() - keep.sum())
+        source.append(n_country + cluster[keep])
+        target.append(n_country + n_cluster + alias[keep])
+        values.append(value[keep])
+    source = np.concatenate(source).astype(np.int64)
+    target = np.concatenate(target).astype(np.int64)
+    value = np.concatenate(values)
+
+    # Renumber the surviving nodes 0..n-1, keeping the level-by-level order.
+    nodes, inverse = np.unique(np.r_[source, target], return_inverse=True)
+    source, target = inverse[:len(source)], inverse[len(source):]
+    level = np.searchsorted([n_country, n_country + n_cluster], nodes, side="right")
+    names = np.concatenate([cubes.country_names, cubes.cluster_names, cubes.alias_names])
+    return SankeyGraph(names[nodes], level, source, target, value, n_pruned)
@@ -0,0 +1,130 @@
+"""Search over alias, country and cluster names, and compact selections of them.
+
+``NameIndex`` answers search-as-you-type queries without scanning every
+name: each name is split into words and an inverted index maps each word
+(kept sorted) to the codes of the names containing it. A query matches the
+names that have, for every word of the query, a word starting with it, so
+"hydro cell" finds "Hydrogen fuel cell". A prefix range of the sorted words
+is found by binary search.
+
+``CodeSet`` is what the sidebar hands to the queries instead of the list of
+every selected name: either the few codes picked ("only these") or the few
+codes left out ("all except these"), so neither the widget payload nor the
+filter cost grows with the vocabulary.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+_WORD = re.compile(r"\w+")
+
+
+class NameIndex:
+    """Word-prefix index over a sorted vocabulary (codes are positions in ``names``)."""
+
+    def __init__(self, names):
+        self.names = np.asarray(names, dtype=object)
+        lower = pd.Series(self.names, dtype=object).astype(str).str.casefold()
+        self._lower = lower.to_numpy(dtype=object)
+        words = lower.str.findall(_WORD.pattern)
+        n_words = words.str.len().to_numpy(dtype=np.int64)
+        flat = np.fromiter((w for ws in words for w in ws), dtype=object, count=int(n_words.sum()))
+        codes = np.repeat(np.arange(len(self.names), dtype=np.int64), n_words)
+        word_codes, self.words = pd.factorize(flat, sort=True)
+        self.words = np.asarray(self.words, dtype=object)
+        # Postings: codes of the names containing each word, grouped by word (CSR layout).
+        key = np.unique(word_codes.astype(np.int64) * max(len(self.names), 1) + codes)
+        self._postings = key % max(len(self.names), 1)
+        self._offsets = np.searchsorted(key // max(len(self.names), 1), np.arange(len(self.words) + 1))
+
+    def __len__(self):
+        return len(self.names)
+
+    def _prefix(self, token):
+        lo = np.searchsorted(self.words, token, side="left")
+        hi = np.searchsorted(self.words, token + "\U0010ffff", side="left")
+        return np.unique(self._postings[self._offsets[lo]:self._offsets[hi]])
+
+    def search(self, query, within=None):
+        """Codes of the names matching ``query``, names starting with it first, then A-Z.
+
+        An empty query matches every name. ``within`` is an optional mask of
+        the codes to consider (e.g. aliases present in the current table).
+        """
+        text = query.casefold().strip()
+        tokens = _WORD.findall(text)
+        if tokens:
+            matches = None
+            # Longest tokens first: they usually have the shortest postings.
+            for token in sorted(set(tokens), key=len, reverse=True):
+                hits = self._prefix(token)
+                matches = hits if matches is None else np.intersect1d(matches, hits, assume_unique=True)
+                if not len(matches):
+                    break
+        else:
+            matches = np.arange(len(self.names))
+        if within is not None:
+            matches = matches[np.asarray(within)[matches]]
+        if text and len(matches):
+            starts = np.fromiter((name.startswith(text) for name in self._lower[matches]), dtype=bool, count=len(matches))
+            matches = np.r_[matches[starts], matches[~starts]]
+        return matches
+
+
+class CodeSet:
+    """A selection of vocabulary codes: only ``codes``, or every code except them."""
+
+    def __init__(self, codes=(), exclude=False):
+        self.codes = np.unique(np.asarray(codes, dtype=np.int64))
+        self.exclude = exclude
+
+    @classmethod
+    def everything(cls):
+        return cls((), exclude=True)
+
+    @classmethod
+    def picked(cls, codes, exclude=False):
+        """Only (or all except) the picked ``codes``; picking nothing selects everything in either mode."""
+        return cls(codes, exclude) if len(codes) else cls.everything()
+
+    @property
+    def is_everything(self):
+        return self.exclude and not len(self.codes)
+
+    def mask(self, n):
+        mask = np.full(n, self.exclude, dtype=bool)
+        mask[self.codes[self.codes < n]] = not self.exclude
+        return mask
+
+    def key(self):
+        """Small canonical description, e.g. for cache keys."""
+        return ("except" if self.exclude else "only", self.codes.tolist())
+
+    def __repr__(self):
+        return f"CodeSet({self.codes.tolist()!r}, exclude={self.exclude})"
+
+
+def selection_mask(n, selection, to_codes):
+    """Mask of the selected codes, or None when ``selection`` selects everything.
+
+    ``selection`` is a CodeSet, or a list of names converted by ``to_codes``
+    where an empty list means no filter.
+    """
+    if isinstance(selection, CodeSet):
+        return None if selection.is_everything else selection.mask(n)
+    if not len(selection):
+        return None
+    mask = np.zeros(n, dtype=bool)
+    mask[to_codes(selection)] = True
+    return mask
+
+
+def member_mask(selected, codes):
+    """``selected[codes]`` with missing codes (-1) unselected."""
+    codes = np.asarray(codes)
+    out = np.zeros(len(codes), dtype=bool)
+    valid = codes >= 0
+    out[valid] = selected[codes[valid]]
+    return out
@@ -0,0 +1,178 @@
+"""Synthetic lookup tables at configurable scale, for benchmarks.
+
+``generate(folder, rows)`` writes the four CSVs the dashboard expects, with
+roughly ``rows`` rows in each monthly table. Alias popularity follows a
+Zipf-like law and aliases in the same cluster co-occur more often, so the
+ranking, paging and pruning paths see realistic skew. Rows are generated
+and written in chunks, so tens of millions of rows need little memory.
+Within a chunk each key (alias and month, pair and month, ...) is listed
+once with its summed count; chunks may repeat a key, which the dashboard
+sums like any source that does.
+
+Run ``python -m tessella.synthetic FOLDER --rows 10000000`` to write a
+dataset, then point ``python -m tessella.bench`` (or the dashboard's
+``demo_dir``) at it.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from tessella.dataset import TABLE_FILES
+
+# Preset sizes: rows per monthly table.
+SCALES = {
+    "demo": 20_000,
+    "small": 200_000,
+    "medium": 2_000_000,
+    "large": 20_000_000,
+}
+
+COUNTRY_NAMES = [
+    "United States", "China", "Germany", "United Kingdom", "Japan", "France", "India", "Italy",
+    "Canada", "South Korea", "Spain", "Australia", "Brazil", "Netherlands", "Russia", "Switzerland",
+    "Sweden", "Iran", "Poland", "Belgium", "Denmark", "Austria", "Norway", "Finland", "Portugal",
+    "Mexico", "Turkey", "Israel", "Singapore", "Ireland", "Greece", "Czechia", "Egypt", "Saudi Arabia",
+    "South Africa", "Argentina", "Chile", "Malaysia", "Thailand", "Pakistan", "New Zealand", "Nigeria",
+]
+
+
+def default_sizes(rows):
+    """Vocabulary sizes that grow with the row count, as they do in real extracts."""
+    n_alias = int(min(200_000, max(500, 40 * np.sqrt(rows))))
+    return {
+        "n_alias": n_alias,
+        "n_cluster": int(min(500, max(10, n_alias // 100))),
+        "n_country": len(COUNTRY_NAMES),
+        "n_months": 240,
+    }
+
+
+def _zipf_weights(n, a=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** a
+    return weights / weights.sum()
+
+
+def _names(prefix, n):
+    width = len(str(n))
+    return np.array([f"{prefix} {i:0{width}d}" for i in range(n)], dtype=object)
+
+
+def _summed(df):
+    """One row per key (every column but the last, the count), summing the counts of repeated keys."""
+    return df.groupby(list(df.columns[:-1]), as_index=False, sort=False)[df.columns[-1]].sum()
+
+
+def _write_chunks(path, columns, make_chunk, rows, chunk_rows, rng):
+    with open(path, "w", newline="") as f:
+        f.write(",".join(columns) + "\n")
+        for start in range(0, rows, chunk_rows):
+            make_chunk(min(chunk_rows, rows - start), rng).to_csv(f, header=False, index=False)
+
+
+def generate(folder, rows=SCALES["demo"], seed=0, chunk_rows=1_000_000, **sizes):
+    """Write the four lookup CSVs to ``folder``; returns the sizes used.
+
+    ``rows`` is the number of rows drawn for each monthly table (the
+    co-occurrence table gets twice that, as it lists both orientations);
+    fewer are written, as draws of the same key are summed into one row.
+    ``n_alias``, ``n_cluster``, ``n_country`` and ``n_months`` override the
+    defaults from ``default_sizes``.
+    """
+    sizes = {**default_sizes(rows), **sizes}
+    n_alias, n_cluster, n_country, n_months = sizes["n_alias"], sizes["n_cluster"], sizes["n_country"], sizes["n_months"]
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+
+    aliases = _names("Alias", n_alias)
+    clusters = _names("Cluster", n_cluster)
+    countries = np.array((COUNTRY_NAMES * (n_country // len(COUNTRY_NAMES) + 1))[:n_country], dtype=object)
+    if n_country > len(COUNTRY_NAMES):
+        countries[len(COUNTRY_NAMES):] = _names("Country", n_country - len(COUNTRY_NAMES))
+    months = pd.period_range("2005-01", periods=n_months, freq="M").to_timestamp().strftime("%Y-%m-%d").to_numpy(dtype=object)
+    alias_p = _zipf_weights(n_alias)
+    country_p = _zipf_weights(n_country, 0.8)
+    # Later months are busier, as publication counts grow over time.
+    month_p = np.linspace(1.0, 3.0, n_months)
+    month_p /= month_p.sum()
+
+    # Each alias in one cluster; a few also in a second one.
+    alias_cluster = rng.integers(0, n_cluster, n_alias)
+    extra = np.flatnonzero(rng.random(n_alias) < 0.03)
+    member_alias = np.r_[np.arange(n_alias), extra]
+    member_cluster = np.r_[alias_cluster, rng.integers(0, n_cluster, len(extra))]
+    pd.DataFrame({"alias": aliases[member_alias], "cluster_name": clusters[member_cluster]}).to_csv(
+        os.path.join(folder, TABLE_FILES["fact_alias_cluster"]), index=False,
+    )
+    # Aliases grouped by cluster, to draw same-cluster partners.
+    by_cluster = np.argsort(alias_cluster, kind="stable")
+    cluster_start = np.r_[0, np.cumsum(np.bincount(alias_cluster, minlength=n_cluster))]
+
+    def occ_chunk(n, rng):
+        return _summed(pd.DataFrame({
+            "alias": rng.choice(n_alias, n, p=alias_p),
+            "month": rng.choice(n_months, n, p=month_p),
+            "occurrence": rng.geometric(0.05, n),
+        })).assign(alias=lambda df: aliases[df["alias"]], month=lambda df: months[df["month"]])
+
+    def coocc_chunk(n, rng):
+        half = max(n // 2, 1)
+        a = rng.choice(n_alias, half, p=alias_p)
+        # Half of the partners come from the same cluster.
+        same = rng.random(half) < 0.5
+        c = alias_cluster[a]
+        size = cluster_start[c + 1] - cluster_start[c]
+        partner = np.where(
+            same, by_cluster[cluster_start[c] + (rng.random(half) * size).astype(np.int64)], rng.choice(n_alias, half, p=alias_p),
+        )
+        ok = partner != a
+        a, b = a[ok], partner[ok]
+        pairs = _summed(pd.DataFrame({
+            "i": np.minimum(a, b),
+            "j": np.maximum(a, b),
+            "month": rng.choice(n_months, len(a), p=month_p),
+            "cooccurrence": rng.geometric(0.15, len(a)),
+        }))
+        i, j, month, counts = aliases[pairs["i"]], aliases[pairs["j"]], months[pairs["month"]], pairs["cooccurrence"]
+        # Every pair is listed in both orientations with the same count.
+        return pd.DataFrame({
+            "alias_row": np.r_[i, j],
+            "alias_col": np.r_[j, i],
+            "month": np.r_[month, month],
+            "cooccurrence": np.r_[counts, counts],
+        })
+
+    def country_chunk(n, rng):
+        return _summed(pd.DataFrame({
+            "alias": rng.choice(n_alias, n, p=alias_p),
+            "country": rng.choice(n_country, n, p=country_p),
+            "month": rng.choice(n_months, n, p=month_p),
+            "occurrence": rng.geometric(0.1, n),
+        })).assign(
+            alias=lambda df: aliases[df["alias"]], country=lambda df: countries[df["country"]],
+            month=lambda df: months[df["month"]],
+        )
+
+    _write_chunks(os.path.join(folder, TABLE_FILES["occ"]), ["alias", "month", "occurrence"], occ_chunk, rows, chunk_rows, rng)
+    _write_chunks(
+        os.path.join(folder, TABLE_FILES["coocc"]), ["alias_row", "alias_col", "month", "cooccurrence"],
+        coocc_chunk, rows * 2, chunk_rows, rng,
+    )
+    _write_chunks(
+        os.path.join(folder, TABLE_FILES["country"]), ["alias", "country", "month", "occurrence"],
+        country_chunk, rows, chunk_rows, rng,
+    )
+    return sizes
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write synthetic lookup CSVs for benchmarking.")
+    parser.add_argument("folder", help="output folder")
+    parser.add_argument("--rows", default="demo", help=f"rows per monthly table, or one of {', '.join(SCALES)}")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rows = SCALES[args.rows] if args.rows in SCALES else int(args.rows)
+    print(generate(args.folder, rows, seed=args.seed))
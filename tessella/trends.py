@@ -0,0 +1,130 @@
+"""Trend metrics for every alias, cluster and pair, for horizon scanning.
+
+The cubes' running totals are cut into equal time buckets ending at the
+end of the selected date range (``BUCKET_MONTHS`` long, a year by default;
+a partial first bucket is dropped), giving a dense entities x buckets count
+matrix. Three metrics are then computed for all entities at once:
+
+* growth: the per-bucket growth rate of a least-squares line through
+  ``log(1 + count)``, e.g. 0.25 = +25% a year,
+* ratio: mean count in the last ``RECENT_BUCKETS`` buckets over the mean
+  in the buckets before them (both plus one, so new entities get a large
+  but finite ratio instead of a division by zero),
+* burst: the largest recent bucket's excess over the baseline mean in
+  Poisson standard deviations, ``(count - mean) / sqrt(mean + 1)``.
+
+Pairs are processed in chunks of ``TREND_CHUNK`` rows to bound memory.
+Results are cached per cubes (dataset version), entity kind and date range.
+"""
+
+import os
+
+import numpy as np
+
+from tessella import instrument
+from tessella.cache import LRUCache
+from tessella.cubes import DenseCube
+
+BUCKET_MONTHS = int(os.environ.get("TESSELLA_TREND_BUCKET_MONTHS", "12"))
+RECENT_BUCKETS = 2
+TREND_CHUNK = 100_000
+
+# Metric -> label for sort options and captions.
+METRICS = {
+    "growth": "Growth rate",
+    "ratio": "Recent vs baseline",
+    "burst": "Burst score",
+}
+
+_trend_cache = LRUCache(max_entries=32)
+
+
+def trend_cache():
+    return _trend_cache
+
+
+class Trends:
+    """Metric arrays indexed like the cube's entities (alias/cluster codes or pair indices)."""
+
+    def __init__(self, growth, ratio, burst, n_buckets):
+        self.growth = growth
+        self.ratio = ratio
+        self.burst = burst
+        self.n_buckets = n_buckets
+
+    def metric(self, name):
+        return getattr(self, name)
+
+    def mask(self, minimums):
+        """Entities whose metrics reach every ``{metric: minimum}`` (None minimums are ignored)."""
+        mask = np.ones(len(self.growth), dtype=bool)
+        for name, minimum in (minimums or {}).items():
+            if minimum is not None:
+                mask &= self.metric(name) >= minimum
+        return mask
+
+
+def bucket_edges(lo, hi, bucket_months=BUCKET_MONTHS):
+    """Bucket edges in [lo, hi), whole buckets counted back from ``hi``."""
+    n = (hi - lo) // bucket_months
+    if n < 1:
+        return np.array([lo, hi], dtype=np.int64)
+    return hi - bucket_months * np.arange(n, -1, -1, dtype=np.int64)
+
+
+def metrics(counts, recent_buckets=RECENT_BUCKETS):
+    """``(growth, ratio, burst)`` for each row of an entities x buckets count matrix."""
+    counts = np.asarray(counts, dtype=np.float64)
+    n, n_buckets = counts.shape
+    if n_buckets < 2:
+        zeros = np.zeros(n)
+        return zeros, np.ones(n), zeros
+    recent_buckets = min(recent_buckets, n_buckets - 1)
+    t = np.arange(n_buckets) - (n_buckets - 1) / 2
+    growth = np.expm1(np.log1p(counts) @ t / (t @ t))
+    baseline = counts[:, :-recent_buckets].mean(axis=1)
+    recent = counts[:, -recent_buckets:]
+    ratio = (recent.mean(axis=1) + 1) / (baseline + 1)
+    burst = ((recent - baseline[:, None]) / np.sqrt(baseline + 1)[:, None]).max(axis=1)
+    return growth, ratio, burst
+
+
+def _bucket_counts(cube, edges, start, stop):
+    if isinstance(cube, DenseCube):
+        return np.diff(cube.cum[start:stop][:, edges], axis=1)
+    return np.diff(cube._at(np.arange(start, stop), edges), axis=1)
+
+
+def compute(cube, n_entities, lo, hi, bucket_months=BUCKET_MONTHS, recent_buckets=RECENT_BUCKETS):
+    """Trends of every entity of a DenseCube or SparseCube over the buckets of [lo, hi)."""
+    edges = bucket_edges(lo, hi, bucket_months)
+    growth = np.zeros(n_entities)
+    ratio = np.ones(n_entities)
+    burst = np.zeros(n_entities)
+    for start in range(0, n_entities, TREND_CHUNK):
+        stop = min(start + TREND_CHUNK, n_entities)
+        counts = _bucket_counts(cube, edges, start, stop)
+        growth[start:stop], ratio[start:stop], burst[start:stop] = metrics(counts, recent_buckets)
+    return Trends(growth, ratio, burst, len(edges) - 1)
+
+
+# Entity kind -> (cube, entity count) of a Cubes object.
+_KINDS = {
+    "alias": lambda cubes: (cubes.occ, cubes.occ.n_entities),
+    "cluster": lambda cubes: (cubes.cluster_occ, cubes.cluster_occ.n_entities),
+    "pair": lambda cubes: (cubes.coocc.cube, cubes.coocc.n_pairs),
+    "cluster_pair": lambda cubes: (cubes.cluster_coocc.cube, cubes.cluster_coocc.n_pairs),
+}
+
+
+def trends(cubes, kind, date_range):
+    """Trends of every alias, cluster, pair or cluster_pair of ``cubes`` in ``date_range`` (cached)."""
+    lo, hi = cubes.axis.span(date_range)
+    key = (cubes.key, kind, lo, hi, BUCKET_MONTHS, RECENT_BUCKETS)
+
+    def build():
+        cube, n_entities = _KINDS[kind](cubes)
+        with instrument.stage(f"trends ({kind})"):
+            return compute(cube, n_entities, lo, hi)
+
+    return _trend_cache.get_or_create(key, build)
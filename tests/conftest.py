@@ -0,0 +1,124 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tessella.dataset import TABLE_FILES, load_dataset
+
+ALIASES = ["alpha", "beta", "delta", "epsilon", "eta", "gamma", "theta", "zeta"]
+COUNTRIES = ["Brazil", "France", "Germany", "Japan"]
+CLUSTERS = {
+    "alpha": "fuels", "beta": "fuels", "gamma": "storage", "delta": "storage",
+    "epsilon": "grid", "zeta": "grid", "eta": "fuels",
+}
+MONTHS = pd.date_range("2018-01-01", "2021-12-01", freq="MS")
+
+# Whole dataset, a range inside it, and one starting mid-month (its first month is left out).
+DATE_RANGES = [
+    (datetime.date(2018, 1, 1), datetime.date(2021, 12, 1)),
+    (datetime.date(2019, 3, 1), datetime.date(2020, 10, 1)),
+    (datetime.date(2019, 3, 15), datetime.date(2021, 1, 1)),
+]
+
+
+def make_tables(seed=0):
+    """Small lookup tables as the dashboard reads them, with repeated keys and one-sided co-occurrence rows."""
+    rng = np.random.default_rng(seed)
+    occ = pd.DataFrame({
+        "alias": rng.choice(ALIASES, 120),
+        "month": rng.choice(MONTHS, 120),
+        "occurrence": rng.integers(1, 20, 120),
+    })
+
+    pairs = [(a, b) for a in ALIASES for b in ALIASES if a < b]
+    keys = pd.DataFrame({
+        "pair": rng.integers(0, len(pairs), 150),
+        "month": rng.choice(MONTHS, 150),
+    }).drop_duplicates(ignore_index=True)
+    row = np.array([pairs[p][0] for p in keys["pair"]], dtype=object)
+    col = np.array([pairs[p][1] for p in keys["pair"]], dtype=object)
+    counts = rng.integers(1, 10, len(keys))
+    # Most (pair, month) keys are listed in both orientations, some only one way round.
+    kind = rng.choice(["both", "forward", "reverse"], len(keys), p=[0.6, 0.2, 0.2])
+    forward = kind != "reverse"
+    backward = kind != "forward"
+    coocc = pd.concat([
+        pd.DataFrame({"alias_row": row[forward], "alias_col": col[forward], "month": keys["month"][forward], "cooccurrence": counts[forward]}),
+        pd.DataFrame({"alias_row": col[backward], "alias_col": row[backward], "month": keys["month"][backward], "cooccurrence": counts[backward]}),
+    ], ignore_index=True)
+
+    country = pd.DataFrame({
+        "alias": rng.choice(ALIASES, 150),
+        "country": rng.choice(COUNTRIES, 150),
+        "month": rng.choice(MONTHS, 150),
+        "occurrence": rng.integers(1, 20, 150),
+    })
+    # "theta" has no cluster, "beta" has two.
+    fact = pd.DataFrame({
+        "alias": list(CLUSTERS) + ["beta"],
+        "cluster_name": list(CLUSTERS.values()) + ["storage"],
+    })
+    return {"occ": occ, "coocc": coocc, "country": country, "fact_alias_cluster": fact}
+
+
+def write_tables(folder, tables):
+    os.makedirs(folder, exist_ok=True)
+    for name, df in tables.items():
+        df = df.copy()
+        if "month" in df:
+            df["month"] = pd.to_datetime(df["month"]).dt.strftime("%Y-%m-%d")
+        df.to_csv(os.path.join(folder, TABLE_FILES[name]), index=False)
+    return folder
+
+
+def in_range(df, date_range):
+    """Rows of ``df`` in the months ``date_range`` covers (a start after the 1st skips its month)."""
+    start, end = date_range
+    first = pd.Timestamp(start.year, start.month, 1)
+    if start.day > 1:
+        first += pd.offsets.MonthBegin(1)
+    last = pd.Timestamp(end.year, end.month, 1)
+    months = pd.to_datetime(df["month"])
+    return df[(months >= first) & (months <= last)]
+
+
+def rows(df, columns):
+    """Sorted plain tuples of ``columns``, so frames compare whatever their dtypes."""
+    return sorted(
+        tuple(value.item() if isinstance(value, np.generic) else value for value in row)
+        for row in df[columns].itertuples(index=False)
+    )
+
+
+def cooccurrence_reference(coocc):
+    """One row per unordered pair and month: the alias_row <= alias_col rows when both orientations are listed."""
+    df = coocc.assign(
+        first=np.minimum(coocc["alias_row"], coocc["alias_col"]),
+        second=np.maximum(coocc["alias_row"], coocc["alias_col"]),
+        forward=coocc["alias_row"] <= coocc["alias_col"],
+    )
+    both = df.groupby(["first", "second", "month"])["forward"].transform("nunique") == 2
+    df = df[~both | df["forward"]]
+    return df.groupby(["first", "second", "month"])["cooccurrence"].sum().reset_index()
+
+
+@pytest.fixture(scope="session")
+def tables():
+    return make_tables()
+
+
+@pytest.fixture(scope="session")
+def cache_dir(tmp_path_factory):
+    return str(tmp_path_factory.mktemp("cache"))
+
+
+@pytest.fixture(scope="session")
+def dataset(tables, tmp_path_factory, cache_dir):
+    return load_dataset(None, write_tables(str(tmp_path_factory.mktemp("data")), tables), cache_dir)
+
+
+@pytest.fixture(scope="session")
+def cubes(dataset):
+    return dataset.cubes()
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from conftest import DATE_RANGES, rows
+from tessella.backends import DuckDBBackend, PandasBackend
+from tessella.search import CodeSet
+
+pytest.importorskip("duckdb")
+
+EVERYTHING = CodeSet.everything()
+
+
+@pytest.fixture(scope="module")
+def backends(dataset, tmp_path_factory):
+    # A quote in the path checks that Parquet paths are escaped in the SQL.
+    path = str(tmp_path_factory.mktemp("parquet") / "o'brien")
+    return DuckDBBackend(dataset, path), PandasBackend(dataset)
+
+
+def assert_same_page(got, want, label_col, value_col):
+    assert got.labels == want.labels
+    assert (got.n_total, got.page, got.n_pages, got.other_label) == (want.n_total, want.page, want.n_pages, want.other_label)
+    assert rows(got.grouped, [label_col, "year", value_col]) == rows(want.grouped, [label_col, "year", value_col])
+    assert got.grouped[value_col].dtype == want.grouped[value_col].dtype
+
+
+@pytest.mark.parametrize("date_range", DATE_RANGES)
+@pytest.mark.parametrize("filters", [
+    (EVERYTHING, EVERYTHING),
+    (["alpha", "eta", "theta", "nope"], []),
+    (CodeSet([0, 2], exclude=True), ["fuels"]),
+])
+@pytest.mark.parametrize("by_total,page", [(True, 0), (True, 1), (False, 0)])
+def test_occurrence_page(backends, date_range, filters, by_total, page):
+    sql, pandas = backends
+    assert_same_page(
+        sql.occurrence_page(date_range, *filters, by_total=by_total, per_page=3, page=page),
+        pandas.occurrence_page(date_range, *filters, by_total=by_total, per_page=3, page=page),
+        "alias", "occurrence",
+    )
+
+
+@pytest.mark.parametrize("date_range", DATE_RANGES)
+@pytest.mark.parametrize("filters", [
+    (EVERYTHING, EVERYTHING, EVERYTHING, EVERYTHING),
+    (["beta"], [], [], []),
+    (EVERYTHING, EVERYTHING, ["storage"], CodeSet([1], exclude=True)),
+])
+@pytest.mark.parametrize("by_total,page", [(True, 0), (True, 2), (False, 0)])
+def test_cooccurrence_page(backends, date_range, filters, by_total, page):
+    sql, pandas = backends
+    assert_same_page(
+        sql.cooccurrence_page(date_range, *filters, by_total=by_total, per_page=4, page=page),
+        pandas.cooccurrence_page(date_range, *filters, by_total=by_total, per_page=4, page=page),
+        "combo", "cooccurrence",
+    )
+
+
+@pytest.mark.parametrize("date_range", DATE_RANGES)
+@pytest.mark.parametrize("countries", [EVERYTHING, ["France", "Japan"], CodeSet([0], exclude=True)])
+def test_country_by_year(backends, date_range, countries):
+    sql, pandas = backends
+    got = sql.country_by_year(date_range, countries)
+    want = pandas.country_by_year(date_range, countries)
+    assert rows(got, ["country", "iso_alpha", "year", "occurrence"]) == rows(want, ["country", "iso_alpha", "year", "occurrence"])
+    assert got["occurrence"].dtype == want["occurrence"].dtype
+
+
+def test_sidebar_lookups(backends):
+    sql, pandas = backends
+    for table in ("occ", "coocc", "country"):
+        assert sql.has(table) and pandas.has(table)
+        assert np.array_equal(sql.present(table), pandas.present(table))
+    for vocab, query in (("alias", "et"), ("country", "fr"), ("cluster", "s")):
+        assert np.array_equal(sql.name_index(vocab).search(query), pandas.name_index(vocab).search(query))
+    assert np.array_equal(sql.codes("alias", ["zeta", "nope", "beta"]), pandas.codes("alias", ["zeta", "nope", "beta"]))
+
+
+def test_trends_need_the_pandas_backend(backends):
+    sql, pandas = backends
+    assert pandas.supports_trends and not sql.supports_trends
+    with pytest.raises(ValueError, match="trend"):
+        sql.occurrence_page(DATE_RANGES[0], rank_by="growth")
+    with pytest.raises(ValueError, match="trend"):
+        sql.cooccurrence_page(DATE_RANGES[0], min_trend={"burst": 2.0})
+    # Empty trend filters are no trend filters.
+    sql.occurrence_page(DATE_RANGES[0], min_trend={"growth": None, "ratio": None, "burst": None})
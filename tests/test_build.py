@@ -0,0 +1,91 @@
+import collections
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tessella import build
+from tessella.dataset import TABLE_FILES
+
+ALIASES = [f"a{i:02d}" for i in range(30)]
+COUNTRIES = ["Brazil", "France", "Japan"]
+
+
+def make_records(seed=0, n=300):
+    rng = np.random.default_rng(seed)
+    ids = [f"p{i}" for i in rng.integers(0, 220, n)]  # many ids repeat, far apart
+    ids[5] = ids[17] = ""  # blank ids are never merged
+    ids[40] = ids[260] = None
+    months = rng.choice(pd.date_range("2019-01-01", "2020-12-01", freq="MS").strftime("%Y-%m-%d"), n).tolist()
+    months[7] = "not a month"
+    months[123] = "2020-02-30"
+    aliases = [list(rng.choice(ALIASES, rng.integers(0, 6))) for _ in range(n)]
+    aliases[11] = aliases[11] + [aliases[11][0]] if aliases[11] else ["a00", "a00"]  # listed twice
+    aliases[50] = ALIASES  # far more pairs than a shard holds
+    ids[50] = "big"
+    countries = [list(rng.choice(COUNTRIES, rng.integers(0, 3))) for _ in range(n)]
+    return pd.DataFrame({"id": ids, "month": months, "countries": countries, "aliases": aliases})
+
+
+def naive_counts(records):
+    """Publications per key and month, with plain Python loops."""
+    seen = set()
+    occ, coocc, country = collections.Counter(), collections.Counter(), collections.Counter()
+    rejected = []
+    for number, (pub_id, month, countries, aliases) in enumerate(records.itertuples(index=False), start=1):
+        if isinstance(pub_id, str) and pub_id.strip():
+            if pub_id in seen:
+                continue
+            seen.add(pub_id)
+        month = pd.to_datetime(month, errors="coerce")
+        if pd.isna(month):
+            rejected.append(number)
+            continue
+        month = month.strftime("%Y-%m-01")
+        for alias in set(aliases):
+            occ[alias, month] += 1
+            for name in set(countries):
+                country[alias, name, month] += 1
+        for a, b in itertools.permutations(set(aliases), 2):
+            coocc[a, b, month] += 1
+    return {"occ": occ, "coocc": coocc, "country": country}, rejected
+
+
+def read_counts(out_dir, table):
+    keys, value = build.TABLES[table]
+    df = pd.read_csv(os.path.join(out_dir, TABLE_FILES[table]), dtype={value: np.int64}, keep_default_na=False)
+    assert not df.duplicated(keys).any()
+    return collections.Counter({tuple(row[:-1]): row[-1] for row in df[keys + [value]].itertuples(index=False)})
+
+
+@pytest.mark.parametrize("chunk_rows", [40, 1000])
+def test_build_matches_naive_count(tmp_path, chunk_rows):
+    records = make_records()
+    chunks = [records.iloc[i:i + chunk_rows] for i in range(0, len(records), chunk_rows)]
+    out_dir = str(tmp_path / "out")
+    n_shards, report = build.build(chunks, out_dir, workers=2, max_pairs=50, n_partitions=4, tmp_dir=str(tmp_path))
+    assert n_shards > 1
+
+    expected, rejected = naive_counts(records)
+    for table in build.TABLES:
+        assert read_counts(out_dir, table) == expected[table], table
+    assert report.rows == len(records)
+    assert report.invalid_rows == len(rejected)
+    assert [line for line, *_ in report.errors] == rejected
+    assert report.errors[0][1:] == ("month", "not a month", "not a date")
+
+    fact = pd.read_csv(os.path.join(out_dir, TABLE_FILES["fact_alias_cluster"]))
+    assert sorted(fact["alias"]) == sorted({alias for alias, _ in expected["occ"]})
+    assert set(fact["cluster_name"]) == {build.UNCLUSTERED}
+
+
+def test_big_publication_is_split_into_blocks():
+    shard = pd.DataFrame({"id": ["big"], "month": ["2020-01-01"], "countries": [[]], "aliases": [ALIASES], "record": [1]})
+    pieces = [df for table, df in build.count_shard(shard, max_pairs=100) if table == "coocc"]
+    assert len(pieces) > 1
+    assert max(len(df) for df in pieces) <= 100
+    pairs = pd.concat(pieces)
+    assert len(pairs) == len(ALIASES) * (len(ALIASES) - 1) // 2
+    assert (pairs["alias_row"] < pairs["alias_col"]).all() and (pairs["cooccurrence"] == 1).all()
@@ -0,0 +1,28 @@
+import os
+
+from tessella import countries
+
+
+def test_rows_in_the_table_are_final(tmp_path):
+    cache_dir = str(tmp_path)
+    iso3, unresolved = countries.resolve_countries(["France", "UK", "Atlantis"], cache_dir)
+    assert iso3 == ["FRA", "GBR", None]
+    assert unresolved == ["Atlantis"]
+
+    # A maintainer pins France as unresolved and fixes Atlantis by hand.
+    path = countries.mapping_path(cache_dir)
+    mapping = countries.read_mapping(path)
+    mapping["France"] = (None, "manual")
+    mapping["Atlantis"] = ("GRC", "manual")
+    countries.write_mapping(path, mapping)
+    written = os.stat(path).st_mtime_ns
+
+    iso3, unresolved = countries.resolve_countries(["France", "Atlantis", "UK"], cache_dir)
+    assert iso3 == [None, "GRC", "GBR"]
+    assert unresolved == ["France"]
+    assert os.stat(path).st_mtime_ns == written
+
+    # Only a name missing from the table is looked up and added.
+    iso3, _ = countries.resolve_countries(["Germany"], cache_dir)
+    assert iso3 == ["DEU"]
+    assert countries.read_mapping(path)["France"] == (None, "manual")
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import ALIASES, CLUSTERS, DATE_RANGES, MONTHS, cooccurrence_reference, in_range, write_tables
+from tessella import heatmap
+from tessella.dataset import load_dataset
+
+
+@pytest.fixture(scope="module")
+def heat_tables(tables):
+    # Self pairs too, to check the diagonal is counted once.
+    selves = pd.DataFrame({
+        "alias_row": ["eta", "eta", "alpha"], "alias_col": ["eta", "eta", "alpha"],
+        "month": [MONTHS[3], MONTHS[30], MONTHS[20]], "cooccurrence": [5, 2, 4],
+    })
+    return {**tables, "coocc": pd.concat([tables["coocc"], selves], ignore_index=True)}
+
+
+@pytest.fixture(scope="module")
+def heat_cubes(heat_tables, tmp_path_factory):
+    folder = write_tables(str(tmp_path_factory.mktemp("heat")), heat_tables)
+    return load_dataset(None, folder, str(tmp_path_factory.mktemp("heat-cache"))).cubes()
+
+
+def dense_pairs(heat_tables, cubes, date_range):
+    """Symmetric alias x alias matrix of the pair totals in ``date_range``."""
+    pairs = cooccurrence_reference(in_range(heat_tables["coocc"], date_range))
+    first = cubes.alias_codes(pairs["first"])
+    second = cubes.alias_codes(pairs["second"])
+    weights = pairs["cooccurrence"].to_numpy(dtype=np.float64)
+    dense = np.zeros((len(cubes.alias_names),) * 2)
+    np.add.at(dense, (first, second), weights)
+    off = first != second
+    np.add.at(dense, (second[off], first[off]), weights[off])
+    return dense
+
+
+def binned(dense, row_edges, col_edges):
+    return np.add.reduceat(np.add.reduceat(dense, row_edges[:-1], axis=0), col_edges[:-1], axis=1)
+
+
+def test_cluster_order(heat_cubes):
+    order, clusters = heatmap.cluster_order(heat_cubes)
+    # Each alias under its first cluster A-Z ("beta" is in fuels and storage), A-Z within; no cluster last.
+    primary = dict(CLUSTERS, beta="fuels")
+    expected = sorted(CLUSTERS, key=lambda alias: (primary[alias], alias)) + ["theta"]
+    assert heat_cubes.alias_names[order].tolist() == expected
+    names = [primary.get(alias) for alias in expected]
+    assert [heat_cubes.cluster_names[c] if c >= 0 else None for c in clusters] == names
+
+
+@pytest.mark.parametrize("date_range", DATE_RANGES)
+@pytest.mark.parametrize("bins", [3, 100])
+def test_grid_sums_pair_totals(heat_cubes, heat_tables, date_range, bins):
+    order, clusters = heatmap.cluster_order(heat_cubes)
+    dense = dense_pairs(heat_tables, heat_cubes, date_range)[np.ix_(order, order)]
+    grid = heatmap.build_heatmap(heat_cubes, date_range, bins=bins)
+    assert grid.row_edges.tolist() == heatmap.bin_edges(len(ALIASES), bins).tolist()
+    assert np.allclose(grid.z, binned(dense, grid.row_edges, grid.col_edges))
+    # Every unordered pair is in two mirrored cells, a self pair only on the diagonal.
+    pairs = cooccurrence_reference(in_range(heat_tables["coocc"], date_range))
+    selves = pairs["first"] == pairs["second"]
+    assert grid.z.sum() == pytest.approx(2 * pairs["cooccurrence"][~selves].sum() + pairs["cooccurrence"][selves].sum())
+    if bins >= len(ALIASES):
+        assert np.array_equal(grid.z, grid.z.T)
+        assert grid.cell_size == (1, 1)
+
+    # Block labels: the bin holding each cluster's first alias, and the bin labels follow the edges.
+    names = heat_cubes.alias_names[order]
+    starts = np.flatnonzero(np.r_[True, clusters[1:] != clusters[:-1]] & (clusters >= 0))
+    expected = [(int(np.searchsorted(grid.row_edges, s, side="right") - 1), heat_cubes.cluster_names[clusters[s]]) for s in starts]
+    assert grid.row_blocks == grid.col_blocks == expected
+    for b, label in enumerate(grid.row_labels):
+        first, last = names[grid.row_edges[b]], names[grid.row_edges[b + 1] - 1]
+        assert label == (first if first == last else f"{first} … {last} ({grid.row_edges[b + 1] - grid.row_edges[b]})")
+
+
+def test_chosen_axes(heat_cubes, heat_tables):
+    date_range = DATE_RANGES[0]
+    dense = dense_pairs(heat_tables, heat_cubes, date_range)
+    rows = heat_cubes.alias_codes(["eta", "alpha", "beta"])
+    cols = heat_cubes.alias_codes(["zeta", "eta", "alpha", "gamma"])
+    grid = heatmap.build_heatmap(heat_cubes, date_range, rows=rows, cols=cols)
+    assert np.allclose(grid.z, dense[np.ix_(rows, cols)])
+    assert grid.row_blocks == grid.col_blocks == []
+    # Zooming keeps positions start..stop of each axis.
+    grid = heatmap.build_heatmap(heat_cubes, date_range, rows=rows, cols=cols, row_range=(1, 3), col_range=(0, 2))
+    assert np.allclose(grid.z, dense[np.ix_(rows[1:3], cols[0:2])])
+    assert grid.row_labels.tolist() == ["alpha", "beta"]
+
+
+def test_bin_edges():
+    assert heatmap.bin_edges(8, 3).tolist() == [0, 3, 5, 8]
+    assert heatmap.bin_edges(4, 10).tolist() == [0, 1, 2, 3, 4]
+    assert heatmap.bin_edges(0, 10).tolist() == [0]
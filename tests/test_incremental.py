@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import DATE_RANGES, rows, write_tables
+from tessella import queries
+from tessella.dataset import dataset_cache, load_dataset
+from tessella.incremental import append_delta
+
+CUT = pd.Timestamp("2020-07-01")
+
+
+@pytest.fixture(autouse=True)
+def fresh_dataset_cache():
+    # Versions are cached per source across tests; each test starts from the base.
+    dataset_cache().clear()
+
+
+def split(tables, cut=CUT):
+    """Base tables (memberships and the rows before ``cut``) and a delta of the monthly rows from ``cut`` on."""
+    base = {name: df[df["month"] < cut] if "month" in df else df for name, df in tables.items()}
+    delta = {name: df[df["month"] >= cut] for name, df in tables.items() if "month" in df}
+    return base, delta
+
+
+def assert_same_answers(cubes, expected):
+    for date_range in DATE_RANGES:
+        for page in (0, 1):
+            got = queries.occurrence_page(cubes, date_range, per_page=3, page=page)
+            want = queries.occurrence_page(expected, date_range, per_page=3, page=page)
+            assert got.labels == want.labels
+            assert rows(got.grouped, ["alias", "year", "occurrence"]) == rows(want.grouped, ["alias", "year", "occurrence"])
+            got = queries.cooccurrence_page(cubes, date_range, per_page=4, page=page)
+            want = queries.cooccurrence_page(expected, date_range, per_page=4, page=page)
+            assert got.labels == want.labels
+            assert rows(got.grouped, ["combo", "year", "cooccurrence"]) == rows(want.grouped, ["combo", "year", "cooccurrence"])
+        got = queries.country_by_year(cubes, date_range)
+        want = queries.country_by_year(expected, date_range)
+        assert rows(got, ["country", "year", "occurrence"]) == rows(want, ["country", "year", "occurrence"])
+
+
+@pytest.mark.parametrize("cubes_built", [True, False])
+def test_append_delta_matches_rebuild(tables, tmp_path, cubes_built):
+    base, delta = split(tables)
+    # A delta can bring names the base has never seen.
+    delta["occ"] = pd.concat([delta["occ"], pd.DataFrame({"alias": ["iota"], "month": [CUT], "occurrence": [7]})])
+    cache_dir = str(tmp_path / "cache")
+    dataset = load_dataset(None, write_tables(str(tmp_path / "base"), base), cache_dir)
+    if cubes_built:
+        dataset.cubes()
+    updated = append_delta(dataset, write_tables(str(tmp_path / "delta"), delta), cache_dir)
+    assert updated.version == dataset.version + 1
+
+    full = {name: pd.concat([base[name], delta[name]]) if name in delta else base[name] for name in base}
+    rebuilt = load_dataset(None, write_tables(str(tmp_path / "full"), full), str(tmp_path / "full-cache"))
+    for name in ("occ", "coocc", "country"):
+        for col, values in rebuilt.arrays[name].items():
+            assert np.array_equal(np.asarray(updated.arrays[name][col]), np.asarray(values)), (name, col)
+    assert_same_answers(updated.cubes(), rebuilt.cubes())
+
+
+def test_append_delta_rejects_overlapping_months(tables, tmp_path):
+    base, delta = split(tables)
+    delta["occ"] = pd.concat([delta["occ"], base["occ"].iloc[:1]])
+    cache_dir = str(tmp_path / "cache")
+    dataset = load_dataset(None, write_tables(str(tmp_path / "base"), base), cache_dir)
+    with pytest.raises(ValueError, match="already holds"):
+        append_delta(dataset, write_tables(str(tmp_path / "delta"), delta), cache_dir)
@@ -0,0 +1,90 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tessella import columnar, ingest
+
+# Line numbers as an editor shows them: the header is line 1.
+OCC_LINES = [
+    "alias,month,occurrence",
+    "alpha,2020-01-01,3",
+    "beta,2020-13-01,2",
+    "AI,2020-02-01,-1",
+    " AI,2020-01-01,4",
+    "gamma,2020-01-01,2.5",
+    ",2020-03-01,1",
+    "alpha,2020-02-01,5,extra",
+    "AI,2020-01-01,7",
+    "delta,,2",
+    "beta,2019-12-01,1",
+    "AI,soon,x",
+    "alpha,2020-01-01,3",
+    "zeta,2019-11-01, 6 ",
+    "beta,2020-01-01,2,x,y",
+    "AI,soon,1,extra",
+    "eta,2020-03-01,8",
+]
+VALID_LINES = [2, 5, 9, 11, 13, 14, 17]
+# Lines with too many fields, reported once whatever else is wrong with them.
+MALFORMED_LINES = [8, 15, 16]
+# ``(line, column, value, message)``; a row is reported for its first bad column only.
+INVALID = [
+    (3, "month", "2020-13-01", "not a date"),
+    (4, "occurrence", "-1", "not a non-negative integer"),
+    (6, "occurrence", "2.5", "not a non-negative integer"),
+    (7, "alias", "", "empty value"),
+    (10, "month", "", "not a date"),
+    (12, "month", "soon", "not a date"),
+]
+FACT_LINES = ["alias,cluster_name", "AI,ml", " AI,ml", "alpha,fuels"]
+
+
+def run_ingest(path, files):
+    def open_file(filename):
+        if filename not in files:
+            return None
+        data = ("\n".join(files[filename]) + "\n").encode()
+        return io.BytesIO(data), len(data)
+
+    return ingest.ingest(path, {name: f"{name}.csv" for name in ("occ", "fact_alias_cluster", "coocc")}, open_file)
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 3, 1000])
+def test_ingest_reports_and_writes(tmp_path, monkeypatch, chunk_rows):
+    monkeypatch.setattr(ingest, "CHUNK_ROWS", chunk_rows)
+    path = str(tmp_path / "dataset")
+    missing, empty, reports = run_ingest(path, {"occ.csv": OCC_LINES, "fact_alias_cluster.csv": FACT_LINES})
+    assert missing == ["coocc.csv"] and empty == []
+
+    report = reports["occ.csv"]
+    assert report.rows == len(OCC_LINES) - 1
+    assert report.invalid_rows == len(INVALID) + len(MALFORMED_LINES)
+    errors = sorted(report.errors)
+    assert [e for e in errors if e[0] not in MALFORMED_LINES] == INVALID
+    assert [e for e in errors if e[0] in MALFORMED_LINES] == [(n, "", "", "malformed line: more than 3 fields") for n in MALFORMED_LINES]
+
+    tables, arrays, vocabs, info = columnar.read_dataset(path)
+    assert info["validation"]["occ.csv"]["invalid_rows"] == report.invalid_rows
+    # The valid rows, as plain pandas reads them, in month then alias order.
+    expected = pd.read_csv(io.StringIO("\n".join(OCC_LINES[:1] + [OCC_LINES[n - 1] for n in VALID_LINES])), dtype={"alias": str})
+    expected["month"] = pd.to_datetime(expected["month"])
+    expected = expected.sort_values(["month", "alias"], kind="stable", ignore_index=True)
+    occ = tables["occ"]
+    assert occ["alias"].astype(str).tolist() == expected["alias"].tolist()
+    assert occ["month"].tolist() == expected["month"].tolist()
+    assert occ["occurrence"].tolist() == expected["occurrence"].tolist()
+    assert np.issubdtype(arrays["occ"]["occurrence"].dtype, np.signedinteger)
+
+    # Names are kept as written: " AI" and "AI" are different aliases.
+    assert {" AI", "AI"} <= set(vocabs["alias"])
+    assert tables["fact_alias_cluster"]["alias"].astype(str).tolist() == ["AI", " AI", "alpha"]
+
+
+def test_unreadable_file_is_reported(tmp_path):
+    path = str(tmp_path / "dataset")
+    missing, empty, reports = run_ingest(path, {"occ.csv": ["alias,when,occurrence", "alpha,2020-01-01,1"]})
+    assert "occ.csv" in missing
+    line, column, value, message = reports["occ.csv"].errors[0]
+    assert (line, column) == (1, "") and "month" in message
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import CLUSTERS, DATE_RANGES, cooccurrence_reference, in_range, rows
+from tessella import queries
+
+
+def by_year(df, label_col, value_col):
+    df = df.assign(year=pd.to_datetime(df["month"]).dt.year)
+    sums = df.groupby([label_col, "year"])[value_col].sum().reset_index()
+    return sums[sums[value_col] != 0]
+
+
+def ranked_reference(df, label_col, value_col, order, per_page, page, noun):
+    """``(labels bottom to top, grouped rows, n_total)`` of one page, computed with plain groupbys."""
+    shown = order[page * per_page:(page + 1) * per_page]
+    tail = order[(page + 1) * per_page:]
+    grouped = by_year(df[df[label_col].isin(shown)], label_col, value_col)
+    labels = shown[::-1]
+    if tail:
+        other = f"Other ({len(tail)} more {noun})"
+        grouped = pd.concat([grouped, by_year(df[df[label_col].isin(tail)].assign(**{label_col: other}), label_col, value_col)])
+        labels = [other] + labels
+    return labels, rows(grouped, [label_col, "year", value_col]), len(order)
+
+
+def ranking(totals):
+    totals = totals[totals != 0]
+    return sorted(totals.index, key=lambda label: (-totals[label], label))
+
+
+@pytest.mark.parametrize("date_range", DATE_RANGES)
+@pytest.mark.parametrize("per_page,page", [(3, 0), (3, 1), (50, 0)])
+def test_occurrence_page(cubes, tables, date_range, per_page, page):
+    occ = in_range(tables["occ"], date_range)
+    order = ranking(occ.groupby("alias")["occurrence"].sum())
+    ranked = queries.occurrence_page(cubes, date_range, per_page=per_page, page=page)
+    labels, grouped, n_total = ranked_reference(occ, "alias", "occurrence", order, per_page, page, "aliases")
+    assert ranked.labels == labels
+    assert rows(ranked.grouped, ["alias", "year", "occurrence"]) == grouped
+    assert ranked.n_total == n_total
+
+
+def test_occurrence_page_filters(cubes, tables):
+    date_range = DATE_RANGES[1]
+    aliases = ["alpha", "beta", "gamma", "theta"]
+    occ = in_range(tables["occ"], date_range)
+    # A cluster filter matches each alias's last listed cluster.
+    occ = occ[occ["alias"].isin(aliases) & (occ["alias"].map(CLUSTERS | {"beta": "storage"}) == "storage")]
+    order = ranking(occ.groupby("alias")["occurrence"].sum())
+    ranked = queries.occurrence_page(cubes, date_range, aliases, ["storage"], by_total=False)
+    assert ranked.labels == sorted(order)[::-1]
+    assert rows(ranked.grouped, ["alias", "year", "occurrence"]) == rows(by_year(occ, "alias", "occurrence"), ["alias", "year", "occurrence"])
+
+
+@pytest.mark.parametrize("date_range", DATE_RANGES)
+@pytest.mark.parametrize("per_page,page", [(4, 0), (4, 2), (100, 0)])
+def test_cooccurrence_page(cubes, tables, date_range, per_page, page):
+    pairs = cooccurrence_reference(in_range(tables["coocc"], date_range))
+    pairs["combo"] = pairs["first"] + " & " + pairs["second"]
+    totals = pairs.groupby(["first", "second"])["cooccurrence"].sum()
+    totals = totals[totals != 0]
+    order = [f"{a} & {b}" for a, b in sorted(totals.index, key=lambda pair: (-totals[pair], pair))]
+    ranked = queries.cooccurrence_page(cubes, date_range, per_page=per_page, page=page)
+    labels, grouped, n_total = ranked_reference(pairs, "combo", "cooccurrence", order, per_page, page, "combos")
+    assert ranked.labels == labels
+    assert rows(ranked.grouped, ["combo", "year", "cooccurrence"]) == grouped
+    assert ranked.n_total == n_total
+
+
+def test_cooccurrence_page_alias_filter(cubes, tables):
+    date_range = DATE_RANGES[0]
+    pairs = cooccurrence_reference(in_range(tables["coocc"], date_range))
+    pairs = pairs[(pairs["first"] == "eta") | (pairs["second"] == "eta")]
+    # The filtered alias comes first in the label.
+    partner = np.where(pairs["first"] == "eta", pairs["second"], pairs["first"])
+    pairs = pairs.assign(combo="eta & " + pd.Series(partner, index=pairs.index))
+    ranked = queries.cooccurrence_page(cubes, date_range, ["eta"], per_page=100)
+    assert sorted(ranked.labels) == sorted(set(pairs["combo"]))
+    assert rows(ranked.grouped, ["combo", "year", "cooccurrence"]) == rows(by_year(pairs, "combo", "cooccurrence"), ["combo", "year", "cooccurrence"])
+
+
+@pytest.mark.parametrize("date_range", DATE_RANGES)
+@pytest.mark.parametrize("countries", [[], ["France", "Japan"]])
+def test_country_by_year(cubes, tables, date_range, countries):
+    country = in_range(tables["country"], date_range)
+    if countries:
+        country = country[country["country"].isin(countries)]
+    expected = by_year(country, "country", "occurrence")
+    agg = queries.country_by_year(cubes, date_range, countries)
+    assert rows(agg, ["country", "year", "occurrence"]) == rows(expected, ["country", "year", "occurrence"])
+    assert agg["year"].is_monotonic_increasing
+    assert agg["occurrence"].dtype == np.int64
+    assert set(agg.loc[agg["country"] == "France", "iso_alpha"]) <= {"FRA"}
@@ -0,0 +1,78 @@
+import pytest
+
+from conftest import DATE_RANGES, in_range
+from tessella import sankey
+
+
+def links(graph):
+    return sorted(zip(graph.labels[graph.source].tolist(), graph.labels[graph.target].tolist(), graph.value.tolist()))
+
+
+def country_cluster_reference(tables, date_range, countries, clusters):
+    """Country -> cluster weights; an alias in several clusters counts towards each."""
+    rows = in_range(tables["country"], date_range).merge(tables["fact_alias_cluster"].drop_duplicates(), on="alias")
+    rows = rows[rows["country"].isin(countries) & rows["cluster_name"].isin(clusters)]
+    weights = rows.groupby(["country", "cluster_name"])["occurrence"].sum().reset_index()
+    return weights[weights["occurrence"] > 0]
+
+
+def cluster_alias_reference(tables, date_range, countries, clusters):
+    """Cluster -> alias weights: each alias's occurrence in the selected countries, under each of its selected clusters."""
+    rows = in_range(tables["country"], date_range)
+    totals = rows[rows["country"].isin(countries)].groupby("alias")["occurrence"].sum().reset_index()
+    members = tables["fact_alias_cluster"].drop_duplicates()
+    weights = members[members["cluster_name"].isin(clusters)].merge(totals, on="alias")
+    return weights[weights["occurrence"] > 0]
+
+
+def as_links(df, source, target):
+    return sorted(zip(df[source], df[target], df["occurrence"].astype(int)))
+
+
+COUNTRIES = ["France", "Germany", "Japan"]
+CLUSTERS = ["fuels", "storage", "grid"]
+
+
+@pytest.mark.parametrize("date_range", DATE_RANGES)
+def test_country_cluster_links(cubes, tables, date_range):
+    graph = sankey.build_sankey(cubes, date_range, COUNTRIES, CLUSTERS)
+    expected = country_cluster_reference(tables, date_range, COUNTRIES, CLUSTERS)
+    assert links(graph) == as_links(expected, "country", "cluster_name")
+    assert graph.n_pruned == 0
+
+
+@pytest.mark.parametrize("date_range", DATE_RANGES)
+def test_alias_level(cubes, tables, date_range):
+    graph = sankey.build_sankey(cubes, date_range, COUNTRIES, ["fuels", "storage"], with_aliases=True)
+    expected = sorted(
+        as_links(country_cluster_reference(tables, date_range, COUNTRIES, ["fuels", "storage"]), "country", "cluster_name")
+        + as_links(cluster_alias_reference(tables, date_range, COUNTRIES, ["fuels", "storage"]), "cluster_name", "alias")
+    )
+    assert links(graph) == expected
+
+
+def test_min_weight_prunes_level_by_level(cubes, tables):
+    date_range = DATE_RANGES[0]
+    upper = country_cluster_reference(tables, date_range, COUNTRIES, CLUSTERS)
+    lower = cluster_alias_reference(tables, date_range, COUNTRIES, CLUSTERS)
+    # Heavy enough to cut every inflow of all clusters but one, while some of their alias links are heavier.
+    inflow = upper.groupby("cluster_name")["occurrence"].max()
+    min_weight = int(inflow.sort_values().iloc[-2]) + 1
+    starved = lower[lower["cluster_name"].isin(inflow.index[inflow < min_weight])]
+    assert (starved["occurrence"] >= min_weight).any()
+    kept_upper = upper[upper["occurrence"] >= min_weight]
+    kept_lower = lower[(lower["occurrence"] >= min_weight) & lower["cluster_name"].isin(kept_upper["cluster_name"])]
+    graph = sankey.build_sankey(cubes, date_range, COUNTRIES, CLUSTERS, with_aliases=True, min_weight=min_weight)
+    assert links(graph) == sorted(as_links(kept_upper, "country", "cluster_name") + as_links(kept_lower, "cluster_name", "alias"))
+    assert graph.n_pruned == len(upper) + len(lower) - len(kept_upper) - len(kept_lower)
+
+
+def test_top_k(cubes, tables):
+    date_range = DATE_RANGES[1]
+    upper = country_cluster_reference(tables, date_range, COUNTRIES, CLUSTERS)
+    # Heaviest first within each country, ties in cluster order.
+    upper = upper.sort_values(["country", "occurrence", "cluster_name"], ascending=[True, False, True])
+    kept = upper[upper.groupby("country").cumcount() < 2]
+    graph = sankey.build_sankey(cubes, date_range, COUNTRIES, CLUSTERS, top_k=2)
+    assert links(graph) == as_links(kept, "country", "cluster_name")
+    assert graph.n_pruned == len(upper) - len(kept)
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from tessella.search import CodeSet, NameIndex, member_mask, selection_mask
+
+NAMES = sorted([
+    "AI", "Biofuel", "Biogas upgrading", "Fuel cell", "Hydrogen", "Hydrogen fuel cell",
+    "Solid oxide fuel cell", "Upgrading", "Zeolite", "hydrothermal liquefaction", "Électrolyse",
+])
+
+
+def names(index, codes):
+    return index.names[codes].tolist()
+
+
+@pytest.fixture(scope="module")
+def index():
+    return NameIndex(NAMES)
+
+
+@pytest.mark.parametrize("query,expected", [
+    # Names starting with the query first, then the other matches in code order.
+    ("hydro", ["Hydrogen", "Hydrogen fuel cell", "hydrothermal liquefaction"]),
+    ("fuel", ["Fuel cell", "Hydrogen fuel cell", "Solid oxide fuel cell"]),
+    ("cell fu", ["Fuel cell", "Hydrogen fuel cell", "Solid oxide fuel cell"]),
+    ("hydro cell", ["Hydrogen fuel cell"]),
+    ("BIO", ["Biofuel", "Biogas upgrading"]),
+    ("électro", ["Électrolyse"]),
+    ("ai", ["AI"]),
+    ("oxide  fuel ", ["Solid oxide fuel cell"]),
+    ("cellx", []),
+    ("hydro nope", []),
+])
+def test_search(index, query, expected):
+    assert names(index, index.search(query)) == expected
+
+
+def test_prefix_starts_first(index):
+    # "Upgrading" starts with the query, so it comes before "Biogas upgrading" although its code is higher.
+    assert names(index, index.search("upgr")) == ["Upgrading", "Biogas upgrading"]
+    # A word that sorts last among the vocabulary's words still matches (the range end uses a sentinel).
+    assert names(index, index.search("élec")) == ["Électrolyse"]
+
+
+def test_empty_query_matches_everything(index):
+    assert np.array_equal(index.search(""), np.arange(len(NAMES)))
+    assert np.array_equal(index.search("  "), np.arange(len(NAMES)))
+
+
+def test_within(index):
+    within = np.zeros(len(NAMES), dtype=bool)
+    within[[NAMES.index("Hydrogen fuel cell"), NAMES.index("Zeolite")]] = True
+    assert names(index, index.search("hydro", within)) == ["Hydrogen fuel cell"]
+    assert names(index, index.search("", within)) == ["Hydrogen fuel cell", "Zeolite"]
+
+
+def test_empty_vocabulary():
+    index = NameIndex([])
+    assert len(index.search("a")) == 0
+    assert len(index.search("")) == 0
+
+
+def test_code_set_masks():
+    assert CodeSet([3, 1, 3]).mask(5).tolist() == [False, True, False, True, False]
+    assert CodeSet([3, 1], exclude=True).mask(5).tolist() == [True, False, True, False, True]
+    # Codes past the vocabulary are ignored.
+    assert CodeSet([1, 9]).mask(3).tolist() == [False, True, False]
+    assert CodeSet.everything().mask(3).all()
+    assert not CodeSet().mask(3).any()
+    assert CodeSet([2, 1]).key() == ("only", [1, 2])
+    assert CodeSet([2], exclude=True).key() == ("except", [2])
+
+
+@pytest.mark.parametrize("exclude", [False, True])
+def test_picking_nothing_selects_everything(exclude):
+    # "Only" or "All except" with no name picked does not filter.
+    assert CodeSet.picked([], exclude=exclude).is_everything
+    picked = CodeSet.picked(np.array([4, 2]), exclude=exclude)
+    assert not picked.is_everything
+    assert (picked.codes.tolist(), picked.exclude) == ([2, 4], exclude)
+
+
+def test_selection_mask():
+    to_codes = {"a": 0, "c": 2}.__getitem__
+    assert selection_mask(3, CodeSet.everything(), None) is None
+    assert selection_mask(3, [], to_codes) is None
+    assert selection_mask(3, CodeSet([1], exclude=True), None).tolist() == [True, False, True]
+    assert selection_mask(3, ["a", "c"], lambda names: [to_codes(n) for n in names]).tolist() == [True, False, True]
+
+
+def test_member_mask():
+    selected = np.array([True, False, True])
+    assert member_mask(selected, [2, -1, 1, 0]).tolist() == [True, False, False, True]
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import DATE_RANGES
+from tessella import trends
+
+
+def test_metrics_by_hand():
+    counts = [
+        [0, 1, 3, 7],  # log(1 + count) doubles every bucket
+        [5, 5, 5, 5],  # flat
+        [0, 0, 0, 9],  # new: nothing in the baseline
+        [4, 0, 2, 2],
+    ]
+    growth, ratio, burst = trends.metrics(counts, recent_buckets=2)
+    # Slope of log(1 + count) over the centred bucket times -1.5, -0.5, 0.5, 1.5.
+    assert growth == pytest.approx([1.0, 0.0, np.expm1(1.5 * np.log(10) / 5), np.expm1((2 * np.log(3) - 1.5 * np.log(5)) / 5)])
+    # (mean of the last two + 1) / (mean of the first two + 1)
+    assert ratio == pytest.approx([6 / 1.5, 1.0, 5.5 / 1.0, 3 / 3])
+    # Largest recent excess over the baseline mean, in sqrt(mean + 1) units.
+    assert burst == pytest.approx([6.5 / np.sqrt(1.5), 0.0, 9.0, 0.0])
+
+
+def test_metrics_short_series():
+    # Two buckets: only the last is recent, whatever ``recent_buckets`` asks for.
+    growth, ratio, burst = trends.metrics([[2, 5]], recent_buckets=3)
+    assert growth == pytest.approx([np.expm1(np.log(6 / 3))])
+    assert ratio == pytest.approx([6 / 3])
+    assert burst == pytest.approx([3 / np.sqrt(3)])
+    # One bucket: no trend at all.
+    growth, ratio, burst = trends.metrics([[7], [0]])
+    assert growth.tolist() == [0, 0] and ratio.tolist() == [1, 1] and burst.tolist() == [0, 0]
+    growth, ratio, burst = trends.metrics(np.zeros((0, 4)))
+    assert len(growth) == len(ratio) == len(burst) == 0
+
+
+def test_bucket_edges():
+    # Whole buckets counted back from the end; the partial first one is dropped.
+    assert trends.bucket_edges(0, 30, 12).tolist() == [6, 18, 30]
+    assert trends.bucket_edges(5, 17, 12).tolist() == [5, 17]
+    # Shorter than one bucket: a single bucket over what there is.
+    assert trends.bucket_edges(3, 10, 12).tolist() == [3, 10]
+
+
+@pytest.mark.parametrize("date_range", [None] + DATE_RANGES)
+def test_alias_trends_match_bucketed_counts(cubes, tables, date_range):
+    lo, hi = cubes.axis.span(date_range)
+    edges = trends.bucket_edges(lo, hi)
+    occ = tables["occ"]
+    months = pd.to_datetime(occ["month"])
+    index = (months.dt.year - 1970) * 12 + months.dt.month - 1 - cubes.axis.first
+    counts = np.zeros((len(cubes.alias_names), len(edges) - 1))
+    bucket = np.searchsorted(edges, index, side="right") - 1
+    inside = (index >= edges[0]) & (index < edges[-1])
+    np.add.at(counts, (cubes.alias_codes(occ["alias"][inside]), bucket[inside]), occ["occurrence"][inside])
+
+    got = trends.compute(cubes.occ, cubes.occ.n_entities, lo, hi)
+    growth, ratio, burst = trends.metrics(counts)
+    assert got.n_buckets == len(edges) - 1
+    assert got.growth == pytest.approx(growth)
+    assert got.ratio == pytest.approx(ratio)
+    assert got.burst == pytest.approx(burst)
+
+
+@pytest.mark.parametrize("kind", ["alias", "cluster", "pair", "cluster_pair"])
+def test_chunks_match_one_pass(cubes, monkeypatch, kind):
+    cube, n_entities = trends._KINDS[kind](cubes)
+    lo, hi = cubes.axis.span(None)
+    whole = trends.compute(cube, n_entities, lo, hi, bucket_months=6)
+    assert n_entities > 2
+    monkeypatch.setattr(trends, "TREND_CHUNK", 2)
+    chunked = trends.compute(cube, n_entities, lo, hi, bucket_months=6)
+    for name in trends.METRICS:
+        # Equal up to rounding: the matrix product may sum in a different order per chunk.
+        assert chunked.metric(name) == pytest.approx(whole.metric(name), rel=1e-12, abs=1e-12), name